@@ -1,10 +1,18 @@
-from flask import Flask, render_template, request, jsonify, send_file
+from flask import Flask, render_template, request, jsonify, send_file, url_for, g, Response
 import os
+import time
 import tempfile
+import http.client
+from urllib.parse import quote
 from werkzeug.utils import secure_filename
 import PyPDF2
-from src.document_manager import DocumentManager
-from src.image_manager import ImageManager
+from src.services import services
+from src.embedding import EmbeddingModels
+from src.pdf_parser import ParsedDocument
+from src.job_queue import IngestJobQueue, QueueFullError
+from src.thumbnails import ThumbnailCache
+from src.uploads import stream_upload, UploadRejected, PDF_MAGIC
+from src.metrics import metrics
 
 # 获取当前文件所在目录的绝对路径
 current_dir = os.path.dirname(os.path.abspath(__file__))
@@ -41,12 +49,27 @@ app = Flask(__name__,
 
 # 重要：增加文件上传大小限制
 app.config['SECRET_KEY'] = 'your-secret-key-here'
-app.config['UPLOAD_FOLDER'] = tempfile.gettempdir()
+app.config['UPLOAD_FOLDER'] = tempfile.gettempdir()  # 仅校验、不入库的上传暂存目录
 
 # 大幅增加文件大小限制
 app.config['MAX_CONTENT_LENGTH'] = 500 * 1024 * 1024  # 500MB 总请求大小限制
 app.config['MAX_FILE_UPLOAD_SIZE'] = 100 * 1024 * 1024  # 单个文件最大100MB
 app.config['MAX_BATCH_FILES'] = 20  # 批量上传最多文件数
+app.config['MAX_BATCH_IMAGES'] = 200  # 批量上传图像最多文件数
+app.config['IMAGE_UPLOAD_SUBDIR'] = 'uploads'  # 上传的图像保存到图像目录下的该子目录
+app.config['INGEST_WORKERS'] = min(4, os.cpu_count() or 1)  # 批量解析PDF的进程数
+app.config['JOB_WORKERS'] = 1  # 后台入库任务的工作线程数
+app.config['MAX_QUEUED_JOBS'] = 20  # 排队任务上限（超过时返回503）
+app.config['JOBS_FOLDER'] = './data/jobs'  # 任务状态与上传暂存目录（重启后恢复）
+app.config['MAX_BATCH_QUERIES'] = 256  # 批量搜索单次请求最多查询数
+app.config['IMAGE_CACHE_MAX_AGE'] = 365 * 24 * 3600  # 带版本参数的图片/缩略图地址的浏览器缓存时长（秒）
+app.config['LIBRARY_SYNC_INTERVAL'] = 0  # 论文目录轮询同步间隔（秒），0表示不监视（可用 python main.py sync 手动同步）
+# 多进程服务（python main.py serve，见 src/server.py）由服务进程设置以下配置
+app.config['SERVER_ROLE'] = 'single'  # single（单进程）/ reader（只读，写入请求转发给写入进程）/ writer（唯一写入索引的进程）
+app.config['WRITER_ADDRESS'] = None  # 写入进程的 (主机, 端口)
+app.config['WRITER_TIMEOUT'] = 600  # 转发写入请求的超时时间（秒，同步入库接口需等待解析与嵌入完成）
+app.config['READINESS'] = None  # 全部子进程的就绪状态（ReadinessBoard）
+app.config['METRICS_DIR'] = None  # 多进程指标汇总目录（MetricsDirectory），设置时 /metrics 输出所有进程的合计
 
 # 允许的文件扩展名
 ALLOWED_EXTENSIONS = {
@@ -61,53 +84,73 @@ def allowed_file(filename, file_type='pdf'):
            filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS.get(file_type, set())
 
 
-def validate_pdf_file(file_path):
-    """验证PDF文件是否完整有效"""
+def save_pdf_upload(file, dest_dir):
+    """流式保存上传的PDF（同时检查大小上限与文件头、计算SHA-256），返回 (暂存路径, 文件大小, 内容哈希)；不合格时抛出UploadRejected"""
+    return stream_upload(file.stream, dest_dir, suffix='.pdf', max_size=app.config['MAX_FILE_UPLOAD_SIZE'],
+                         min_size=100, magic=PDF_MAGIC)
+
+
+def upload_pdf_name(filename):
+    """上传文件在库中的基础文件名（secure_filename会去掉中文等字符，此时使用默认名）"""
+    file_base, file_ext = os.path.splitext(secure_filename(filename))
+    return f"{file_base if file_ext else 'paper'}.pdf"
+
+
+def validate_pdf_file(file_path, parsed=None):
+    """验证PDF文件是否完整有效，返回 (是否有效, 信息, 解析结果)；解析结果供后续分类与索引复用"""
     try:
         # 检查文件是否存在且有内容
         if not os.path.exists(file_path):
-            return False, "文件不存在"
+            return False, "文件不存在", None
 
         file_size = os.path.getsize(file_path)
         if file_size == 0:
-            return False, "文件为空"
+            return False, "文件为空", None
 
         if file_size < 100:  # PDF文件通常至少有100字节
-            return False, "文件大小异常"
+            return False, "文件大小异常", None
 
         # 检查文件扩展名
         if not file_path.lower().endswith('.pdf'):
-            return False, "文件扩展名不是PDF"
+            return False, "文件扩展名不是PDF", None
 
         # 检查文件头部是否为PDF
         with open(file_path, 'rb') as f:
             header = f.read(5)
-            if header != b'%PDF-':
-                return False, "文件头部不是PDF格式"
+            if header != PDF_MAGIC:
+                return False, "文件头部不是PDF格式", None
+
+        return validate_pdf_content(file_path, parsed)
+
+    except Exception as e:
+        return False, f"文件验证失败: {str(e)}", None
+
 
-        # 尝试打开PDF文件
+def validate_pdf_content(file_path, parsed=None, content_hash=None):
+    """解析并检查PDF页面与文本（流式上传时大小与文件头已在接收阶段检查），返回值同validate_pdf_file"""
+    try:
+        # 尝试解析PDF文件（只解析一次，结果在分类与索引阶段复用；已解析时直接使用）
         try:
-            with open(file_path, 'rb') as f:
-                pdf_reader = PyPDF2.PdfReader(f)
-                num_pages = len(pdf_reader.pages)
-                if num_pages == 0:
-                    return False, "PDF文件无有效页面"
+            if parsed is None:
+                parsed = ParsedDocument.from_file(file_path, content_hash)
+            num_pages = parsed.page_count
+            if num_pages == 0:
+                return False, "PDF文件无有效页面", None
 
-                # 尝试读取第一页
-                first_page = pdf_reader.pages[0]
-                text = first_page.extract_text()
-                if not text or len(text.strip()) < 10:
-                    return False, "PDF文件无有效文本内容"
+            # 尝试读取第一页
+            text = parsed.page_text(1)
+            if not text or len(text.strip()) < 10:
+                return False, "PDF文件无有效文本内容", None
 
-                return True, f"PDF文件有效，共{num_pages}页"
+            return True, f"PDF文件有效，共{num_pages}页", parsed
 
         except PyPDF2.errors.PdfReadError as pdf_error:
-            return False, f"PDF文件损坏: {str(pdf_error)}"
+            return False, f"PDF文件损坏: {str(pdf_error)}", None
         except Exception as pdf_error:
-            return False, f"读取PDF失败: {str(pdf_error)}"
+            return False, f"读取PDF失败: {str(pdf_error)}", None
 
     except Exception as e:
-        return False, f"文件验证失败: {str(e)}"
+        return False, f"文件验证失败: {str(e)}", None
 
 
 def validate_upload_files(files):
@@ -136,6 +179,88 @@ def validate_upload_files(files):
     return True, "文件验证通过"
 
 
+# 后台入库任务队列（批量上传接口立即返回任务ID，由后台线程处理）
+job_queue = IngestJobQueue(
+    doc_manager_factory=lambda: services.document_manager,
+    validator=validate_pdf_file,
+    jobs_dir=app.config['JOBS_FOLDER'],
+    max_queue_size=app.config['MAX_QUEUED_JOBS'],
+    workers=app.config['JOB_WORKERS'],
+    parse_workers=app.config['INGEST_WORKERS']
+)
+
+
+# 写入索引或读取任务队列的接口：多进程服务中由只读进程转发给唯一的写入进程
+WRITER_ENDPOINTS = {'api_add_paper', 'api_batch_add_papers', 'api_add_images', 'api_get_job', 'api_list_jobs'}
+# 转发写入进程的响应时不复制的头：逐跳头，以及由本进程重新生成的长度/服务器/日期头
+PROXY_SKIP_HEADERS = {'connection', 'keep-alive', 'proxy-authenticate', 'proxy-authorization', 'te', 'trailer',
+                      'trailers', 'transfer-encoding', 'upgrade', 'content-length', 'server', 'date'}
+
+
+def start_background_tasks():
+    """启动后台任务队列与论文目录监视（只在负责写入的进程中运行）"""
+    job_queue.start()
+    if app.config['LIBRARY_SYNC_INTERVAL'] > 0:
+        services.library_sync.start_watcher(app.config['LIBRARY_SYNC_INTERVAL'],
+                                            workers=app.config['INGEST_WORKERS'])
+
+
+@app.before_request
+def start_job_queue():
+    """首个请求到来时启动后台任务队列（避免开发服务器的重载监控进程也处理任务；只读进程不启动）"""
+    if app.config['SERVER_ROLE'] != 'reader':
+        start_background_tasks()
+
+
+@app.before_request
+def start_request_timer():
+    """记录请求开始时间（按路由统计耗时）"""
+    g.request_start = time.perf_counter()
+
+
+@app.before_request
+def route_to_writer():
+    """只读进程：写入类请求转发给写入进程；其余请求处理前检查索引是否已被写入进程更新"""
+    if app.config['SERVER_ROLE'] != 'reader':
+        return None
+    if request.endpoint not in WRITER_ENDPOINTS:
+        services.refresh_if_stale()
+        return None
+    return forward_to_writer()
+
+
+def forward_to_writer():
+    """将当前请求（流式转发请求体）发送给写入进程并返回其响应"""
+    host, port = app.config['WRITER_ADDRESS']
+    path = quote(request.path) + (f"?{request.query_string.decode('latin-1')}" if request.query_string else '')
+    headers = {key: value for key, value in request.headers.items()
+               if key.lower() in ('content-type', 'content-length', 'accept')}
+    body = request.stream if request.content_length else request.get_data()
+    connection = http.client.HTTPConnection(host, port, timeout=app.config['WRITER_TIMEOUT'])
+    try:
+        connection.request(request.method, path, body=body, headers=headers)
+        upstream = connection.getresponse()
+        data = upstream.read()
+    except OSError as e:
+        metrics.inc('errors_total', stage='writer_proxy')
+        return jsonify({'success': False, 'message': f'写入服务暂不可用，请稍后重试：{e}'}), 503
+    finally:
+        connection.close()
+    headers = [(key, value) for key, value in upstream.getheaders() if key.lower() not in PROXY_SKIP_HEADERS]
+    return Response(data, status=upstream.status, headers=headers)
+
+
+@app.after_request
+def record_request_metrics(response):
+    """按路由模板（而非具体URL）记录请求耗时与状态码，避免标签数量随参数膨胀"""
+    start = g.get('request_start')
+    if start is not None:
+        route = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+        metrics.observe('http_request_seconds', time.perf_counter() - start, route=route, method=request.method)
+        metrics.inc('http_requests_total', route=route, method=request.method, status=response.status_code)
+    return response
+
+
 @app.errorhandler(413)
 def too_large(e):
     """处理文件过大的错误"""
@@ -170,33 +295,32 @@ def api_add_paper():
         if not allowed_file(file.filename, 'pdf'):
             return jsonify({'success': False, 'message': '只支持PDF文件'})
 
-        # 保存临时文件
-        filename = secure_filename(file.filename)
-        temp_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-        file.save(temp_path)
-
-        # 检查文件大小
-        file_size = os.path.getsize(temp_path)
-        if file_size > app.config['MAX_FILE_UPLOAD_SIZE']:
-            os.unlink(temp_path)
-            max_size_mb = app.config['MAX_FILE_UPLOAD_SIZE'] // (1024 * 1024)
-            return jsonify({'success': False, 'message': f'文件太大，不能超过{max_size_mb}MB'})
-
-        # 验证PDF文件
-        is_valid, message = validate_pdf_file(temp_path)
-        if not is_valid:
-            try:
-                os.unlink(temp_path)
-            except:
-                pass
-            return jsonify({'success': False, 'message': f'文件验证失败: {message}'})
+        # 流式保存到论文目录下的暂存目录（边接收边检查大小与文件头、计算内容哈希），入库时原子改名移入
+        doc_manager = services.document_manager
+        try:
+            temp_path, _, content_hash = save_pdf_upload(file, doc_manager.incoming_dir)
+        except UploadRejected as e:
+            return jsonify({'success': False, 'message': f'文件验证失败: {e}'})
+
+        # 验证PDF文件（内容相同的论文已在库中时无需校验与解析）
+        parsed = None
+        if doc_manager.find_existing(content_hash) is None:
+            is_valid, message, parsed = validate_pdf_content(temp_path, content_hash=content_hash)
+            if not is_valid:
+                try:
+                    os.unlink(temp_path)
+                except:
+                    pass
+                return jsonify({'success': False, 'message': f'文件验证失败: {message}'})
 
         # 处理论文
         try:
-            doc_manager = DocumentManager()
             topics_list = [t.strip() for t in topics.split(',')]
-            result = doc_manager.add_paper(temp_path, topics_list)
+            tag = request.form.get('tag', '').strip() or None  # 可选标签（重复上传时只为已有论文添加标签）
+            result = doc_manager.add_paper(temp_path, topics_list, parsed=parsed, content_hash=content_hash, tag=tag,
+                                           file_name=upload_pdf_name(file.filename), move=True)
 
+            # 已在库中或处理失败时暂存文件未被移走
             try:
                 os.unlink(temp_path)
             except:
@@ -217,7 +341,7 @@ def api_add_paper():
 
 @app.route('/api/batch_add_papers', methods=['POST'])
 def api_batch_add_papers():
-    """批量添加论文API接口 - 优化版本"""
+    """批量添加论文API接口 - 提交后台任务，立即返回任务ID"""
     try:
         if 'files' not in request.files:
             return jsonify({'success': False, 'message': '没有选择文件'})
@@ -233,74 +357,117 @@ def api_batch_add_papers():
         if not topics:
             return jsonify({'success': False, 'message': '请指定分类主题'})
 
-        # 处理每个文件
-        doc_manager = DocumentManager()
+        # 队列已满时直接拒绝，避免无谓地接收上传文件
+        if job_queue.queue_size() >= app.config['MAX_QUEUED_JOBS']:
+            return jsonify({'success': False, 'message': '任务队列已满，请稍后重试'}), 503
+
+        # 上传文件保存到任务暂存目录并检查大小，解析、嵌入与写入交给后台任务执行
         topics_list = [t.strip() for t in topics.split(',')]
-        results = []
-        processed_count = 0
+        job_id = job_queue.new_job_id()
+        files_dir = job_queue.files_dir(job_id)
+        accepted = []  # [(原始文件名, 暂存路径, 内容哈希), ...]
+        skipped = []
 
         for file in files:
-            if processed_count >= app.config['MAX_BATCH_FILES']:
-                results.append({'file': file.filename, 'result': '跳过：达到批量处理上限'})
+            if len(accepted) >= app.config['MAX_BATCH_FILES']:
+                skipped.append({'file': file.filename, 'result': '跳过：达到批量处理上限'})
                 continue
 
             try:
-                filename = secure_filename(file.filename)
-                temp_path = os.path.join(app.config['UPLOAD_FOLDER'], f"{filename}")
-                file.save(temp_path)
-
-                # 检查文件大小
-                file_size = os.path.getsize(temp_path)
-                if file_size > app.config['MAX_FILE_UPLOAD_SIZE']:
-                    results.append({'file': filename, 'result': f'文件太大（{file_size // 1024}KB），超过限制'})
-                    try:
-                        os.unlink(temp_path)
-                    except:
-                        pass
-                    continue
-
-                # 验证PDF文件
-                is_valid, message = validate_pdf_file(temp_path)
-                if not is_valid:
-                    results.append({'file': filename, 'result': f'文件验证失败: {message}'})
-                    try:
-                        os.unlink(temp_path)
-                    except:
-                        pass
-                    continue
-
-                # 处理文件
-                try:
-                    result = doc_manager.add_paper(temp_path, topics_list)
-                    results.append({'file': filename, 'result': result})
-                    processed_count += 1
-                except Exception as e:
-                    results.append({'file': filename, 'result': f'处理失败: {str(e)}'})
-
-                # 清理临时文件
-                try:
-                    os.unlink(temp_path)
-                except:
-                    pass
+                # 暂存文件名唯一（mkstemp），同名文件互不覆盖；入库时使用原始文件名
+                temp_path, _, content_hash = save_pdf_upload(file, files_dir)
+                accepted.append((upload_pdf_name(file.filename), temp_path, content_hash))
 
+            except UploadRejected as e:
+                skipped.append({'file': file.filename, 'result': f'文件验证失败: {e}'})
             except Exception as e:
-                results.append({'file': file.filename, 'result': f'上传失败: {str(e)}'})
-                try:
-                    os.unlink(temp_path)
-                except:
-                    pass
+                skipped.append({'file': file.filename, 'result': f'上传失败: {str(e)}'})
+
+        try:
+            job_queue.submit(job_id, accepted, topics_list, skipped=skipped,
+                             tag=request.form.get('tag', '').strip() or None)
+        except QueueFullError as e:
+            job_queue.discard(job_id)
+            return jsonify({'success': False, 'message': f'{str(e)}，请稍后重试'}), 503
 
-        success_count = len([r for r in results if '失败' not in r['result'] and '跳过' not in r['result']])
         return jsonify({
             'success': True,
-            'message': f'批量处理完成：成功{success_count}个，失败{len(results) - success_count}个',
-            'details': results
-        })
+            'job_id': job_id,
+            'message': f'已提交后台处理：共{len(accepted)}个文件，排队任务{job_queue.queue_size()}个'
+        }), 202
 
     except Exception as e:
         return jsonify({'success': False, 'message': f'批量处理失败: {str(e)}'})
 
 
+@app.route('/api/add_images', methods=['POST'])
+def api_add_images():
+    """批量上传图像API接口：保存到图像目录后批量解码与编码入库"""
+    try:
+        files = request.files.getlist('files')
+        if not files:
+            return jsonify({'success': False, 'message': '没有选择文件'})
+        if len(files) > app.config['MAX_BATCH_IMAGES']:
+            return jsonify({'success': False, 'message': f'一次最多上传 {app.config["MAX_BATCH_IMAGES"]} 张图像'})
+
+        img_manager = services.image_manager
+        upload_dir = os.path.join(img_manager.image_root, app.config['IMAGE_UPLOAD_SUBDIR'])
+        os.makedirs(upload_dir, exist_ok=True)
+        saved = []  # [(原始文件名, 保存路径), ...]
+        details = []
+
+        for file in files:
+            if not allowed_file(file.filename, 'image'):
+                details.append({'file': file.filename, 'result': '跳过：不支持的图像格式'})
+                continue
+            try:
+                # 唯一文件名直接写入图像目录（secure_filename会去掉中文等字符，此时只保留后缀）
+                file_base, file_ext = os.path.splitext(secure_filename(file.filename))
+                if not file_ext:
+                    file_base, file_ext = '', '.' + file.filename.rsplit('.', 1)[1].lower()
+                save_path, _, _ = stream_upload(file.stream, upload_dir, suffix=file_ext, prefix=f"{file_base or 'image'}_",
+                                                max_size=app.config['MAX_FILE_UPLOAD_SIZE'])
+                saved.append((file.filename, save_path))
+            except UploadRejected as e:
+                details.append({'file': file.filename, 'result': f'跳过：{e}'})
+            except Exception as e:
+                details.append({'file': file.filename, 'result': f'上传失败: {str(e)}'})
+
+        results = dict(img_manager.add_images([save_path for _, save_path in saved]))
+        success_count = 0
+        for file_name, save_path in saved:
+            result = results[save_path]
+            if result.startswith('错误'):
+                os.unlink(save_path)  # 无法解码的文件不保留在图像目录
+            else:
+                success_count += 1
+            details.append({'file': file_name, 'result': result})
+
+        return jsonify({
+            'success': success_count > 0,
+            'message': f'图像上传完成：成功{success_count}张，失败{len(files) - success_count}张',
+            'details': details
+        })
+
+    except Exception as e:
+        return jsonify({'success': False, 'message': f'图像上传失败: {str(e)}'})
+
+
+@app.route('/api/jobs/<job_id>')
+def api_get_job(job_id):
+    """查询后台入库任务状态（每个文件的进度、阶段耗时与结果）"""
+    job = job_queue.get_job(job_id)
+    if job is None:
+        return jsonify({'success': False, 'message': f'任务不存在: {job_id}'}), 404
+    return jsonify({'success': True, 'job': job})
+
+
+@app.route('/api/jobs')
+def api_list_jobs():
+    """列出后台入库任务"""
+    return jsonify({'success': True, 'queue_size': job_queue.queue_size(), 'jobs': job_queue.list_jobs()})
+
+
 # 其他路由保持不变...
 @app.route('/api/search_paper', methods=['POST'])
 def api_search_paper():
@@ -309,12 +476,13 @@ def api_search_paper():
         data = request.get_json()
         query = data.get('query', '')
         n_results = data.get('n_results', 5)
+        mode = data.get('mode', 'hierarchical')  # hierarchical：按论文分组；flat：全片段检索
 
         if not query:
             return jsonify({'success': False, 'message': '请输入搜索查询', 'results': []})
 
-        doc_manager = DocumentManager()
-        results = doc_manager.search_paper(query, n_results)
+        doc_manager = services.document_manager
+        results = doc_manager.search_paper(query, n_results, mode=mode)
 
         return jsonify({'success': True, 'results': results})
 
@@ -333,8 +501,56 @@ def api_search_image():
         if not query:
             return jsonify({'success': False, 'message': '请输入图像描述', 'results': []})
 
-        img_manager = ImageManager()
-        results = img_manager.search_image(query, n_results)
+        img_manager = services.image_manager
+        results = add_image_urls(img_manager.search_image(query, n_results))
+
+        return jsonify({'success': True, 'results': results})
+
+    except Exception as e:
+        return jsonify({'success': False, 'message': f'搜索失败: {str(e)}', 'results': []})
+
+
+def parse_batch_queries(data):
+    """解析批量搜索请求，返回 (查询列表, n_results, 错误信息)"""
+    queries = data.get('queries')
+    n_results = data.get('n_results', 5)
+    if not isinstance(queries, list) or not queries:
+        return None, n_results, '请提供查询列表 queries'
+    if len(queries) > app.config['MAX_BATCH_QUERIES']:
+        return None, n_results, f'单次最多 {app.config["MAX_BATCH_QUERIES"]} 个查询'
+    if not all(isinstance(query, str) for query in queries):
+        return None, n_results, '查询必须为字符串'
+    return queries, n_results, None
+
+
+@app.route('/api/search_papers_batch', methods=['POST'])
+def api_search_papers_batch():
+    """批量搜索论文API接口（results与queries一一对应）"""
+    try:
+        data = request.get_json() or {}
+        queries, n_results, error = parse_batch_queries(data)
+        if error:
+            return jsonify({'success': False, 'message': error, 'results': []}), 400
+
+        doc_manager = services.document_manager
+        results = doc_manager.search_papers_batch(queries, n_results, mode=data.get('mode', 'hierarchical'))
+
+        return jsonify({'success': True, 'results': results})
+
+    except Exception as e:
+        return jsonify({'success': False, 'message': f'搜索失败: {str(e)}', 'results': []})
+
+
+@app.route('/api/search_images_batch', methods=['POST'])
+def api_search_images_batch():
+    """批量搜索图像API接口（results与queries一一对应）"""
+    try:
+        queries, n_results, error = parse_batch_queries(request.get_json() or {})
+        if error:
+            return jsonify({'success': False, 'message': error, 'results': []}), 400
+
+        img_manager = services.image_manager
+        results = [add_image_urls(query_results) for query_results in img_manager.search_images_batch(queries, n_results)]
 
         return jsonify({'success': True, 'results': results})
 
@@ -357,13 +573,14 @@ def api_validate_pdf():
         if not allowed_file(file.filename, 'pdf'):
             return jsonify({'success': False, 'message': '只支持PDF文件'})
 
-        # 保存临时文件
-        filename = secure_filename(file.filename)
-        temp_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-        file.save(temp_path)
+        # 流式保存临时文件（同时检查大小与文件头），再解析校验
+        try:
+            temp_path, _, content_hash = save_pdf_upload(file, app.config['UPLOAD_FOLDER'])
+        except UploadRejected as e:
+            return jsonify({'success': False, 'message': str(e)})
 
         # 验证PDF文件
-        is_valid, message = validate_pdf_file(temp_path)
+        is_valid, message, _ = validate_pdf_content(temp_path, content_hash=content_hash)
 
         # 清理临时文件
         try:
@@ -413,12 +630,42 @@ def api_get_image():
             '.bmp': 'image/bmp'
         }
 
-        return send_file(image_path, mimetype=mime_types.get(file_ext, 'image/jpeg'))
+        # 版本标识（内容哈希或大小+修改时间）作为强ETag；size参数返回对应尺寸的缩略图
+        img_manager = services.image_manager
+        version = ThumbnailCache.file_version(image_path, img_manager.image_digest(image_path))
+        size = request.args.get('size', type=int)
+        if size:
+            size = img_manager.thumbnails.normalize_size(size)
+            file_path, mimetype, etag = img_manager.get_thumbnail(image_path, size), 'image/jpeg', f'{version}-{size}'
+        else:
+            file_path, mimetype, etag = image_path, mime_types.get(file_ext, 'image/jpeg'), version
+
+        # conditional：处理If-None-Match/If-Modified-Since（返回304）；带版本参数v的URL内容不变，可长期缓存
+        return send_file(os.path.abspath(file_path), mimetype=mimetype, etag=etag, conditional=True,
+                         last_modified=os.path.getmtime(image_path),
+                         max_age=app.config['IMAGE_CACHE_MAX_AGE'] if request.args.get('v') else 0)
 
     except Exception as e:
         return jsonify({'success': False, 'message': f'获取图片失败: {str(e)}'}), 500
 
 
+def add_image_urls(results):
+    """为图像搜索结果附加缩略图与原图地址（带版本参数，浏览器可长期缓存）"""
+    img_manager = services.image_manager
+    for result in results:
+        try:
+            version = ThumbnailCache.file_version(result['path'], img_manager.image_digest(result['path']))[:16]
+        except OSError:
+            result['exists'] = False
+        if result['exists']:
+            result['thumbnail_url'] = url_for('api_get_image', path=result['path'],
+                                              size=img_manager.grid_thumbnail_size, v=version)
+            result['image_url'] = url_for('api_get_image', path=result['path'], v=version)
+        else:
+            result['thumbnail_url'] = result['image_url'] = None
+    return results
+
+
 @app.route('/api/check_image_exists')
 def api_check_image_exists():
     """检查图片是否存在"""
@@ -436,10 +683,41 @@ def api_check_image_exists():
         return jsonify({'exists': False, 'error': str(e)})
 
 
+@app.route('/api/cache_stats')
+def api_cache_stats():
+    """查询缓存统计（查询嵌入缓存与搜索结果缓存的命中/未命中次数）"""
+    return jsonify({'success': True, 'caches': services.cache_stats()})
+
+
+@app.route('/metrics')
+def prometheus_metrics():
+    """Prometheus格式的性能指标（各阶段计数与延迟直方图；多进程服务中为所有进程的合计）"""
+    metrics_dir = app.config['METRICS_DIR']
+    text = metrics_dir.render(metrics) if metrics_dir is not None else metrics.render()
+    return Response(text, content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
 @app.route('/health')
 def health_check():
     """健康检查端点"""
-    return jsonify({'status': 'ok', 'message': '服务正常运行'})
+    return jsonify({
+        'status': 'ok',
+        'message': '服务正常运行',
+        'models': EmbeddingModels().get_load_stats()  # 已加载模型的加载耗时与内存增量
+    })
+
+
+@app.route('/ready')
+def readiness_check():
+    """就绪检查端点：本进程预热完成（多进程服务中还要求全部只读进程就绪）时返回200，否则返回503；写入进程状态见writer_ready"""
+    status = {'role': app.config['SERVER_ROLE'], 'pid': os.getpid(), 'warmed_up': services.warmed_up}
+    board = app.config['READINESS']
+    ready = services.warmed_up
+    if board is not None:
+        status.update(board.summary())
+        ready = ready and status['workers_ready'] >= status['workers']
+    status['status'] = 'ready' if ready else 'starting'
+    return jsonify(status), 200 if ready else 503
 
 
 if __name__ == '__main__':
@@ -451,8 +729,10 @@ if __name__ == '__main__':
     print(f"静态文件目录: {static_dir}")
     print(f"文件上传限制: 单个文件最大{app.config['MAX_FILE_UPLOAD_SIZE'] // (1024 * 1024)}MB")
     print(f"批量文件限制: 最多{app.config['MAX_BATCH_FILES']}个文件")
+    print("预热模型与索引...")
+    services.warm_up()
     print("启动Flask应用...")
     print("访问地址: http://localhost:5000")
 
-    # 使用生产级服务器以获得更好的性能
+    # 开发模式（单进程）；生产环境使用 python main.py serve --workers N（多进程，见 src/server.py）
     app.run(debug=True, host='0.0.0.0', port=5000, threaded=True)
\ No newline at end of file
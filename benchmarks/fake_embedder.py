@@ -0,0 +1,65 @@
+import hashlib
+import numpy as np
+from PIL import Image
+
+
+# 由内容哈希确定的随机单位向量（同一输入始终得到同一向量）
+def hash_vector(data: bytes, dim: int) -> np.ndarray:
+    seed = int.from_bytes(hashlib.sha256(data).digest()[:8], "little")
+    vector = np.random.default_rng(seed).standard_normal(dim).astype(np.float32)
+    return vector / np.linalg.norm(vector)
+
+
+# 伪嵌入器：接口与 EmbeddingModels 一致，向量由输入哈希生成，不加载任何模型
+class FakeEmbeddingModels:
+    """
+    基准测试只度量解析、分片、向量库与服务开销，与模型推理耗时隔离
+    图像仍完整解码（与真实流程相同的 draft 降采样解码），只是不做前向计算
+    """
+
+    def __init__(self, text_dim: int = 384, clip_dim: int = 512, image_resolution: int = 224):
+        self.text_dim = text_dim
+        self.clip_dim = clip_dim
+        self.image_resolution = image_resolution
+        self.text_model_name = f"fake-text-{text_dim}"
+        self.clip_model_name = f"fake-clip-{clip_dim}"
+        self.text_max_tokens = 256
+        self.tokenizer_name = None  # 不加载分词器，按字符规则估算词元数
+
+    def get_text_embeddings(self, texts: list, batch_size: int = 64) -> np.ndarray:
+        if not texts:
+            return np.empty((0, self.text_dim), dtype=np.float32)
+        return np.stack([hash_vector(text.encode("utf-8"), self.text_dim) for text in texts])
+
+    def get_text_embedding(self, text):
+        return self.get_text_embeddings([text])[0].tolist()
+
+    def get_text_query_embeddings(self, texts: list) -> list:
+        return self.get_text_embeddings(texts).tolist()
+
+    def get_clip_text_embeddings(self, texts: list) -> list:
+        return [hash_vector(text.encode("utf-8"), self.clip_dim).tolist() for text in texts]
+
+    def get_clip_text_embedding(self, text):
+        return self.get_clip_text_embeddings([text])[0]
+
+    def get_image_embeddings(self, image_paths: list, batch_size: int = 32, num_workers: int = 4,
+                             digests: list = None) -> list:
+        embeddings = []
+        for image_path in image_paths:
+            try:
+                with Image.open(image_path) as image:
+                    image.draft("RGB", (self.image_resolution, self.image_resolution))
+                    pixels = image.convert("RGB").resize((self.image_resolution, self.image_resolution)).tobytes()
+            except Exception as e:
+                print(f"图像读取失败（{image_path}）：{e}")
+                embeddings.append(None)
+                continue
+            embeddings.append(hash_vector(pixels, self.clip_dim).tolist())
+        return embeddings
+
+    def get_image_embedding(self, image_path):
+        embedding = self.get_image_embeddings([image_path])[0]
+        if embedding is None:
+            raise ValueError(f"无法读取图像：{image_path}")
+        return embedding
\ No newline at end of file
@@ -0,0 +1,289 @@
+"""
+离线基准测试：合成论文/图像语料，度量入库吞吐、检索延迟与HTTP路由延迟，结果输出为JSON便于跨提交对比
+
+用法（在仓库根目录运行）：
+    python -m benchmarks.run_benchmarks --papers 20 --images 40 --queries 100 --output bench.json
+    python -m benchmarks.run_benchmarks --compare bench_old.json --output bench_new.json
+默认使用伪嵌入器（哈希随机向量，无需模型权重）；--embedder real 使用真实模型
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import platform
+import tempfile
+import subprocess
+import numpy as np
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+from benchmarks.synthetic import make_corpus, make_images, random_queries  # noqa: E402
+from benchmarks.fake_embedder import FakeEmbeddingModels  # noqa: E402
+
+TOPICS = ["CV", "NLP", "RL"]
+
+
+# 进程峰值常驻内存（MB；Windows等无resource模块的平台返回None）
+def peak_rss_mb():
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024, 1)  # macOS单位为字节
+
+
+# 延迟分布（毫秒）
+def latency_stats(latencies: list) -> dict:
+    values = np.array(latencies) * 1000
+    return {
+        "count": len(latencies),
+        "mean_ms": round(float(values.mean()), 3),
+        "p50_ms": round(float(np.percentile(values, 50)), 3),
+        "p95_ms": round(float(np.percentile(values, 95)), 3),
+        "p99_ms": round(float(np.percentile(values, 99)), 3),
+        "qps": round(len(latencies) / values.sum() * 1000, 2) if values.sum() else None
+    }
+
+
+def timed_calls(func, args_list: list) -> list:
+    latencies = []
+    for args in args_list:
+        start = time.perf_counter()
+        func(*args)
+        latencies.append(time.perf_counter() - start)
+    return latencies
+
+
+def throughput(count: int, seconds: float) -> float:
+    return round(count / seconds, 2) if seconds else None
+
+
+# 逐篇 add_paper 入库
+def bench_add_paper(doc_manager, corpus: list) -> dict:
+    chunks_before = doc_manager.vector_db.count(doc_manager.collection_name)
+    start = time.perf_counter()
+    failed = 0
+    for pdf_path, _ in corpus:
+        if doc_manager.add_paper(pdf_path, TOPICS).startswith("错误"):
+            failed += 1
+    seconds = time.perf_counter() - start
+    pages = sum(page_count for _, page_count in corpus)
+    chunks = doc_manager.vector_db.count(doc_manager.collection_name) - chunks_before
+    return {
+        "papers": len(corpus), "pages": pages, "chunks": chunks, "failed": failed, "seconds": round(seconds, 3),
+        "papers_per_sec": throughput(len(corpus), seconds),
+        "pages_per_sec": throughput(pages, seconds),
+        "chunks_per_sec": throughput(chunks, seconds),
+        "peak_rss_mb": peak_rss_mb()
+    }
+
+
+# batch_organize 整理文件夹（workers>1时多进程解析）
+def bench_batch_organize(doc_manager, folder: str, corpus: list, workers: int) -> dict:
+    chunks_before = doc_manager.vector_db.count(doc_manager.collection_name)
+    start = time.perf_counter()
+    doc_manager.batch_organize(folder, TOPICS, workers=workers)
+    seconds = time.perf_counter() - start
+    pages = sum(page_count for _, page_count in corpus)
+    chunks = doc_manager.vector_db.count(doc_manager.collection_name) - chunks_before
+    return {
+        "papers": len(corpus), "pages": pages, "chunks": chunks, "workers": workers, "seconds": round(seconds, 3),
+        "papers_per_sec": throughput(len(corpus), seconds),
+        "pages_per_sec": throughput(pages, seconds),
+        "chunks_per_sec": throughput(chunks, seconds),
+        "peak_rss_mb": peak_rss_mb()
+    }
+
+
+# 各检索方式的 search_paper 延迟（每条查询不同，不命中结果缓存）
+def bench_search_paper(doc_manager, queries: list, n_results: int) -> dict:
+    results = {}
+    for mode in ("hierarchical", "flat", "keyword", "hybrid"):
+        latencies = timed_calls(doc_manager.search_paper, [(query, n_results, mode) for query in queries])
+        results[mode] = latency_stats(latencies)
+    results["peak_rss_mb"] = peak_rss_mb()
+    return results
+
+
+# 图像入库：前一部分逐张 add_image，其余一次 add_images 批量入库
+def bench_add_images(image_manager, image_paths: list, single_count: int) -> dict:
+    single, bulk = image_paths[:single_count], image_paths[single_count:]
+    start = time.perf_counter()
+    for image_path in single:
+        image_manager.add_image(image_path)
+    single_seconds = time.perf_counter() - start
+    start = time.perf_counter()
+    image_manager.add_images(bulk)
+    bulk_seconds = time.perf_counter() - start
+    return {
+        "add_image": {"images": len(single), "seconds": round(single_seconds, 3),
+                      "images_per_sec": throughput(len(single), single_seconds)},
+        "add_images": {"images": len(bulk), "seconds": round(bulk_seconds, 3),
+                       "images_per_sec": throughput(len(bulk), bulk_seconds)},
+        "indexed": image_manager.vector_db.count(image_manager.collection_name),
+        "peak_rss_mb": peak_rss_mb()
+    }
+
+
+def bench_search_image(image_manager, queries: list, n_results: int) -> dict:
+    stats = latency_stats(timed_calls(image_manager.search_image, [(query, n_results) for query in queries]))
+    stats["peak_rss_mb"] = peak_rss_mb()
+    return stats
+
+
+# 通过Flask测试客户端调用HTTP路由（包含请求解析、JSON序列化与中间件开销）
+def bench_http(app_module, queries: list, n_results: int) -> dict:
+    client = app_module.app.test_client()
+    results = {}
+
+    def route_latencies(name, requests):
+        latencies = []
+        for method, url, kwargs in requests:
+            start = time.perf_counter()
+            response = getattr(client, method)(url, **kwargs)
+            latencies.append(time.perf_counter() - start)
+            if response.status_code >= 400:
+                raise RuntimeError(f"{url} 返回 {response.status_code}")
+        results[name] = latency_stats(latencies)
+
+    route_latencies("POST /api/search_paper", [
+        ("post", "/api/search_paper", {"json": {"query": f"http {query}", "n_results": n_results}}) for query in queries])
+    batches = [queries[i:i + 16] for i in range(0, len(queries), 16)]
+    route_latencies("POST /api/search_papers_batch (16)", [
+        ("post", "/api/search_papers_batch", {"json": {"queries": [f"batch {query}" for query in batch],
+                                                       "n_results": n_results}}) for batch in batches])
+    route_latencies("POST /api/search_image", [
+        ("post", "/api/search_image", {"json": {"query": f"http {query}", "n_results": n_results}}) for query in queries])
+    image_results = client.post("/api/search_image", json={"query": queries[0], "n_results": n_results}).get_json()
+    thumbnail_urls = [result["thumbnail_url"] for result in image_results.get("results", [])]
+    if thumbnail_urls:
+        route_latencies("GET /api/get_image (thumbnail)", [("get", url, {}) for url in thumbnail_urls * 10])
+    route_latencies("GET /metrics", [("get", "/metrics", {}) for _ in range(20)])
+    results["peak_rss_mb"] = peak_rss_mb()
+    return results
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=REPO_ROOT,
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except Exception:
+        return None
+
+
+# 展平嵌套结果中的数值（"suite.key.subkey" -> 值），用于对比
+def flatten(data: dict, prefix: str = "") -> dict:
+    flat = {}
+    for key, value in data.items():
+        name = f"{prefix}{key}"
+        if isinstance(value, dict):
+            flat.update(flatten(value, f"{name}."))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            flat[name] = value
+    return flat
+
+
+# 与旧结果对比（只比较吞吐、延迟与内存）
+def compare(old: dict, new: dict) -> str:
+    old_flat, new_flat = flatten(old["results"]), flatten(new["results"])
+    lines = [f"=== 对比 {old.get('git_revision')} -> {new.get('git_revision')} ==="]
+    for key in sorted(new_flat):
+        if key not in old_flat or not key.endswith(("_per_sec", "_ms", "qps", "peak_rss_mb")):
+            continue
+        before, after = old_flat[key], new_flat[key]
+        change = f"{(after - before) / before:+.1%}" if before else "-"
+        lines.append(f"{key:<72}{before:>12}{after:>12}{change:>10}")
+    return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="离线基准测试：入库吞吐与检索延迟")
+    parser.add_argument("--papers", type=int, default=20, help="逐篇 add_paper 的合成论文数（默认20）")
+    parser.add_argument("--batch_papers", type=int, default=20, help="batch_organize 的合成论文数（默认20）")
+    parser.add_argument("--workers", type=int, default=2, help="batch_organize 的解析进程数（默认2）")
+    parser.add_argument("--max_pages", type=int, default=12, help="每篇论文最多页数（默认12）")
+    parser.add_argument("--cjk_ratio", type=float, default=0.3, help="中文论文比例（默认0.3）")
+    parser.add_argument("--images", type=int, default=40, help="合成图像数（默认40）")
+    parser.add_argument("--queries", type=int, default=100, help="每项检索测试的查询数（默认100）")
+    parser.add_argument("--n_results", type=int, default=5, help="每次检索返回结果数（默认5）")
+    parser.add_argument("--seed", type=int, default=0, help="随机种子（相同种子生成相同语料）")
+    parser.add_argument("--embedder", choices=["fake", "real"], default="fake",
+                        help="fake：哈希随机向量（默认，隔离模型耗时）；real：加载真实模型")
+    parser.add_argument("--chunking", choices=["tokens", "chars"], default="tokens",
+                        help="文档切分方式：tokens 按词元预算分句切分（默认），chars 为旧版固定500字符切分（对比用）")
+    parser.add_argument("--workdir", default=None, help="工作目录（默认临时目录，结束后删除）")
+    parser.add_argument("--output", default=None, help="结果JSON路径")
+    parser.add_argument("--compare", default=None, help="与之对比的旧结果JSON路径")
+    args = parser.parse_args()
+
+    workdir = os.path.abspath(args.workdir or tempfile.mkdtemp(prefix="paper_bench_"))
+    os.makedirs(workdir, exist_ok=True)
+    output = os.path.abspath(args.output) if args.output else None
+    compare_path = os.path.abspath(args.compare) if args.compare else None
+    # 服务容器与各索引使用相对路径（./data/...），切换到工作目录使数据全部落在其中
+    os.chdir(workdir)
+
+    from src.services import services
+    from src.metrics import metrics
+    if args.embedder == "fake":
+        services.embedding_model = FakeEmbeddingModels()
+
+    print(f"生成合成语料（{workdir}）...")
+    corpus = make_corpus(os.path.join(workdir, "corpus"), args.papers, seed=args.seed,
+                         max_pages=args.max_pages, cjk_ratio=args.cjk_ratio)
+    batch_folder = os.path.join(workdir, "batch_corpus")
+    batch_corpus = make_corpus(batch_folder, args.batch_papers, seed=args.seed + 1,
+                               max_pages=args.max_pages, cjk_ratio=args.cjk_ratio)
+    image_paths = make_images(os.path.join(workdir, "source_images"), args.images, seed=args.seed)
+    queries = random_queries(args.queries, seed=args.seed)
+
+    results = {}
+    try:
+        doc_manager = services.document_manager
+        doc_manager.chunker.strategy = args.chunking
+        print("add_paper ...")
+        results["add_paper"] = bench_add_paper(doc_manager, corpus)
+        print("batch_organize ...")
+        results["batch_organize"] = bench_batch_organize(doc_manager, batch_folder, batch_corpus, args.workers)
+        print("search_paper ...")
+        results["search_paper"] = bench_search_paper(doc_manager, queries, args.n_results)
+        image_manager = services.image_manager
+        print("add_image / add_images ...")
+        results["add_images"] = bench_add_images(image_manager, image_paths, min(10, len(image_paths) // 2))
+        print("search_image ...")
+        results["search_image"] = bench_search_image(image_manager, queries, args.n_results)
+        print("HTTP ...")
+        import app as app_module
+        results["http"] = bench_http(app_module, queries, args.n_results)
+    finally:
+        services.close()
+
+    report = {
+        "git_revision": git_revision(),
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "args": vars(args),
+        "results": results,
+        "stages": metrics.snapshot()  # 各阶段指标（PDF逐页解析、分片、向量库等）
+    }
+    print(json.dumps(results, ensure_ascii=False, indent=2))
+    if output:
+        with open(output, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"结果已写入 {output}")
+    if compare_path:
+        with open(compare_path, "r", encoding="utf-8") as f:
+            print(compare(json.load(f), report))
+    if not args.workdir:
+        os.chdir(REPO_ROOT)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
\ No newline at end of file
@@ -0,0 +1,133 @@
+import os
+import zlib
+import random
+import numpy as np
+from PIL import Image
+
+# 英文与中文词表（生成可检索的合成文本）
+LATIN_WORDS = (
+    "retrieval augmented generation transformer attention encoder decoder embedding vector index query "
+    "latency throughput benchmark dataset evaluation model training inference gradient optimizer loss "
+    "convolution image segmentation detection classification language reinforcement policy reward agent "
+    "graph neural network token sequence context window memory cache storage database recall precision "
+    "geographic location disaster social media extraction knowledge prompt dialogue personalized source"
+).split()
+CJK_WORDS = (
+    "检索 增强 生成 注意力 编码器 解码器 嵌入 向量 索引 查询 延迟 吞吐 基准 数据集 评估 模型 训练 推理 "
+    "梯度 优化 损失 卷积 图像 分割 检测 分类 语言 强化 学习 策略 奖励 智能体 图 神经 网络 序列 上下文 "
+    "记忆 缓存 存储 数据库 召回 精度 地理 位置 灾害 社交 媒体 抽取 知识 提示 对话 个性化 岩石 薄片"
+).split()
+
+
+# 生成一段合成文本（CJK文本不含空格，按句号断句）
+def random_sentences(rng: random.Random, cjk: bool, count: int) -> list:
+    sentences = []
+    for _ in range(count):
+        words = [rng.choice(CJK_WORDS if cjk else LATIN_WORDS) for _ in range(rng.randint(6, 18))]
+        sentences.append("".join(words) + "。" if cjk else " ".join(words).capitalize() + ".")
+    return sentences
+
+
+# 随机查询（从词表中取2~4个词）
+def random_queries(count: int, seed: int = 0) -> list:
+    rng = random.Random(seed)
+    queries = []
+    for i in range(count):
+        cjk = i % 3 == 2
+        words = [rng.choice(CJK_WORDS if cjk else LATIN_WORDS) for _ in range(rng.randint(2, 4))]
+        queries.append(("" if cjk else " ").join(words) + f" {i}")  # 序号保证每条查询不同（不命中结果缓存）
+    return queries
+
+
+def _pdf_literal(text: str) -> str:
+    return "(" + text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)") + ")"
+
+
+def _wrap(text: str, width: int) -> list:
+    return [text[i:i + width] for i in range(0, len(text), width)] or [""]
+
+
+# 写入最小化的PDF：英文用Helvetica，中文用Identity-H编码的Type0字体（PyPDF2按UTF-16BE还原文本）
+def write_pdf(path: str, pages: list):
+    """
+    pages: [(是否中文, 页面文本), ...]
+    """
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        None,  # 页面树（页面对象编号确定后填入）
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding >>",
+        b"<< /Type /Font /Subtype /Type0 /BaseFont /STSong-Light /Encoding /Identity-H /DescendantFonts [5 0 R] >>",
+        b"<< /Type /Font /Subtype /CIDFontType0 /BaseFont /STSong-Light "
+        b"/CIDSystemInfo << /Registry (Adobe) /Ordering (GB1) /Supplement 4 >> /FontDescriptor 6 0 R >>",
+        b"<< /Type /FontDescriptor /FontName /STSong-Light /Flags 6 /FontBBox [0 -200 1000 900] "
+        b"/ItalicAngle 0 /Ascent 880 /Descent -120 /CapHeight 880 /StemV 93 >>",
+    ]
+    page_ids = []
+    for cjk, text in pages:
+        if cjk:
+            lines = [f"<{line.encode('utf-16-be').hex()}> Tj T*" for line in _wrap(text, 40)]
+            font = "/F2"
+        else:
+            lines = [f"{_pdf_literal(line)} Tj T*" for line in _wrap(text, 90)]
+            font = "/F1"
+        content = zlib.compress(f"BT {font} 10 Tf 12 TL 40 800 Td\n".encode("latin-1")
+                                + "\n".join(lines).encode("latin-1") + b"\nET")
+        objects.append(b"<< /Length %d /Filter /FlateDecode >>\nstream\n" % len(content) + content + b"\nendstream")
+        content_id = len(objects)
+        objects.append(b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] "
+                       b"/Resources << /Font << /F1 3 0 R /F2 4 0 R >> >> /Contents %d 0 R >>" % content_id)
+        page_ids.append(len(objects))
+    objects[1] = b"<< /Type /Pages /Kids [%s] /Count %d >>" % (
+        " ".join(f"{i} 0 R" for i in page_ids).encode("ascii"), len(page_ids))
+
+    data = bytearray(b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n")
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(data))
+        data += b"%d 0 obj\n" % number + body + b"\nendobj\n"
+    xref_offset = len(data)
+    data += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    data += b"".join(b"%010d 00000 n \n" % offset for offset in offsets)
+    data += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref_offset)
+    with open(path, "wb") as f:
+        f.write(data)
+
+
+# 生成合成论文语料，返回 [(路径, 页数), ...]
+def make_corpus(folder: str, count: int, seed: int = 0, min_pages: int = 1, max_pages: int = 12,
+                cjk_ratio: float = 0.3, sentences_per_page: int = 25) -> list:
+    os.makedirs(folder, exist_ok=True)
+    rng = random.Random(seed)
+    corpus = []
+    for i in range(count):
+        cjk = rng.random() < cjk_ratio
+        page_count = rng.randint(min_pages, max_pages)
+        pages = [(cjk, " ".join(random_sentences(rng, cjk, sentences_per_page))) for _ in range(page_count)]
+        path = os.path.join(folder, f"paper_{seed}_{i:04d}{'_cjk' if cjk else ''}.pdf")
+        write_pdf(path, pages)
+        corpus.append((path, page_count))
+    return corpus
+
+
+# 生成合成图像（尺寸与格式随机：渐变背景 + 随机色块 + 噪声），返回路径列表
+def make_images(folder: str, count: int, seed: int = 0, min_size: int = 320, max_size: int = 2048) -> list:
+    os.makedirs(folder, exist_ok=True)
+    rng = np.random.default_rng(seed)
+    paths = []
+    for i in range(count):
+        width, height = (int(v) for v in rng.integers(min_size, max_size + 1, size=2))
+        gradient = np.linspace(0, 255, width, dtype=np.float32)[None, :, None]
+        pixels = np.broadcast_to(gradient * rng.random(3, dtype=np.float32), (height, width, 3)).copy()
+        for _ in range(5):
+            x, y = int(rng.integers(0, width)), int(rng.integers(0, height))
+            pixels[y:y + height // 4, x:x + width // 4] = rng.integers(0, 256, size=3)
+        pixels += rng.normal(0, 12, size=pixels.shape).astype(np.float32)
+        image = Image.fromarray(np.clip(pixels, 0, 255).astype(np.uint8), "RGB")
+        ext = ".jpg" if i % 4 else ".png"
+        path = os.path.join(folder, f"image_{seed}_{i:04d}{ext}")
+        if ext == ".jpg":
+            image.save(path, quality=90)
+        else:
+            image.save(path)
+        paths.append(path)
+    return paths
\ No newline at end of file
@@ -1,59 +1,134 @@
 import argparse
 import os
+import time
 
-from src.document_manager import DocumentManager
-from src.image_manager import ImageManager
+from src.services import services
+from src.metrics import metrics
+from src.embedding import EmbeddingModels
+
+# 快照导出/导入的默认集合（论文片段、论文级向量、图像）
+SNAPSHOT_COLLECTIONS = ["paper_collection", "paper_summary_collection", "image_collection"]
 
 
 def main():
     # 创建命令行参数解析器
     parser = argparse.ArgumentParser(description="本地多模态AI智能文献与图像管理助手（Python 3.9）")
-    subparsers = parser.add_subparsers(dest="command", help="可用命令：add_paper, search_paper, search_image")
+    parser.add_argument("--profile", action="store_true",
+                        help="命令结束后输出各阶段耗时（PDF解析/分片/嵌入/向量库/图像解码等），如：python main.py --profile add_paper ...")
+    subparsers = parser.add_subparsers(dest="command", help="可用命令：add_paper, search_paper, search_image, migrate_index, tune_index, build_paper_index, build_keyword_index, add_images, build_paper_registry, sync, export, import, serve")
 
     # 1. 添加/分类论文命令
     add_paper_parser = subparsers.add_parser("add_paper", help="添加并分类论文（单文件/批量）")
     add_paper_parser.add_argument("path", help="PDF文件路径或文件夹路径")
     add_paper_parser.add_argument("--topics", required=True, help="分类主题，用逗号分隔（如：CV,NLP,RL）")
+    add_paper_parser.add_argument("--workers", type=int, default=1, help="批量处理时并行解析PDF的进程数（默认1）")
+    add_paper_parser.add_argument("--tag", default=None, help="可选标签（论文已在库中时只为其添加该标签）")
 
     # 2. 搜索论文命令
     search_paper_parser = subparsers.add_parser("search_paper", help="语义搜索论文")
     search_paper_parser.add_argument("query", help="搜索查询语句（自然语言）")
     search_paper_parser.add_argument("--n_results", type=int, default=5, help="返回结果数量（默认5）")
+    search_paper_parser.add_argument("--mode", choices=["hierarchical", "flat", "keyword", "hybrid"],
+                                     default="hierarchical",
+                                     help="检索方式：hierarchical 先选论文再排片段（默认），flat 全片段检索，"
+                                          "keyword BM25关键词检索，hybrid 向量与关键词融合")
 
     # 3. 以文搜图命令
     search_image_parser = subparsers.add_parser("search_image", help="以文搜图")
     search_image_parser.add_argument("query", help="图像描述语句（自然语言）")
     search_image_parser.add_argument("--n_results", type=int, default=5, help="返回结果数量（默认5）")
 
+    # 4. 迁移索引配置命令
+    migrate_parser = subparsers.add_parser("migrate_index", help="按当前索引配置（余弦空间/HNSW参数）重建集合")
+    migrate_parser.add_argument("--collection", default=None,
+                                help="集合名（默认迁移paper_collection与image_collection）")
+
+    # 5. 索引参数调优命令
+    tune_parser = subparsers.add_parser("tune_index", help="评估HNSW参数的召回率与查询延迟")
+    tune_parser.add_argument("--collection", required=True, help="用于评估的集合名")
+    tune_parser.add_argument("--k", type=int, default=10, help="召回率@k（默认10）")
+    tune_parser.add_argument("--queries", type=int, default=100, help="查询数量（默认100）")
+    tune_parser.add_argument("--M", default="16", help="M取值，逗号分隔（默认16）")
+    tune_parser.add_argument("--construction_ef", default="100", help="construction_ef取值，逗号分隔（默认100）")
+    tune_parser.add_argument("--search_ef", default="10,50,100,200", help="search_ef取值，逗号分隔")
+
+    # 6. 补建论文级向量命令（旧版本入库的论文执行一次即可启用分层检索）
+    subparsers.add_parser("build_paper_index", help="为已入库论文建立论文级向量（分层检索）")
+
+    # 7. 补建关键词索引命令（旧版本入库的论文执行一次即可启用关键词/混合检索）
+    subparsers.add_parser("build_keyword_index", help="为已入库论文建立BM25关键词索引")
+
+    # 8. 批量添加图像命令
+    add_images_parser = subparsers.add_parser("add_images", help="批量添加图像（文件或文件夹，不在图像目录下的会复制进去）")
+    add_images_parser.add_argument("paths", nargs="+", help="图像文件或文件夹路径")
+
+    # 9. 建立论文内容哈希登记命令（升级前入库的论文执行一次，之后重复文件不再入库）
+    registry_parser = subparsers.add_parser("build_paper_registry", help="为已入库论文建立内容哈希登记并查找重复副本")
+    registry_parser.add_argument("--remove_duplicates", action="store_true",
+                                 help="删除重复副本（文件及其向量，保留最早的一份）")
+
+    # 10. 论文库同步命令（手动移动/改名/删除论文文件或直接放入分类目录后执行；--watch 持续监视）
+    sync_parser = subparsers.add_parser("sync", help="同步论文目录与索引（删除、移动、改名、新增）")
+    sync_parser.add_argument("--watch", action="store_true", help="持续轮询监视论文目录（Ctrl+C 结束）")
+    sync_parser.add_argument("--interval", type=float, default=5.0, help="监视时的轮询间隔秒数（默认5）")
+    sync_parser.add_argument("--workers", type=int, default=1, help="并行解析新增PDF的进程数（默认1）")
+    sync_parser.add_argument("--full", action="store_true", help="忽略清单中的大小/修改时间，重新核对全部文件")
+
+    # 11. 导出集合快照命令（在入库节点上执行，快照复制到新节点后用 import 冷启动）
+    export_parser = subparsers.add_parser("export", help="导出集合快照（float16向量 + 列式元数据，每个集合一个子目录）")
+    export_parser.add_argument("output", help="快照根目录")
+    export_parser.add_argument("--collections", default=None,
+                               help=f"集合名，逗号分隔（默认 {','.join(SNAPSHOT_COLLECTIONS)}）")
+    export_parser.add_argument("--overwrite", action="store_true", help="覆盖已存在的快照")
+
+    # 12. 导入集合快照命令
+    import_parser = subparsers.add_parser("import", help="从快照导入集合（无需重新解析与嵌入）")
+    import_parser.add_argument("input", help="快照根目录（export 的输出）")
+    import_parser.add_argument("--collections", default=None, help="只导入指定集合，逗号分隔（默认快照中的全部集合）")
+    import_parser.add_argument("--replace", action="store_true", help="覆盖已有数据的集合")
+    import_parser.add_argument("--batch_size", type=int, default=20000, help="每批写入的向量数（默认20000）")
+    import_parser.add_argument("--no_verify", action="store_true", help="跳过快照文件的哈希校验")
+
+    # 13. 生产服务命令（多进程：模型在fork前加载并共享，检索并行处理，写入由单独的写入进程完成）
+    serve_parser = subparsers.add_parser("serve", help="启动多进程Web服务（kill -HUP 主进程可平滑重启）")
+    serve_parser.add_argument("--host", default="0.0.0.0", help="监听地址（默认0.0.0.0）")
+    serve_parser.add_argument("--port", type=int, default=5000, help="监听端口（默认5000）")
+    serve_parser.add_argument("--workers", type=int, default=min(4, os.cpu_count() or 1),
+                              help="处理检索请求的只读进程数（另有1个写入进程；1表示单进程运行）")
+    serve_parser.add_argument("--graceful_timeout", type=float, default=30,
+                              help="停止或重启时等待处理中请求完成的最长时间（秒，默认30）")
+
     # 解析参数
     args = parser.parse_args()
+    started = time.perf_counter()
 
     # 执行对应命令
     if args.command == "add_paper":
         # 处理论文添加/分类
-        doc_manager = DocumentManager()
+        doc_manager = services.document_manager
         topics = [t.strip() for t in args.topics.split(",")]
         if os.path.isfile(args.path):
             # 单文件处理
-            result = doc_manager.add_paper(args.path, topics)
+            result = doc_manager.add_paper(args.path, topics, tag=args.tag)
             print(result)
         elif os.path.isdir(args.path):
             # 批量处理文件夹
-            result = doc_manager.batch_organize(args.path, topics)
+            result = doc_manager.batch_organize(args.path, topics, workers=args.workers, tag=args.tag)
             print(result)
         else:
             print(f"错误：{args.path} 不是有效的文件或文件夹")
 
     elif args.command == "search_paper":
         # 语义搜索论文
-        doc_manager = DocumentManager()
-        results = doc_manager.search_paper(args.query, args.n_results)
+        doc_manager = services.document_manager
+        results = doc_manager.search_paper(args.query, args.n_results, mode=args.mode)
         if results:
             print(f"\n=== 论文搜索结果（共{len(results)}条）===")
             for i, res in enumerate(results, 1):
                 print(f"\n{i}. 文件名：{res['file_name']}")
                 print(f"   路径：{res['path']}")
                 print(f"   分类：{res['topic']}")
+                print(f"   页码：{', '.join(str(m['page']) for m in res.get('matches', [res]))}")
                 print(f"   相似度：{res['similarity']}")
         else:
             print("\n未找到相关论文")
@@ -62,7 +137,7 @@ def main():
 
     elif args.command == "search_image":
         # 以文搜图
-        img_manager = ImageManager()
+        img_manager = services.image_manager
         results = img_manager.search_image(args.query, args.n_results)
         if results:
             print(f"\n=== 图像搜索结果（共{len(results)}条）===")
@@ -73,10 +148,109 @@ def main():
         else:
             print("\n未找到相关图像")
 
+    elif args.command == "migrate_index":
+        # 按当前索引配置重建集合
+        collections = [args.collection] if args.collection else ["paper_collection", "image_collection"]
+        for collection_name in collections:
+            print(services.vector_db.migrate_collection(collection_name))
+
+    elif args.command == "tune_index":
+        # 评估HNSW参数（与暴力精确检索对比召回率；最后一行为numpy精确检索后端）
+        from src.index_tuning import load_collection_vectors, tune_index
+        vectors = load_collection_vectors(services.vector_db, args.collection)
+        if len(vectors) == 0:
+            print(f"错误：集合 {args.collection} 为空或不存在")
+            return
+        parse_values = lambda text: [int(v) for v in text.split(",")]
+        rows = tune_index(
+            vectors,
+            k=args.k,
+            n_queries=args.queries,
+            space=services.vector_db.index_config(args.collection)["space"],
+            m_values=parse_values(args.M),
+            construction_ef_values=parse_values(args.construction_ef),
+            search_ef_values=parse_values(args.search_ef)
+        )
+        print(f"\n=== 索引参数评估（{len(vectors)}条向量，召回率@{args.k}）===")
+        print(f"{'M':>4} {'construction_ef':>16} {'search_ef':>10} {'建索引(s)':>10} {'召回率':>8} {'p50(ms)':>9} {'p99(ms)':>9}")
+        for row in rows:
+            print(f"{row['M']:>4} {row['construction_ef']:>16} {row['search_ef']:>10} {row['build_seconds']:>10} "
+                  f"{row['recall_at_k']:>8} {row['p50_ms']:>9} {row['p99_ms']:>9}")
+
+    elif args.command == "build_paper_index":
+        # 补建论文级向量
+        print(services.document_manager.build_paper_index())
+
+    elif args.command == "build_keyword_index":
+        # 补建关键词索引
+        print(services.document_manager.build_keyword_index())
+
+    elif args.command == "add_images":
+        # 批量添加图像（并行解码 + 批量编码）
+        img_manager = services.image_manager
+        image_paths = []
+        for path in args.paths:
+            if os.path.isdir(path):
+                image_paths.extend(os.path.join(root, file_name) for root, _, files in os.walk(path)
+                                   for file_name in sorted(files)
+                                   if any(file_name.lower().endswith(ext) for ext in img_manager.supported_ext))
+            else:
+                image_paths.append(path)
+        for image_path, result in img_manager.add_images(image_paths):
+            print(f"{os.path.basename(image_path)}: {result}")
+
+    elif args.command == "build_paper_registry":
+        # 建立内容哈希登记
+        print(services.document_manager.build_paper_registry(remove_duplicates=args.remove_duplicates))
+
+    elif args.command == "sync":
+        # 同步论文库
+        library_sync = services.library_sync
+        print(library_sync.format_stats(library_sync.sync(workers=args.workers, full=args.full)))
+        if args.watch:
+            print(f"监视论文目录 {library_sync.paper_root}（每{args.interval}秒，Ctrl+C 结束）...")
+            try:
+                library_sync.watch(args.interval, workers=args.workers)
+            except KeyboardInterrupt:
+                pass
+
+    elif args.command == "export":
+        # 导出集合快照
+        collections = args.collections.split(",") if args.collections else SNAPSHOT_COLLECTIONS
+        for collection_name in collections:
+            print(services.vector_db.export_collection(collection_name, os.path.join(args.output, collection_name),
+                                                       overwrite=args.overwrite))
+
+    elif args.command == "import":
+        # 导入集合快照（子目录名为集合名）
+        if not os.path.isdir(args.input):
+            print(f"错误：{args.input} 不是有效的文件夹")
+            return
+        collections = args.collections.split(",") if args.collections else sorted(
+            name for name in os.listdir(args.input) if os.path.isfile(os.path.join(args.input, name, "manifest.json")))
+        for collection_name in collections:
+            print(services.vector_db.import_collection(os.path.join(args.input, collection_name), collection_name,
+                                                       batch_size=args.batch_size, replace=args.replace,
+                                                       verify=not args.no_verify))
+        if "paper_collection" in collections:
+            print("提示：关键词/混合检索需再执行 python main.py build_keyword_index（由导入的片段文本建立，无需嵌入）")
+
+    elif args.command == "serve":
+        # 多进程Web服务（不支持fork的平台上以单进程运行）
+        from src.server import serve
+        serve(args.host, args.port, workers=args.workers, graceful_timeout=args.graceful_timeout)
+
     else:
         # 显示帮助信息
         parser.print_help()
 
+    # 输出各阶段耗时（模型加载耗时单独列出）
+    if args.profile:
+        print()
+        print(metrics.format_summary(time.perf_counter() - started))
+        for model_name, stats in EmbeddingModels().get_load_stats().items():
+            print(f"模型加载 {model_name}: {stats}")
+
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
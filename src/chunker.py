@@ -0,0 +1,195 @@
+import os
+import re
+import bisect
+
+# 中日韩文字与全角标点（分句、拼接时不加空格；估算词元数时每字计为一个词元）
+_CJK = r"\u3000-\u303f\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af\uf900-\ufaff\uff00-\uffef"
+_CJK_CHAR = re.compile(f"[{_CJK}]")
+# 句末标点（中文句号/问号/叹号/分号直接断句；英文标点后需跟空白）
+_SENTENCE_END = re.compile(r"[。！？；]+[”’」』）]*|[.!?;]+[\"')\]]*(?=\s)")
+# 估算分词：单个中日韩字符 / 连续字母 / 连续数字 / 单个其他符号
+_TOKEN_UNIT = re.compile(f"[{_CJK}]|[^\\W\\d_]+|\\d+|[^\\s{_CJK}]")
+
+_tokenizers = {}  # 分词器本地目录 -> 分词器（每个进程加载一次；加载失败时为None）
+_resolved = {}  # 分词器名 -> 本地目录（主进程解析一次；无法获得时为None）
+
+
+# 解析分词器的本地目录（在主进程中调用一次）：优先使用本地缓存，未缓存时下载一次；失败时只警告一次并返回None
+def resolve_tokenizer(name: str):
+    if name not in _resolved:
+        path = None
+        try:
+            from transformers import AutoTokenizer
+            try:
+                tokenizer = AutoTokenizer.from_pretrained(name, local_files_only=True)
+            except Exception:
+                tokenizer = AutoTokenizer.from_pretrained(name)
+            if os.path.isdir(name):
+                path = name
+            else:
+                from huggingface_hub import snapshot_download
+                path = snapshot_download(name, local_files_only=True)
+            _tokenizers[path] = tokenizer
+        except Exception as e:
+            print(f"分词器 {name} 加载失败，按字符规则估算词元数：{e}")
+        _resolved[name] = path
+    return _resolved[name]
+
+
+# 从本地目录加载分词器（不访问网络；加载失败时返回None并改用估算）
+def load_tokenizer(path: str):
+    if path not in _tokenizers:
+        tokenizer = None
+        try:
+            from transformers import AutoTokenizer
+            tokenizer = AutoTokenizer.from_pretrained(path, local_files_only=True)
+        except Exception as e:
+            print(f"分词器 {path} 加载失败，按字符规则估算词元数：{e}")
+        _tokenizers[path] = tokenizer
+    return _tokenizers[path]
+
+
+# 拼接两段文本（中日韩文字之间不加空格）
+def _join(left: str, right: str) -> str:
+    if not left:
+        return right
+    if _CJK_CHAR.match(left[-1]) and _CJK_CHAR.match(right[0]):
+        return left + right
+    return f"{left} {right}"
+
+
+# 按词元预算切分文本：以句子为单位装箱，可跨页合并，记录每个片段的起止页码
+class TextChunker:
+    """
+    max_tokens: 每个片段的词元上限（应不超过嵌入模型的最大序列长度减去[CLS]/[SEP]，超出部分会被模型截断）
+    overlap_tokens: 相邻片段重叠的词元数（以整句为单位，不超过该值）
+    tokenizer_name: 嵌入模型的分词器（如 sentence-transformers/all-MiniLM-L6-v2）；为None或加载失败时按字符规则估算
+                    （在主进程中解析一次，见 prepare()）
+    merge_pages: 是否允许片段跨页（短页合并为一个片段，减少过小的片段）
+    strategy: "tokens"（按词元预算分句装箱，默认）或 "chars"（旧版按固定字符数切分，每页独立，用于对比）
+    """
+
+    def __init__(self, max_tokens: int = 254, overlap_tokens: int = 32, tokenizer_name: str = None,
+                 merge_pages: bool = True, strategy: str = "tokens", chunk_chars: int = 500, overlap_chars: int = 50):
+        self.max_tokens = max_tokens
+        self.overlap_tokens = overlap_tokens
+        self.tokenizer_name = tokenizer_name
+        self.tokenizer_path = None  # 分词器的本地目录（由prepare()在主进程中解析，随切分器传给解析子进程）
+        self._prepared = tokenizer_name is None
+        self.merge_pages = merge_pages
+        self.strategy = strategy
+        self.chunk_chars = chunk_chars
+        self.overlap_chars = overlap_chars
+
+    # 解析分词器的本地目录（传给解析子进程前在主进程中调用；子进程只从该目录加载，不访问网络）
+    def prepare(self):
+        if not self._prepared:
+            self.tokenizer_path = resolve_tokenizer(self.tokenizer_name)
+            self._prepared = True
+        return self
+
+    # 文本中每个词元的字符区间 [(起, 止), ...]
+    def token_spans(self, text: str) -> list:
+        tokenizer = load_tokenizer(self.tokenizer_path) if self.prepare().tokenizer_path else None
+        if tokenizer is not None and getattr(tokenizer, "is_fast", False):
+            encoding = tokenizer(text, add_special_tokens=False, return_offsets_mapping=True, truncation=False)
+            return [span for span in encoding["offset_mapping"] if span[1] > span[0]]
+        spans = []
+        for match in _TOKEN_UNIT.finditer(text):
+            start, end = match.span()
+            # WordPiece会把长单词/长数字拆成多个子词：单词按每6个字符、数字按每3位估算一个词元
+            unit = match.group(0)
+            step = 6 if unit.isalpha() else 3 if unit.isdigit() else end - start
+            spans.extend((piece, min(piece + step, end)) for piece in range(start, end, step))
+        return spans
+
+    # 词元数
+    def count_tokens(self, text: str) -> int:
+        return len(self.token_spans(text))
+
+    # 规范化页面文本：合并换行（中日韩文字之间的换行直接去掉），压缩空白
+    @staticmethod
+    def _normalize(text: str) -> str:
+        text = re.sub(f"(?<=[{_CJK}])\\s*\\n\\s*(?=[{_CJK}])", "", text)
+        return re.sub(r"\s+", " ", text).strip()
+
+    # 分句，返回句子的字符区间
+    @staticmethod
+    def _sentence_spans(text: str) -> list:
+        spans = []
+        start = 0
+        for match in _SENTENCE_END.finditer(text):
+            spans.append((start, match.end()))
+            start = match.end()
+        spans.append((start, len(text)))
+        return [(s, e) for s, e in spans if text[s:e].strip()]
+
+    # 页面 -> 句子单元 [(文本, 词元数, 页码), ...]；超过预算的长句按词元边界拆开
+    def _units(self, page_num: int, text: str) -> list:
+        text = self._normalize(text)
+        if not text:
+            return []
+        token_starts = [start for start, _ in self.token_spans(text)]
+        units = []
+        for start, end in self._sentence_spans(text):
+            first, last = bisect.bisect_left(token_starts, start), bisect.bisect_left(token_starts, end)
+            while last - first > self.max_tokens:
+                split = token_starts[first + self.max_tokens]
+                units.append((text[start:split].strip(), self.max_tokens, page_num))
+                start, first = split, first + self.max_tokens
+            if text[start:end].strip():
+                units.append((text[start:end].strip(), last - first, page_num))
+        return units
+
+    # 切分整篇文档，返回 [{"text": 片段文本, "page": 起始页, "page_end": 结束页}, ...]
+    def chunk_pages(self, pages: list) -> list:
+        """
+        pages: [(页码, 页面文本), ...]
+        """
+        if self.strategy == "chars":
+            return [{"text": chunk, "page": page_num, "page_end": page_num}
+                    for page_num, text in pages for chunk in self._split_chars(text)]
+
+        chunks = []
+        current = []  # 当前片段的句子单元
+        current_tokens = 0
+
+        def flush():
+            text = ""
+            for unit_text, _, _ in current:
+                text = _join(text, unit_text)
+            chunks.append({"text": text, "page": current[0][2], "page_end": current[-1][2]})
+
+        for page_num, page_text in pages:
+            if current and not self.merge_pages:
+                flush()
+                current, current_tokens = [], 0
+            for unit in self._units(page_num, page_text):
+                if current and current_tokens + unit[1] > self.max_tokens:
+                    flush()
+                    # 下一片段以上一片段末尾的整句开头（重叠部分不超过 overlap_tokens）
+                    overlap, overlap_tokens = [], 0
+                    for previous in reversed(current):
+                        if overlap_tokens + previous[1] > self.overlap_tokens or \
+                                overlap_tokens + previous[1] + unit[1] > self.max_tokens:
+                            break
+                        overlap.insert(0, previous)
+                        overlap_tokens += previous[1]
+                    current, current_tokens = overlap, overlap_tokens
+                current.append(unit)
+                current_tokens += unit[1]
+        if current:
+            flush()
+        return chunks
+
+    # 旧版切分：固定字符数窗口（带重叠）
+    def _split_chars(self, text: str) -> list:
+        chunks = []
+        start = 0
+        while start < len(text):
+            end = start + self.chunk_chars
+            chunk = text[start:end].strip()
+            if chunk:
+                chunks.append(chunk)
+            start = end - self.overlap_chars
+        return chunks
\ No newline at end of file
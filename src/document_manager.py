@@ -1,187 +1,656 @@
 import os
+import json
+import time
 import shutil
 import uuid
-from PyPDF2 import PdfReader
+import threading
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+import multiprocessing
 from src.embedding import EmbeddingModels
 from src.vector_db import VectorDB
+from src.query_cache import LRUCache, normalize_query
+from src.pdf_parser import ParsedDocument
+from src.keyword_index import KeywordIndex
+from src.paper_registry import PaperRegistry, file_sha256
+from src.uploads import move_into_place
+from src.metrics import metrics
+from src.chunker import TextChunker
+
+
+# 辅助函数：将已解析的文档切分为片段 [{"text": 片段文本, "page": 起始页, "page_end": 结束页}, ...]
+def build_chunks(parsed: ParsedDocument, chunker: TextChunker) -> list:
+    # 全部页面按词元预算分句装箱（短页可合并，片段记录起止页码），并记录切分耗时
+    pages = parsed.pages
+    start = time.perf_counter()
+    chunks = chunker.chunk_pages(pages)
+    parsed.chunk_seconds = time.perf_counter() - start
+    return chunks
+
+
+# 记录解析阶段指标（子进程中的解析在父进程收到结果后记录）
+def _record_parse_metrics(parsed: ParsedDocument, chunks: list):
+    for seconds in parsed.page_seconds:
+        metrics.observe("pdf_page_extract_seconds", seconds)
+    metrics.inc("pdf_pages_total", len(parsed.page_seconds))
+    metrics.observe("pdf_chunk_seconds", parsed.chunk_seconds)
+    metrics.inc("pdf_chunks_total", len(chunks))
+
+
+# 进程池工作函数：解析PDF并拆分片段（在子进程中执行，不加载任何模型；分词器从主进程解析的本地目录加载一次）
+def _parse_worker(pdf_path: str, chunker: TextChunker):
+    parsed = ParsedDocument.from_file(pdf_path)
+    return parsed, build_chunks(parsed, chunker)
 
 
 class DocumentManager:
-    def __init__(self, paper_root: str = "./data/papers"):
+    _topic_cache = {}  # 主题嵌入内存缓存（进程内共享）
+
+    _topic_lock = threading.Lock()
+
+    def __init__(self, paper_root: str = "./data/papers", topic_cache_path: str = "./data/topic_embeddings.json",
+                 vector_db: VectorDB = None, embedding_model: EmbeddingModels = None,
+                 keyword_index_path: str = "./data/keyword_index",
+                 registry_path: str = "./data/paper_registry.sqlite3"):
         self.paper_root = paper_root
-        self.embedding_model = EmbeddingModels()
-        self.vector_db = VectorDB()
+        self.incoming_dir = os.path.join(paper_root, ".incoming")  # 上传暂存目录（与论文目录同一文件系统，入库时原子改名）
+        self.topic_cache_path = topic_cache_path  # 主题嵌入磁盘缓存
+        self.embedding_model = embedding_model or EmbeddingModels()
+        self.vector_db = vector_db or VectorDB()  # 可注入共享实例（见 src/services.py）
         self.collection_name = "paper_collection"  # 论文向量集合名
-        self.chunk_size = 500  # 文本片段大小（字符）
-        self.overlap = 50  # 片段重叠字符（避免语义割裂）
+        self.summary_collection_name = "paper_summary_collection"  # 论文级向量集合名（每篇论文一个片段质心）
+        self.paper_candidates = 3  # 分层检索时先取 n_results 倍数的候选论文（质心为近似表示，适当多取）
+        self.chunks_per_paper = 3  # 分层检索结果中每篇论文保留的匹配片段数
+        self.keyword_index = KeywordIndex(keyword_index_path)  # 片段的BM25倒排索引（关键词/混合检索）
+        self.rrf_k = 60  # 混合检索的倒数排名融合常数
+        self.registry = PaperRegistry(registry_path)  # 内容哈希登记表（重复入库时直接返回已有论文）
+        self.result_cache = LRUCache(max_size=512, ttl_seconds=300)  # 搜索结果缓存（集合写入后自动失效）
+        # 论文库写锁：入库（放入文件到完成登记）与库同步互斥，避免同步把正在入库的文件当作新文件重复索引
+        self.library_lock = threading.RLock()
+        # 文本切分：按嵌入模型的词元上限（减去[CLS]/[SEP]）分句装箱，短页可合并，片段记录起止页码
+        self.chunker = TextChunker(
+            max_tokens=getattr(self.embedding_model, "text_max_tokens", 256) - 2,
+            overlap_tokens=32,
+            tokenizer_name=getattr(self.embedding_model, "tokenizer_name", None)
+        )
 
         # 初始化论文根目录
         os.makedirs(self.paper_root, exist_ok=True)
 
-    # 增强版PDF文本提取：按页码拆分片段（保留页码+文本映射）
-    def extract_pdf_with_pages(self, pdf_path: str) -> list:
+    # 提取PDF文本并切分为片段（保留起止页码）
+    def extract_chunks(self, pdf_path: str, parsed: ParsedDocument = None) -> list:
         """
-        提取PDF文本并按页码拆分片段
-        返回格式：[{"page": 页码, "text": 页面文本, "chunks": 文本片段列表}, ...]
+        传入已解析的文档时不再重复解析
+        返回格式：[{"text": 片段文本, "page": 起始页, "page_end": 结束页}, ...]
         """
         if not os.path.exists(pdf_path) or not pdf_path.endswith(".pdf"):
             return []
         try:
-            reader = PdfReader(pdf_path)
-            page_data = []
-            # 提取所有页（不再限制前10页，保证搜索完整性）
-            for page_num, page in enumerate(reader.pages, start=1):
-                page_text = page.extract_text() or ""
-                if not page_text:
-                    continue
-                # 拆分页面文本为片段（避免单页文本过长）
-                chunks = self._split_text_to_chunks(page_text)
-                page_data.append({
-                    "page": page_num,
-                    "text": page_text,
-                    "chunks": chunks
-                })
-            return page_data
+            if parsed is None:
+                parsed = ParsedDocument.from_file(pdf_path)
+            chunks = build_chunks(parsed, self.chunker)
+            _record_parse_metrics(parsed, chunks)
+            return chunks
         except Exception as e:
+            metrics.inc("errors_total", stage="pdf_extract")
             print(f"PDF文本提取失败：{e}")
             return []
 
-    # 辅助函数：拆分文本为固定大小的片段（带重叠）
-    def _split_text_to_chunks(self, text: str) -> list:
-        chunks = []
-        start = 0
-        text_len = len(text)
-        while start < text_len:
-            end = start + self.chunk_size
-            chunk = text[start:end].strip()
-            if chunk:
-                chunks.append(chunk)
-            # 移动起始位置（保留重叠）
-            start = end - self.overlap
-        return chunks
-
-    # 计算余弦相似度（用于论文分类）
-    def _cosine_similarity(self, vec1: list, vec2: list) -> float:
-        import numpy as np
-        vec1 = np.array(vec1)
-        vec2 = np.array(vec2)
-        if np.linalg.norm(vec1) == 0 or np.linalg.norm(vec2) == 0:
-            return 0.0
-        return np.dot(vec1, vec2) / (np.linalg.norm(vec1) * np.linalg.norm(vec2))
+    # 读取磁盘上的主题嵌入缓存
+    def _load_topic_cache(self):
+        if not os.path.exists(self.topic_cache_path):
+            return {}
+        try:
+            with open(self.topic_cache_path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except Exception as e:
+            print(f"主题嵌入缓存读取失败：{e}")
+            return {}
+
+    # 获取主题嵌入矩阵（内存+磁盘缓存，键为“模型名::主题文本”，只编码未缓存的主题）
+    def _get_topic_embeddings(self, topics: list) -> np.ndarray:
+        cache = DocumentManager._topic_cache
+        model_name = self.embedding_model.text_model_name
+        keys = [f"{model_name}::{topic}" for topic in topics]
+        with DocumentManager._topic_lock:
+            if not cache:
+                cache.update(self._load_topic_cache())
+            missing = [topic for topic, key in zip(topics, keys) if key not in cache]
+            if missing:
+                embeddings = self.embedding_model.get_text_embeddings(missing)
+                for topic, embedding in zip(missing, embeddings):
+                    cache[f"{model_name}::{topic}"] = embedding.tolist()
+                # 原子写入磁盘缓存
+                tmp_path = f"{self.topic_cache_path}.tmp"
+                with open(tmp_path, "w", encoding="utf-8") as f:
+                    json.dump(cache, f, ensure_ascii=False)
+                os.replace(tmp_path, self.topic_cache_path)
+            return np.array([cache[key] for key in keys], dtype=np.float32)
+
+    # 辅助函数：按行L2归一化
+    @staticmethod
+    def _normalize(matrix: np.ndarray) -> np.ndarray:
+        norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+        return matrix / np.where(norms == 0, 1, norms)
+
+    # 论文向量：归一化片段嵌入的均值池化（覆盖全文，而非被截断的前几百个词）
+    @classmethod
+    def _paper_embedding(cls, chunk_embeddings: np.ndarray) -> np.ndarray:
+        return cls._normalize(cls._normalize(chunk_embeddings).mean(axis=0))
 
     # 自动分类论文（根据指定主题）
-    def classify_paper(self, pdf_path: str, topics: list) -> str:
-        # 提取全文本用于分类（兼容旧逻辑）
-        page_data = self.extract_pdf_with_pages(pdf_path)
-        full_text = "\n".join([p["text"] for p in page_data])
-        if not full_text or not topics:
+    def classify_paper(self, pdf_path: str, topics: list, chunk_embeddings: np.ndarray = None,
+                       parsed: ParsedDocument = None) -> str:
+        if not topics:
+            return "Unclassified"
+        # 未传入片段嵌入时自行提取并编码（单独调用分类时使用）
+        if chunk_embeddings is None:
+            chunks = [chunk["text"] for chunk in self.extract_chunks(pdf_path, parsed)]
+            chunk_embeddings = self.embedding_model.get_text_embeddings(chunks)
+        if len(chunk_embeddings) == 0:
             return "Unclassified"
-        # 生成论文文本嵌入
-        text_embedding = self.embedding_model.get_text_embedding(full_text)
-        # 生成每个主题的嵌入
-        topic_embeddings = [self.embedding_model.get_text_embedding(topic) for topic in topics]
-        # 计算相似度，返回最匹配的主题
-        similarities = [self._cosine_similarity(text_embedding, te) for te in topic_embeddings]
-        return topics[similarities.index(max(similarities))]
+        doc_embedding = self._paper_embedding(chunk_embeddings)
+        # 一次矩阵乘法计算与所有主题的余弦相似度
+        similarities = self._normalize(self._get_topic_embeddings(topics)) @ doc_embedding
+        return topics[int(np.argmax(similarities))]
 
     # 添加单篇论文（按片段存入向量库，保留页码）
-    def add_paper(self, pdf_path: str, topics: list) -> str:
+    def add_paper(self, pdf_path: str, topics: list, parsed: ParsedDocument = None, chunks: list = None,
+                  timings: dict = None, content_hash: str = None, tag: str = None, file_name: str = None,
+                  move: bool = False) -> str:
+        """
+        timings: 可选字典，传入时记录各阶段耗时（秒）：embed / classify / store
+        content_hash: 文件的SHA-256（上传时边接收边计算；未传入时使用解析结果中的哈希或重新计算）
+        tag: 可选标签；文件已在库中时只为已有论文添加该标签
+        file_name: 库中文件名的基础名（上传的暂存文件传入原始文件名；默认取 pdf_path 的文件名）
+        move: 为True时将文件移入分类目录（上传的暂存文件），否则复制并保留原文件
+        """
+        timings = {} if timings is None else timings
         # 验证PDF文件
         if not os.path.isfile(pdf_path) or not pdf_path.endswith(".pdf"):
             return f"错误：{pdf_path} 不是有效的PDF文件"
 
-        # 提取带页码的文本片段
-        page_data = self.extract_pdf_with_pages(pdf_path)
-        if not page_data:
+        # 内容相同的文件已在库中：不再解析与嵌入，直接返回已有位置
+        if content_hash is None:
+            content_hash = parsed.content_hash if parsed is not None else file_sha256(pdf_path)
+        existing = self.find_existing(content_hash)
+        if existing is not None:
+            return self._existing_result(content_hash, existing, tag)
+
+        # 提取带页码的文本片段（复用上传校验或并行解析阶段的结果）
+        if chunks is None:
+            chunks = self.extract_chunks(pdf_path, parsed)
+        if not chunks:
             return f"错误：无法提取{pdf_path}的文本内容"
 
-        # 分类论文
-        topic = self.classify_paper(pdf_path, topics)
+        # 所有片段批量编码（替代逐片段单独编码）
+        stage_start = time.perf_counter()
+        all_documents = [chunk["text"] for chunk in chunks]  # 存储完整片段
+        all_embeddings = self.embedding_model.get_text_embeddings(all_documents)
+        timings["embed"] = round(time.perf_counter() - stage_start, 4)
+
+        # 分类论文（复用片段嵌入，无需重新编码全文）
+        stage_start = time.perf_counter()
+        topic = self.classify_paper(pdf_path, topics, chunk_embeddings=all_embeddings)
+        timings["classify"] = round(time.perf_counter() - stage_start, 4)
+        stage_start = time.perf_counter()
         topic_dir = os.path.join(self.paper_root, topic)
         os.makedirs(topic_dir, exist_ok=True)
 
-        # 复制文件到分类目录（保留原文件）
-        file_name = os.path.basename(pdf_path)
-        file_base, file_ext = os.path.splitext(file_name)
+        # 放入分类目录：暂存的上传文件直接改名移入，其余复制（保留原文件）
+        file_base, file_ext = os.path.splitext(file_name or os.path.basename(pdf_path))
         dest_file_name = f"{file_base}_{uuid.uuid4().hex[:8]}{file_ext}"
         dest_path = os.path.join(topic_dir, dest_file_name)
-        shutil.copy2(pdf_path, dest_path)
-
-        # 按片段存入向量数据库（核心改造）
-        all_ids = []
-        all_embeddings = []
-        all_metadatas = []
-        all_documents = []
-
-        for page in page_data:
-            page_num = page["page"]
-            page_text = page["text"]
-            for chunk in page["chunks"]:
-                # 生成唯一ID（关联论文+页码+片段）
-                chunk_id = f"paper_{uuid.uuid4().hex}_page{page_num}"
-                # 生成片段嵌入
-                chunk_embedding = self.embedding_model.get_text_embedding(chunk)
-                # 组装数据
-                all_ids.append(chunk_id)
-                all_embeddings.append(chunk_embedding)
-                all_metadatas.append({
-                    "path": dest_path,
-                    "topic": topic,
-                    "file_name": dest_file_name,
-                    "page": page_num  # 存储页码
-                })
-                all_documents.append(chunk)  # 存储完整片段（而非前500字符）
+        with self.library_lock:
+            # 加锁后再次检查：并发入库的同一文件（如两个上传请求、后台任务与上传同时处理）只有一个写入
+            existing = self.find_existing(content_hash)
+            if existing is not None:
+                return self._existing_result(content_hash, existing, tag)
+            if move:
+                move_into_place(pdf_path, dest_path)
+            else:
+                shutil.copy2(pdf_path, dest_path)
+            chunk_count = self._store_paper(dest_path, topic, chunks, all_embeddings, content_hash,
+                                            [tag] if tag else [])
+            if chunk_count is None:
+                # 写入失败：移入的文件放回原位、复制的文件删除，库中不留下未索引的文件
+                if move:
+                    move_into_place(dest_path, pdf_path)
+                else:
+                    os.unlink(dest_path)
+                return f"错误：{pdf_path} 写入向量数据库失败"
+        timings["store"] = round(time.perf_counter() - stage_start, 4)
+        for stage, seconds in timings.items():
+            metrics.observe("ingest_stage_seconds", seconds, stage=stage)
+
+        return f"成功：论文已分类到【{topic}】目录，路径：{dest_path}（拆分{chunk_count}个片段）"
+
+    # 内容已在库中时（按内容哈希查登记，不访问文件路径）为已有论文添加标签并返回结果信息，否则返回None
+    def add_existing(self, content_hash: str, tag: str = None):
+        existing = self.find_existing(content_hash)
+        if existing is None:
+            return None
+        return self._existing_result(content_hash, existing, tag)
+
+    # 文件已在库中时的处理结果（传入标签时为已有论文添加该标签）
+    def _existing_result(self, content_hash: str, existing: dict, tag: str = None) -> str:
+        if tag:
+            existing = self.registry.add_tag(content_hash, tag)
+        tags = f"，标签：{'、'.join(existing['tags'])}" if existing["tags"] else ""
+        return f"成功：论文已存在于【{existing['topic']}】目录，路径：{existing['path']}（内容相同，未重复入库{tags}）"
+
+    # 为已在论文目录中的文件建立索引（库同步发现的新文件：不复制、不分类，分类取所在目录）
+    def index_paper(self, pdf_path: str, topic: str, parsed: ParsedDocument = None, chunks: list = None,
+                    content_hash: str = None) -> str:
+        if chunks is None:
+            chunks = self.extract_chunks(pdf_path, parsed)
+        if not chunks:
+            return f"错误：无法提取{pdf_path}的文本内容"
+        if content_hash is None:
+            content_hash = parsed.content_hash if parsed is not None else file_sha256(pdf_path)
+        with metrics.timed("ingest_stage_seconds", stage="embed"):
+            embeddings = self.embedding_model.get_text_embeddings([chunk["text"] for chunk in chunks])
+        with self.library_lock, metrics.timed("ingest_stage_seconds", stage="store"):
+            chunk_count = self._store_paper(pdf_path, topic, chunks, embeddings, content_hash, [])
+        if chunk_count is None:
+            return f"错误：{pdf_path} 写入向量数据库失败"
+        return f"成功：已索引【{topic}】目录中的 {pdf_path}（拆分{chunk_count}个片段）"
+
+    # 按片段存入向量数据库、关键词索引与论文级向量，并登记内容哈希，返回片段数
+    # 向量库写入失败时回滚已写入的片段并返回None（不登记，重新上传或同步时会再次入库）
+    def _store_paper(self, path: str, topic: str, chunks: list, embeddings: np.ndarray, content_hash: str,
+                     tags: list):
+        file_name = os.path.basename(path)
+        documents = [chunk["text"] for chunk in chunks]
+        # ID关联论文+页码+片段
+        paper_id = f"paper_{uuid.uuid4().hex}"
+        ids = [f"{paper_id}_page{chunk['page']}_{i}" for i, chunk in enumerate(chunks)]
+        metadatas = [{
+            "path": path,
+            "topic": topic,
+            "file_name": file_name,
+            "page": chunk["page"],  # 起始页码
+            "page_end": chunk["page_end"],  # 结束页码（片段跨页时大于起始页码）
+            "paper_id": paper_id  # 所属论文（分层检索按此过滤片段）
+        } for chunk in chunks]
+        if not ids:
+            return 0
 
         # 批量添加到向量库
-        if all_ids:
-            self.vector_db.add_data(
-                collection_name=self.collection_name,
-                ids=all_ids,
-                embeddings=all_embeddings,
-                metadatas=all_metadatas,
-                documents=all_documents
-            )
+        if not self.vector_db.add_data(
+            collection_name=self.collection_name,
+            ids=ids,
+            embeddings=embeddings,
+            metadatas=metadatas,
+            documents=documents
+        ):
+            return None
+        # 论文级向量（片段质心），供分层检索先选论文
+        stored = self.vector_db.upsert_data(
+            collection_name=self.summary_collection_name,
+            ids=[paper_id],
+            embeddings=[self._paper_embedding(embeddings).tolist()],
+            metadatas=[{
+                "path": path,
+                "topic": topic,
+                "file_name": file_name,
+                "paper_id": paper_id,
+                "chunk_count": len(ids)
+            }],
+            documents=[file_name]
+        )
+        if not stored:
+            self.vector_db.delete_data(self.collection_name, ids=ids)
+            return None
+        self.keyword_index.add(ids, documents, metadatas)
+        self.registry.register(content_hash, path, topic, paper_id, file_name, tags)
+        return len(ids)
 
-        return f"成功：论文已分类到【{topic}】目录，路径：{dest_path}（拆分{len(all_ids)}个片段）"
+    # 解析多篇论文（workers>1时在进程池中并行解析与分片，结果按完成顺序流式返回）
+    def parse_papers(self, pdf_paths: list, workers: int = 1):
+        """
+        逐个产出 (pdf_path, parsed, chunks, error)；解析失败时 parsed 与 chunks 为 None
+        """
+        workers = min(workers, len(pdf_paths))
+        if workers <= 1:
+            for pdf_path in pdf_paths:
+                try:
+                    parsed, chunks = _parse_worker(pdf_path, self.chunker)
+                except Exception as e:
+                    metrics.inc("errors_total", stage="pdf_extract")
+                    yield pdf_path, None, None, e
+                    continue
+                _record_parse_metrics(parsed, chunks)
+                yield pdf_path, parsed, chunks, None
+            return
+
+        # 使用spawn启动子进程：不继承父进程已加载的模型与线程；分词器先在本进程解析为本地目录，子进程不访问网络
+        self.chunker.prepare()
+        context = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(max_workers=workers, mp_context=context) as executor:
+            path_iter = iter(pdf_paths)
+            pending = {}
+
+            # 控制在途任务数量，避免解析速度远超嵌入速度时占用过多内存
+            def submit_next():
+                pdf_path = next(path_iter, None)
+                if pdf_path is not None:
+                    future = executor.submit(_parse_worker, pdf_path, self.chunker)
+                    pending[future] = pdf_path
+
+            for _ in range(workers * 2):
+                submit_next()
+            while pending:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    pdf_path = pending.pop(future)
+                    submit_next()
+                    try:
+                        parsed, chunks = future.result()
+                    except Exception as e:
+                        metrics.inc("errors_total", stage="pdf_extract")
+                        yield pdf_path, None, None, e
+                        continue
+                    _record_parse_metrics(parsed, chunks)
+                    yield pdf_path, parsed, chunks, None
+
+    # 批量添加论文：子进程并行解析，父进程统一完成嵌入与写入（模型只加载一次）
+    def add_papers(self, pdf_paths: list, topics: list, workers: int = 1, tag: str = None):
+        """
+        逐个产出 (pdf_path, 处理结果)，顺序为解析完成顺序（已在库中的文件不参与解析，最先返回）
+        """
+        valid_paths = []
+        for pdf_path in pdf_paths:
+            if not os.path.isfile(pdf_path) or not pdf_path.endswith(".pdf"):
+                yield pdf_path, f"错误：{pdf_path} 不是有效的PDF文件"
+                continue
+            content_hash = file_sha256(pdf_path)
+            if self.find_existing(content_hash) is not None:
+                yield pdf_path, self.add_paper(pdf_path, topics, content_hash=content_hash, tag=tag)
+            else:
+                valid_paths.append(pdf_path)
+
+        for pdf_path, parsed, chunks, error in self.parse_papers(valid_paths, workers):
+            if error is not None:
+                print(f"PDF文本提取失败：{error}")
+                yield pdf_path, f"错误：无法提取{pdf_path}的文本内容"
+                continue
+            yield pdf_path, self.add_paper(pdf_path, topics, parsed=parsed, chunks=chunks, tag=tag)
 
     # 批量整理论文文件夹
-    def batch_organize(self, folder_path: str, topics: list) -> str:
+    def batch_organize(self, folder_path: str, topics: list, workers: int = 1, tag: str = None) -> str:
         if not os.path.isdir(folder_path):
             return f"错误：{folder_path} 不是有效的文件夹"
 
-        results = []
+        file_paths = []
         for file_name in os.listdir(folder_path):
             file_path = os.path.join(folder_path, file_name)
             if file_name.endswith(".pdf") and os.path.isfile(file_path):
-                result = self.add_paper(file_path, topics)
-                results.append(f"{file_name}: {result}")
-        return "\n".join(results)
+                file_paths.append(file_path)
+
+        # 按原始文件顺序输出结果
+        results = dict(self.add_papers(file_paths, topics, workers, tag=tag))
+        return "\n".join(f"{os.path.basename(path)}: {results[path]}" for path in file_paths)
+
+    # 按内容哈希查找库中已有的论文（登记的文件已被删除时清除登记，返回None）
+    def find_existing(self, content_hash: str):
+        existing = self.registry.lookup(content_hash)
+        if existing is not None and not os.path.isfile(existing["path"]):
+            self.registry.remove(content_hash)
+            return None
+        return existing
+
+    # 从库中删除论文：片段向量、论文级向量、关键词索引、登记记录与文件（delete_file=False时保留文件）
+    def remove_paper(self, path: str, delete_file: bool = True) -> int:
+        with self.library_lock:
+            chunk_ids = self.vector_db.get_ids(self.collection_name, where={"path": path})
+            self.vector_db.delete_data(self.collection_name, ids=chunk_ids)
+            self.vector_db.delete_data(self.summary_collection_name, where={"path": path})
+            self.keyword_index.delete(chunk_ids)
+            entry = self.registry.lookup_path(path)
+            if entry is not None:
+                self.registry.remove(entry["sha256"])
+            if delete_file and os.path.isfile(path):
+                os.unlink(path)
+        return len(chunk_ids)
+
+    # 论文文件在库中被移动或改名：只改写各索引中的路径/分类/文件名，不重新解析与嵌入，返回片段数
+    def move_paper(self, old_path: str, new_path: str, topic: str) -> int:
+        file_name = os.path.basename(new_path)
+        changes = {"path": new_path, "topic": topic, "file_name": file_name}
+        with self.library_lock:
+            chunks = self.vector_db.get_metadatas(self.collection_name, where={"path": old_path})
+            self.vector_db.update_metadata(self.collection_name, chunks["ids"],
+                                           [dict(meta, **changes) for meta in chunks["metadatas"]])
+            papers = self.vector_db.get_metadatas(self.summary_collection_name, where={"path": old_path})
+            self.vector_db.update_metadata(self.summary_collection_name, papers["ids"],
+                                           [dict(meta, **changes) for meta in papers["metadatas"]])
+            self.keyword_index.update_metadata(chunks["ids"], changes)
+            entry = self.registry.lookup_path(old_path)
+            if entry is not None:
+                self.registry.update_location(entry["sha256"], new_path, topic, file_name)
+        return len(chunks["ids"])
 
     # 增强版语义搜索：返回匹配片段+页码
-    def search_paper(self, query: str, n_results: int = 5) -> list:
-        # 生成查询嵌入
-        query_embedding = self.embedding_model.get_text_embedding(query)
-        if not query_embedding:
-            return []
+    def search_paper(self, query: str, n_results: int = 5, mode: str = "hierarchical") -> list:
+        """
+        mode: "hierarchical"（先选论文再排其片段，每篇论文一条结果，附带matches）
+              "flat"（全部片段直接top-k）
+              "keyword"（BM25关键词检索，无需模型推理；similarity为BM25分数）
+              "hybrid"（向量与BM25排名的倒数排名融合；similarity为融合分数）
+        """
+        return self.search_papers_batch([query], n_results, mode)[0]
+
+    # 批量语义搜索：未命中缓存的查询一次批量编码、一次向量查询，按输入顺序返回每个查询的结果列表
+    def search_papers_batch(self, queries: list, n_results: int = 5, mode: str = "hierarchical") -> list:
+        if mode not in ("hierarchical", "flat", "keyword", "hybrid"):
+            raise ValueError(f"不支持的搜索模式：{mode}")
+        # 结果缓存键包含集合版本号，集合有新写入时旧结果自然失效
+        version = self.vector_db.collection_version(self.collection_name)
+        cache_keys = [(normalize_query(query), n_results, mode, version) for query in queries]
+        results_by_key = {}
+        misses = {}
+        for cache_key, query in zip(cache_keys, queries):
+            if cache_key in results_by_key or cache_key in misses:
+                continue
+            cached = self.result_cache.get(cache_key)
+            if cached is not None:
+                results_by_key[cache_key] = cached
+            elif cache_key[0]:
+                misses[cache_key] = query
+            else:
+                results_by_key[cache_key] = []  # 空查询
+
+        if misses:
+            miss_queries = list(misses.values())
+            if mode == "keyword":
+                search_results = [self._search_keyword(query, n_results) for query in miss_queries]
+            else:
+                query_embeddings = self.embedding_model.get_text_query_embeddings(miss_queries)
+                if mode == "hybrid":
+                    search_results = self._search_hybrid(miss_queries, query_embeddings, n_results)
+                # 尚无论文级向量（旧数据未执行 build_paper_index）时退回全片段检索
+                elif mode == "hierarchical" and self.vector_db.count(self.summary_collection_name) > 0:
+                    search_results = self._search_hierarchical(query_embeddings, n_results)
+                else:
+                    search_results = [[self._format_chunk(*hit) for hit in hits]
+                                      for hits in self._vector_hits(query_embeddings, n_results)]
+            for cache_key, results in zip(misses, search_results):
+                self.result_cache.put(cache_key, results)
+                results_by_key[cache_key] = results
+        return [[dict(result) for result in results_by_key[cache_key]] for cache_key in cache_keys]
+
+    # 格式化片段结果（新增片段+页码）
+    @staticmethod
+    def _format_chunk(chunk_id: str, meta: dict, document: str, similarity: float) -> dict:
+        return {
+            "file_name": meta["file_name"],
+            "path": meta["path"],
+            "topic": meta["topic"],
+            "page": meta["page"],  # 返回匹配的页码
+            "page_end": meta.get("page_end", meta["page"]),  # 片段跨页时的结束页码（旧数据无此字段）
+            "matched_chunk": document,  # 返回匹配的文本片段
+            "similarity": round(similarity, 4)  # 相关度（向量检索为0-1的相似度）
+        }
 
-        # 查询向量数据库
+    # 全片段向量检索：一次向量查询，返回每个查询的 [(片段ID, 元数据, 文本, 相似度), ...]
+    def _vector_hits(self, query_embeddings: list, n_results: int) -> list:
         results = self.vector_db.query(
             collection_name=self.collection_name,
-            query_embeddings=[query_embedding],
+            query_embeddings=query_embeddings,
             n_results=n_results
         )
+        return [[(results["ids"][q][i], results["metadatas"][q][i], results["documents"][q][i],
+                  1 - results["distances"][q][i]) for i in range(len(results["ids"][q]))]
+                for q in range(len(query_embeddings))]
+
+    # 关键词检索（BM25）
+    def _search_keyword(self, query: str, n_results: int) -> list:
+        return [self._format_chunk(hit["id"], hit["metadata"], hit["document"], hit["score"])
+                for hit in self.keyword_index.search(query, n_results)]
+
+    # 混合检索：向量与BM25各取候选，按倒数排名融合（RRF）重新排序
+    def _search_hybrid(self, queries: list, query_embeddings: list, n_results: int) -> list:
+        depth = max(n_results * 4, 20)
+        all_vector_hits = self._vector_hits(query_embeddings, depth)
+        all_results = []
+        for query, vector_hits in zip(queries, all_vector_hits):
+            keyword_hits = [(hit["id"], hit["metadata"], hit["document"])
+                            for hit in self.keyword_index.search(query, depth)]
+            fused = {}  # 片段ID -> [融合分数, 元数据, 文本]
+            for hits in (vector_hits, keyword_hits):
+                for rank, (chunk_id, meta, document, *_) in enumerate(hits):
+                    entry = fused.setdefault(chunk_id, [0.0, meta, document])
+                    entry[0] += 1 / (self.rrf_k + rank + 1)
+            ranked = sorted(fused.items(), key=lambda item: item[1][0], reverse=True)[:n_results]
+            all_results.append([self._format_chunk(chunk_id, meta, document, score)
+                                for chunk_id, (score, meta, document) in ranked])
+        return all_results
+
+    # 分层检索：先在论文级集合中选出候选论文，再只在这些论文的片段中排序，结果按论文分组
+    def _search_hierarchical(self, query_embeddings: list, n_results: int) -> list:
+        paper_results = self.vector_db.query(
+            collection_name=self.summary_collection_name,
+            query_embeddings=query_embeddings,
+            n_results=n_results * self.paper_candidates
+        )
+        all_results = []
+        for q, query_embedding in enumerate(query_embeddings):
+            paper_ids = paper_results["ids"][q]
+            if not paper_ids:
+                all_results.append([])
+                continue
+            results = self.vector_db.query(
+                collection_name=self.collection_name,
+                query_embeddings=[query_embedding],
+                n_results=len(paper_ids) * self.chunks_per_paper,
+                where={"paper_id": {"$in": paper_ids}}
+            )
+            # 片段按相似度降序返回，每篇论文第一次出现的片段即其最佳匹配
+            grouped = {}
+            for i in range(len(results["ids"][0])):
+                meta = results["metadatas"][0][i]
+                match = {
+                    "page": meta["page"],
+                    "page_end": meta.get("page_end", meta["page"]),
+                    "matched_chunk": results["documents"][0][i],
+                    "similarity": round(1 - results["distances"][0][i], 4)
+                }
+                paper = grouped.get(meta["paper_id"])
+                if paper is None:
+                    grouped[meta["paper_id"]] = paper = dict(
+                        match,
+                        file_name=meta["file_name"],
+                        path=meta["path"],
+                        topic=meta["topic"],
+                        paper_id=meta["paper_id"],
+                        matches=[]
+                    )
+                if len(paper["matches"]) < self.chunks_per_paper:
+                    paper["matches"].append(match)
+            all_results.append(list(grouped.values())[:n_results])
+        return all_results
+
+    # 为已有片段补建论文级向量（旧版本入库的片段没有paper_id，按文件路径归组并补写元数据）
+    def build_paper_index(self, batch_size: int = 1000) -> str:
+        total = self.vector_db.count(self.collection_name)
+        collection = self.vector_db.get_collection(self.collection_name)
+        papers = {}  # paper_id -> {"sum": 归一化片段嵌入之和, "count": 片段数, "meta": 元数据}
+        path_ids = {}  # 旧片段：文件路径 -> 新分配的paper_id
+        updated_ids, updated_metadatas = [], []
+        for offset in range(0, total, batch_size):
+            batch = collection.get(include=["embeddings", "metadatas"], limit=batch_size, offset=offset)
+            embeddings = self._normalize(np.asarray(batch["embeddings"], dtype=np.float32))
+            for chunk_id, embedding, meta in zip(batch["ids"], embeddings, batch["metadatas"]):
+                paper_id = meta.get("paper_id")
+                if not paper_id:
+                    paper_id = path_ids.setdefault(meta["path"], f"paper_{uuid.uuid4().hex}")
+                    updated_ids.append(chunk_id)
+                    updated_metadatas.append(dict(meta, paper_id=paper_id))
+                paper = papers.setdefault(paper_id, {"sum": np.zeros_like(embedding), "count": 0, "meta": meta})
+                paper["sum"] += embedding
+                paper["count"] += 1
+
+        for start in range(0, len(updated_ids), batch_size):
+            self.vector_db.update_metadata(self.collection_name, updated_ids[start:start + batch_size],
+                                           updated_metadatas[start:start + batch_size])
+        paper_ids = list(papers)
+        for start in range(0, len(paper_ids), batch_size):
+            batch_ids = paper_ids[start:start + batch_size]
+            self.vector_db.upsert_data(
+                collection_name=self.summary_collection_name,
+                ids=batch_ids,
+                embeddings=[self._normalize(papers[p]["sum"] / papers[p]["count"]).tolist() for p in batch_ids],
+                metadatas=[{
+                    "path": papers[p]["meta"]["path"],
+                    "topic": papers[p]["meta"]["topic"],
+                    "file_name": papers[p]["meta"]["file_name"],
+                    "paper_id": p,
+                    "chunk_count": papers[p]["count"]
+                } for p in batch_ids],
+                documents=[papers[p]["meta"]["file_name"] for p in batch_ids]
+            )
+        return f"成功：已建立{len(paper_ids)}篇论文的论文级向量（补写{len(updated_ids)}个旧片段的paper_id）"
+
+    # 为已入库的片段补建关键词索引（已索引的片段自动跳过）
+    def build_keyword_index(self, batch_size: int = 1000) -> str:
+        collection = self.vector_db.get_collection(self.collection_name)
+        total = self.vector_db.count(self.collection_name)
+        before = self.keyword_index.count()
+        for offset in range(0, total, batch_size):
+            batch = collection.get(include=["metadatas", "documents"], limit=batch_size, offset=offset)
+            self.keyword_index.add(batch["ids"], batch["documents"], batch["metadatas"])
+        self.result_cache.clear()
+        return f"成功：关键词索引新增{self.keyword_index.count() - before}个片段（共{self.keyword_index.count()}个）"
+
+    # 为论文目录中已入库的文件建立内容哈希登记（按修改时间保留最早的副本，其余视为重复）
+    def build_paper_registry(self, remove_duplicates: bool = False) -> str:
+        pdf_paths = [os.path.join(root, file_name) for root, _, files in os.walk(self.paper_root)
+                     if os.path.commonpath([root, self.incoming_dir]) != os.path.normpath(self.incoming_dir)
+                     for file_name in files if file_name.endswith(".pdf")]
+        pdf_paths.sort(key=os.path.getmtime)
+        registered, duplicates, unindexed = 0, [], 0
+        for pdf_path in pdf_paths:
+            content_hash = file_sha256(pdf_path)
+            existing = self.find_existing(content_hash)
+            if existing is not None:
+                if existing["path"] != pdf_path:
+                    duplicates.append(pdf_path)
+                continue
+            # 从片段元数据中取分类与paper_id（未入库的文件不登记）
+            chunk = self.vector_db.get_collection(self.collection_name).get(
+                where={"path": pdf_path}, limit=1, include=["metadatas"])
+            if not chunk["ids"]:
+                unindexed += 1
+                continue
+            meta = chunk["metadatas"][0]
+            self.registry.register(content_hash, pdf_path, meta["topic"], meta.get("paper_id"), meta["file_name"])
+            registered += 1
 
-        # 格式化结果（新增片段+页码）
-        search_results = []
-        for i in range(len(results["ids"][0])):
-            meta = results["metadatas"][0][i]
-            distance = results["distances"][0][i]
-            search_results.append({
-                "file_name": meta["file_name"],
-                "path": meta["path"],
-                "topic": meta["topic"],
-                "page": meta["page"],  # 返回匹配的页码
-                "matched_chunk": results["documents"][0][i],  # 返回匹配的文本片段
-                "similarity": round(1 - distance, 4)  # 相似度（0-1）
-            })
-        return search_results
\ No newline at end of file
+        if remove_duplicates:
+            for pdf_path in duplicates:
+                self.remove_paper(pdf_path)
+            self.result_cache.clear()
+        action = "已删除" if remove_duplicates else "未删除，可加 --remove_duplicates 删除"
+        return (f"成功：新登记{registered}篇论文，发现{len(duplicates)}个重复副本（{action}），"
+                f"{unindexed}个文件未入库")
\ No newline at end of file
@@ -1,44 +1,345 @@
-import torch
-import clip
+import os
+import time
+import hashlib
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
 from PIL import Image
-from sentence_transformers import SentenceTransformer
+from src.query_cache import LRUCache, normalize_query
+from src.embedding_cache import EmbeddingCache
+from src.metrics import metrics
+from src.paper_registry import file_sha256
 
-# 单例模式加载模型，避免重复加载
+_REVISION_FILE_EXT = (".json", ".txt", ".model", ".bin", ".safetensors", ".pt")  # 参与模型版本指纹的权重与配置文件
+
+
+# 读取当前进程常驻内存（字节）；非Linux平台返回None
+def _current_rss_bytes():
+    try:
+        with open("/proc/self/statm", "r") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+# 图像内容SHA-256（读取失败返回None：该图像不查缓存，解码时再报告错误）
+def _image_digest(image_path: str):
+    try:
+        return file_sha256(image_path)
+    except OSError:
+        return None
+
+
+# 单例模式管理模型：每个模型在首次使用时才加载（torch/clip/sentence_transformers 也延迟导入）
 class EmbeddingModels:
+    text_model_name = "all-MiniLM-L6-v2"
+    clip_model_name = "ViT-B/32"
+    text_max_tokens = 256  # 文本模型的最大序列长度（超出部分被截断，文档切分按此预算）
+    tokenizer_name = "sentence-transformers/all-MiniLM-L6-v2"  # 文本模型的分词器（文档切分计算词元数）
     _instance = None
+    _lock = threading.Lock()
     _text_model = None
     _clip_model = None
     _clip_preprocess = None
+    _clip_device = None
+    _load_stats = {}  # 模型名 -> 加载耗时与内存增量
+    query_cache = LRUCache(max_size=2048, ttl_seconds=3600)  # 查询嵌入缓存，键为 (模型名, 规范化查询文本)
+    embedding_cache_path = "./data/embedding_cache.sqlite3"  # 持久化嵌入缓存（设为None关闭）
+    embedding_cache_max_bytes = 2 * 1024 ** 3  # 持久化嵌入缓存容量上限
+    embedding_cache_read_only = False  # 只读打开持久化嵌入缓存（多进程服务的只读进程，见 ServiceContainer.configure_role）
+    _embedding_cache = None
+    _revisions = {}  # 模型名 -> 版本指纹
 
     def __new__(cls):
         if cls._instance is None:
-            cls._instance = super().__new__(cls)
-            # 加载文本嵌入模型
-            cls._text_model = SentenceTransformer('all-MiniLM-L6-v2')
-            # 加载 CLIP 模型（图文匹配）
-            device = "cuda" if torch.cuda.is_available() else "cpu"
-            cls._clip_model, cls._clip_preprocess = clip.load("ViT-B/32", device=device)
-            cls._clip_device = device
+            with cls._lock:
+                if cls._instance is None:
+                    cls._instance = super().__new__(cls)
         return cls._instance
 
-    # 生成文本嵌入（返回列表）
+    # 加载模型并记录耗时与常驻内存增量
+    @classmethod
+    def _load_with_stats(cls, key: str, model_name: str, loader):
+        rss_before = _current_rss_bytes()
+        start = time.perf_counter()
+        result = loader()
+        rss_after = _current_rss_bytes()
+        cls._load_stats[key] = {
+            "model": model_name,
+            "load_seconds": round(time.perf_counter() - start, 3),
+            "rss_delta_mb": round((rss_after - rss_before) / (1024 * 1024), 1) if rss_before is not None else None
+        }
+        return result
+
+    # 文本嵌入模型（首次访问时加载）
+    @property
+    def text_model(self):
+        cls = EmbeddingModels
+        if cls._text_model is None:
+            with cls._lock:
+                if cls._text_model is None:
+                    def load():
+                        from sentence_transformers import SentenceTransformer
+                        return SentenceTransformer(cls.text_model_name)
+                    cls._text_model = cls._load_with_stats("text", cls.text_model_name, load)
+        return cls._text_model
+
+    # CLIP 模型（图文匹配，首次访问时加载）
+    @property
+    def clip_model(self):
+        cls = EmbeddingModels
+        if cls._clip_model is None:
+            with cls._lock:
+                if cls._clip_model is None:
+                    def load():
+                        import torch
+                        import clip
+                        device = "cuda" if torch.cuda.is_available() else "cpu"
+                        model, preprocess = clip.load(cls.clip_model_name, device=device)
+                        return model, preprocess, device
+                    model, preprocess, device = cls._load_with_stats("clip", cls.clip_model_name, load)
+                    cls._clip_preprocess = preprocess
+                    cls._clip_device = device
+                    cls._clip_model = model
+        return cls._clip_model
+
+    # 加载全部模型权重但不执行推理（多进程服务在fork前调用，子进程以写时复制方式共享权重并继承版本指纹）
+    def preload(self):
+        self.text_model
+        self.clip_model
+        self._model_revision(self.text_model_name)
+        self._model_revision(self.clip_model_name)
+
+    # 已加载模型的加载耗时与内存增量
+    def get_load_stats(self) -> dict:
+        return dict(EmbeddingModels._load_stats)
+
+    # 持久化嵌入缓存（首次访问时打开；embedding_cache_path为None时返回None）
+    @property
+    def embedding_cache(self):
+        cls = EmbeddingModels
+        if cls._embedding_cache is None and cls.embedding_cache_path:
+            with cls._lock:
+                if cls._embedding_cache is None:
+                    cls._embedding_cache = EmbeddingCache(cls.embedding_cache_path, cls.embedding_cache_max_bytes,
+                                                          read_only=cls.embedding_cache_read_only)
+        return cls._embedding_cache
+
+    # 持久化嵌入缓存统计（未打开时返回None）
+    @classmethod
+    def embedding_cache_stats(cls):
+        return cls._embedding_cache.stats() if cls._embedding_cache is not None else None
+
+    # 模型的本地权重与配置文件（只查找文件、不加载模型；尚未下载时返回空列表）
+    def _model_files(self, model_name: str) -> list:
+        if model_name == self.clip_model_name:
+            # clip.load 的默认下载位置：~/.cache/clip/<模型名中的"/"与"@"替换为"-">.pt
+            path = model_name if os.path.isfile(model_name) else os.path.join(
+                os.path.expanduser("~/.cache/clip"), model_name.replace("/", "-").replace("@", "-") + ".pt")
+            return [path] if os.path.isfile(path) else []
+        model_dir = model_name
+        if not os.path.isdir(model_dir):
+            # sentence-transformers 从 Hugging Face 缓存加载（不含"/"的模型名属于 sentence-transformers 组织）
+            try:
+                from huggingface_hub import snapshot_download
+                repo_id = model_name if "/" in model_name else f"sentence-transformers/{model_name}"
+                model_dir = snapshot_download(repo_id, cache_dir=os.getenv("SENTENCE_TRANSFORMERS_HOME"),
+                                              local_files_only=True)
+            except Exception:
+                return []
+        files = []
+        for root, _, names in os.walk(model_dir):
+            files.extend(os.path.join(root, name) for name in names if name.endswith(_REVISION_FILE_EXT))
+        return sorted(files)
+
+    # 模型版本指纹：模型名 + 本地权重与配置文件的内容哈希（不执行推理，与运行设备无关；权重变化时旧缓存自动失效）
+    def _model_revision(self, model_name: str) -> str:
+        revision = EmbeddingModels._revisions.get(model_name)
+        if revision is None:
+            files = self._model_files(model_name)
+            sha = hashlib.sha1(model_name.encode("utf-8"))
+            for path in files:
+                sha.update(os.path.basename(path).encode("utf-8"))
+                sha.update(file_sha256(path).encode("ascii"))
+            revision = sha.hexdigest()[:16]
+            # 模型文件尚未下载时不记录（首次加载模型后重新计算）
+            if files:
+                EmbeddingModels._revisions[model_name] = revision
+        return revision
+
+    # 生成文本嵌入（返回列表；用于查询，结果按规范化文本缓存）
     def get_text_embedding(self, text):
-        embedding = self._text_model.encode(text, convert_to_numpy=True)
-        return embedding.tolist()  # 数组转列表
+        cache_key = (self.text_model_name, normalize_query(text))
+        cached = self.query_cache.get(cache_key)
+        if cached is not None:
+            return cached
+        embedding = self.get_text_embeddings([text])[0].tolist()  # 数组转列表
+        self.query_cache.put(cache_key, embedding)
+        return embedding
+
+    # 批量生成文本嵌入（先查持久化缓存，只编码未命中的文本；返回float32连续矩阵，行顺序与输入一致）
+    def get_text_embeddings(self, texts: list, batch_size: int = 64) -> np.ndarray:
+        cache = self.embedding_cache
+        if cache is None or not texts:
+            return self._encode_texts(texts, batch_size)
+        digests = [hashlib.sha256(text.encode("utf-8")).hexdigest() for text in texts]
+        revision = self._model_revision(self.text_model_name)
+        found = cache.get_many(self.text_model_name, revision, digests)
+        missing = {}
+        for text, digest in zip(texts, digests):
+            if digest not in found:
+                missing.setdefault(digest, text)
+        if missing:
+            encoded = self._encode_texts(list(missing.values()), batch_size)
+            revision = self._model_revision(self.text_model_name)  # 首次加载时模型文件刚下载，重新计算指纹
+            cache.put_many(self.text_model_name, revision, list(zip(missing, encoded)))
+            found.update(zip(missing, encoded))
+        return np.stack([found[digest] for digest in digests]).astype(np.float32, copy=False)
+
+    # 编码文本（按长度排序分批编码，减少填充）
+    def _encode_texts(self, texts: list, batch_size: int = 64) -> np.ndarray:
+        text_model = self.text_model
+        dim = text_model.get_sentence_embedding_dimension()
+        embeddings = np.empty((len(texts), dim), dtype=np.float32)
+        order = sorted(range(len(texts)), key=lambda i: len(texts[i]), reverse=True)
+        for start in range(0, len(order), batch_size):
+            batch_idx = order[start:start + batch_size]
+            batch_start = time.perf_counter()
+            embeddings[batch_idx] = text_model.encode(
+                [texts[i] for i in batch_idx],
+                batch_size=batch_size,
+                convert_to_numpy=True,
+                show_progress_bar=False
+            )
+            self._record_batch("text", len(batch_idx), time.perf_counter() - batch_start)
+        return embeddings
+
+    # 记录一批嵌入的耗时与条数
+    @staticmethod
+    def _record_batch(model: str, size: int, seconds: float):
+        metrics.observe("embedding_batch_seconds", seconds, model=model)
+        metrics.observe("embedding_item_seconds", seconds / max(size, 1), model=model)
+        metrics.inc("embedding_items_total", size, model=model)
+
+    # 读取图像并预处理为CLIP输入张量（JPEG按模型输入分辨率以draft模式降采样解码，避免全分辨率解码）
+    def _load_image_tensor(self, image_path: str):
+        resolution = getattr(getattr(self.clip_model, "visual", None), "input_resolution", 224)
+        with metrics.timed("image_decode_seconds"), Image.open(image_path) as image:
+            image.draft("RGB", (resolution, resolution))
+            return self._clip_preprocess(image.convert("RGB"))
 
     # 生成图像嵌入（返回列表）
     def get_image_embedding(self, image_path):
-        image = Image.open(image_path).convert("RGB")
-        image_input = self._clip_preprocess(image).unsqueeze(0).to(self._clip_device)
-        with torch.no_grad():
-            image_embedding = self._clip_model.encode_image(image_input)
-        # 张量→数组→列表
-        return image_embedding.cpu().numpy().flatten().tolist()
+        embedding = self.get_image_embeddings([image_path], num_workers=1)[0]
+        if embedding is None:
+            raise ValueError(f"无法读取图像：{image_path}")
+        return embedding
+
+    # 批量生成图像嵌入：先查持久化缓存，未命中的由线程池并行解码与预处理（有界预取），按批堆叠后一次前向计算
+    def get_image_embeddings(self, image_paths: list, batch_size: int = 32, num_workers: int = 4,
+                             digests: list = None) -> list:
+        """
+        返回与输入顺序一致的列表，每项为嵌入列表；无法读取的图像对应None
+        digests: 可选的文件内容SHA-256列表（调用方已计算时传入，避免重复读取文件）
+        全部命中缓存时不加载CLIP模型
+        """
+        embeddings = [None] * len(image_paths)
+        if not image_paths:
+            return embeddings
+
+        cache = self.embedding_cache
+        pending_indices = list(range(len(image_paths)))
+        if cache is not None:
+            digests = digests or [_image_digest(path) for path in image_paths]
+            found = cache.get_many(self.clip_model_name, self._model_revision(self.clip_model_name),
+                                   [digest for digest in digests if digest])
+            for index, digest in enumerate(digests):
+                if digest in found:
+                    embeddings[index] = found[digest].tolist()
+            pending_indices = [index for index in pending_indices if embeddings[index] is None]
 
-    # 生成文本的 CLIP 嵌入（返回列表）
+        def load(index):
+            try:
+                return index, self._load_image_tensor(image_paths[index])
+            except Exception as e:
+                metrics.inc("errors_total", stage="image_decode")
+                print(f"图像读取失败（{image_paths[index]}）：{e}")
+                return index, None
+
+        def encode(batch):
+            import torch
+            clip_model = self.clip_model
+            batch_start = time.perf_counter()
+            image_input = torch.stack([tensor for _, tensor in batch]).to(self._clip_device)
+            with torch.no_grad():
+                batch_embeddings = clip_model.encode_image(image_input).cpu().numpy()
+            self._record_batch("clip_image", len(batch), time.perf_counter() - batch_start)
+            for (index, _), embedding in zip(batch, batch_embeddings):
+                embeddings[index] = embedding.tolist()
+            if cache is not None:
+                cache.put_many(self.clip_model_name, self._model_revision(self.clip_model_name),
+                               [(digests[index], embedding) for (index, _), embedding in zip(batch, batch_embeddings)
+                                if digests[index]])
+
+        # 在途的解码任务不超过两个批次，控制预处理张量占用的内存
+        with ThreadPoolExecutor(max_workers=max(1, num_workers)) as executor:
+            next_position = 0
+            pending = deque()
+            batch = []
+            while next_position < len(pending_indices) or pending:
+                while next_position < len(pending_indices) and len(pending) < batch_size * 2:
+                    pending.append(executor.submit(load, pending_indices[next_position]))
+                    next_position += 1
+                index, tensor = pending.popleft().result()
+                if tensor is not None:
+                    batch.append((index, tensor))
+                if len(batch) == batch_size:
+                    encode(batch)
+                    batch = []
+            if batch:
+                encode(batch)
+        return embeddings
+
+    # 批量查缓存：命中的直接返回，未命中的（去重后）合并为一次批量编码
+    def _cached_batch(self, model_name: str, texts: list, encode) -> list:
+        keys = [(model_name, normalize_query(text)) for text in texts]
+        embeddings = {}
+        misses = {}
+        for key, text in zip(keys, texts):
+            if key in embeddings or key in misses:
+                continue
+            cached = self.query_cache.get(key)
+            if cached is not None:
+                embeddings[key] = cached
+            else:
+                misses[key] = text
+        if misses:
+            for key, embedding in zip(misses, encode(list(misses.values()))):
+                self.query_cache.put(key, embedding)
+                embeddings[key] = embedding
+        return [embeddings[key] for key in keys]
+
+    # 批量生成查询文本嵌入（返回列表的列表；与get_text_embedding共用查询缓存）
+    def get_text_query_embeddings(self, texts: list) -> list:
+        return self._cached_batch(self.text_model_name, texts, lambda batch: self.get_text_embeddings(batch).tolist())
+
+    # 生成文本的 CLIP 嵌入（返回列表；按规范化文本缓存）
     def get_clip_text_embedding(self, text):
-        text_input = clip.tokenize([text]).to(self._clip_device)
+        return self.get_clip_text_embeddings([text])[0]
+
+    # 批量生成文本的 CLIP 嵌入（未命中缓存的查询一次前向计算）
+    def get_clip_text_embeddings(self, texts: list) -> list:
+        return self._cached_batch(self.clip_model_name, texts, self._encode_clip_texts)
+
+    def _encode_clip_texts(self, texts: list) -> list:
+        import torch
+        import clip
+        clip_model = self.clip_model
+        batch_start = time.perf_counter()
+        text_input = clip.tokenize(texts, truncate=True).to(self._clip_device)
         with torch.no_grad():
-            text_embedding = self._clip_model.encode_text(text_input)
+            text_embedding = clip_model.encode_text(text_input)
+        self._record_batch("clip_text", len(texts), time.perf_counter() - batch_start)
         # 张量→数组→列表
-        return text_embedding.cpu().numpy().flatten().tolist()
\ No newline at end of file
+        return text_embedding.cpu().numpy().tolist()
\ No newline at end of file
@@ -0,0 +1,127 @@
+import os
+import time
+import sqlite3
+import pathlib
+import threading
+import numpy as np
+
+
+# 持久化嵌入缓存：按（模型名, 模型版本指纹, 输入内容SHA-256）存储float16向量，超过容量时按最近使用时间淘汰
+class EmbeddingCache:
+    def __init__(self, db_path: str = "./data/embedding_cache.sqlite3", max_bytes: int = 2 * 1024 ** 3,
+                 read_only: bool = False):
+        """
+        read_only: 只读打开（多进程服务的只读进程）：只查询，不写入新向量、不刷新最近使用时间，避免多进程争用写锁
+        """
+        self.db_path = db_path
+        self.max_bytes = max_bytes  # 向量数据总字节上限（超过后淘汰到90%）
+        self.read_only = read_only
+        self._lock = threading.RLock()
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+        self._conn = None
+        self._bytes = 0
+        if read_only:
+            self._open_read_only()
+            return
+        db_dir = os.path.dirname(self.db_path)
+        if db_dir:
+            os.makedirs(db_dir, exist_ok=True)
+        self._conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        self._conn.executescript("""
+            PRAGMA journal_mode=WAL;
+            PRAGMA synchronous=NORMAL;
+            CREATE TABLE IF NOT EXISTS embeddings (
+                model TEXT, revision TEXT, digest TEXT, vector BLOB, last_used REAL);
+            CREATE UNIQUE INDEX IF NOT EXISTS embeddings_key ON embeddings (model, revision, digest);
+            CREATE INDEX IF NOT EXISTS embeddings_last_used ON embeddings (last_used);
+        """)
+        self._bytes = self._conn.execute("SELECT COALESCE(SUM(LENGTH(vector)), 0) FROM embeddings").fetchone()[0]
+
+    # 只读连接（数据库由写入进程创建，尚不存在时返回None，按空缓存处理）
+    def _open_read_only(self):
+        if self._conn is None and os.path.isfile(self.db_path):
+            uri = f"{pathlib.Path(os.path.abspath(self.db_path)).as_uri()}?mode=ro"
+            self._conn = sqlite3.connect(uri, uri=True, check_same_thread=False)
+            self._bytes = self._conn.execute("SELECT COALESCE(SUM(LENGTH(vector)), 0) FROM embeddings").fetchone()[0]
+        return self._conn
+
+    # 批量读取，返回 {digest: float32向量}（只包含命中的项），并刷新命中项的最近使用时间（只读模式不刷新）
+    def get_many(self, model: str, revision: str, digests: list) -> dict:
+        found = {}
+        with self._lock:
+            unique = list(dict.fromkeys(digests))
+            conn = self._open_read_only() if self.read_only else self._conn
+            if conn is None:
+                self._misses += len(unique)
+                return found
+            for start in range(0, len(unique), 500):
+                batch = unique[start:start + 500]
+                rows = conn.execute(
+                    f"SELECT rowid, digest, vector FROM embeddings WHERE model = ? AND revision = ? "
+                    f"AND digest IN ({','.join('?' * len(batch))})", [model, revision, *batch]).fetchall()
+                for _, digest, vector in rows:
+                    found[digest] = np.frombuffer(vector, dtype=np.float16).astype(np.float32)
+                if rows and not self.read_only:
+                    now = time.time()
+                    conn.executemany("UPDATE embeddings SET last_used = ? WHERE rowid = ?",
+                                     [(now, rowid) for rowid, _, _ in rows])
+            if not self.read_only:
+                conn.commit()
+            self._hits += len(found)
+            self._misses += len(unique) - len(found)
+        return found
+
+    # 批量写入（items为 [(digest, 向量), ...]），写入后超过容量时淘汰最久未使用的项（只读模式忽略）
+    def put_many(self, model: str, revision: str, items: list):
+        if not items or self.read_only:
+            return
+        now = time.time()
+        rows = [(model, revision, digest, np.asarray(vector, dtype=np.float16).tobytes(), now) for digest, vector in items]
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (model, revision, digest, vector, last_used) VALUES (?, ?, ?, ?, ?)",
+                rows)
+            self._conn.commit()
+            self._bytes += sum(len(row[3]) for row in rows)
+            if self._bytes > self.max_bytes:
+                self._evict()
+
+    # 按最近使用时间从旧到新淘汰，直到总大小降到上限的90%
+    def _evict(self):
+        self._bytes = self._conn.execute("SELECT COALESCE(SUM(LENGTH(vector)), 0) FROM embeddings").fetchone()[0]
+        target = self.max_bytes * 0.9
+        while self._bytes > target:
+            rows = self._conn.execute(
+                "SELECT rowid, LENGTH(vector) FROM embeddings ORDER BY last_used LIMIT 1000").fetchall()
+            if not rows:
+                break
+            removed = []
+            for rowid, size in rows:
+                if self._bytes <= target:
+                    break
+                removed.append((rowid,))
+                self._bytes -= size
+            self._conn.executemany("DELETE FROM embeddings WHERE rowid = ?", removed)
+            self._evictions += len(removed)
+        self._conn.commit()
+
+    # 命中率与占用统计
+    def stats(self) -> dict:
+        with self._lock:
+            total = self._hits + self._misses
+            return {
+                "entries": self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0] if self._conn else 0,
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self._hits,
+                "misses": self._misses,
+                "evictions": self._evictions,
+                "hit_rate": round(self._hits / total, 4) if total else 0.0
+            }
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
\ No newline at end of file
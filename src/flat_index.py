@@ -0,0 +1,353 @@
+import os
+import json
+import sqlite3
+import threading
+import numpy as np
+
+# where条件中的比较运算符 -> SQL运算符
+_WHERE_OPERATORS = {"$eq": "=", "$ne": "!=", "$gt": ">", "$gte": ">=", "$lt": "<", "$lte": "<="}
+
+
+# 将ChromaDB风格的where条件转换为SQL（基于SQLite的json_extract）
+def _where_to_sql(where: dict):
+    clauses, params = [], []
+    for key, condition in where.items():
+        if key in ("$and", "$or"):
+            parts = [_where_to_sql(sub) for sub in condition]
+            joiner = " AND " if key == "$and" else " OR "
+            clauses.append("(" + joiner.join(part[0] for part in parts) + ")")
+            params.extend(param for part in parts for param in part[1])
+            continue
+        if not isinstance(condition, dict):
+            condition = {"$eq": condition}
+        path = f'$."{key}"'
+        for op, value in condition.items():
+            if op in ("$in", "$nin"):
+                placeholders = ",".join("?" * len(value))
+                clauses.append(f"json_extract(metadata, ?) {'NOT IN' if op == '$nin' else 'IN'} ({placeholders})")
+                params.extend([path, *value])
+            else:
+                clauses.append(f"json_extract(metadata, ?) {_WHERE_OPERATORS[op]} ?")
+                params.extend([path, value])
+    return " AND ".join(clauses) or "1", params
+
+
+# 基于NumPy内存映射的精确检索集合（接口与ChromaDB的Collection保持一致）
+class FlatCollection:
+    """
+    存储结构（目录 <root>/）：
+    - seg_XXXXXX.npy：只追加的向量段（写入后不再修改，以 mmap 只读方式加载，多进程共享页缓存）
+    - meta.sqlite3：rows（ID -> 段号/行号/元数据/文档）、tombstones（已删除的段内行）、info（维度/段列表/版本）
+    删除只写墓碑，compact() 时合并段并物理删除
+    """
+
+    def __init__(self, root: str, name: str = None, space: str = "cosine", dtype: str = "float32",
+                 max_segments: int = 16, block_rows: int = 65536):
+        self.root = root
+        self.name = name or os.path.basename(root)
+        self.space = space  # cosine（存储归一化向量）/ ip / l2
+        self.dtype = np.dtype(dtype)
+        self.max_segments = max_segments  # 段数超过该值时自动合并
+        self.block_rows = block_rows  # 查询时每次参与矩阵乘法的行数（控制float16转float32的临时内存）
+        self._lock = threading.RLock()
+        os.makedirs(self.root, exist_ok=True)
+        self._conn = sqlite3.connect(os.path.join(self.root, "meta.sqlite3"), check_same_thread=False)
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS rows (
+                id TEXT PRIMARY KEY, segment INTEGER, row INTEGER, metadata TEXT, document TEXT);
+            CREATE INDEX IF NOT EXISTS rows_position ON rows (segment, row);
+            CREATE TABLE IF NOT EXISTS tombstones (segment INTEGER, row INTEGER);
+            CREATE TABLE IF NOT EXISTS info (key TEXT PRIMARY KEY, value TEXT);
+        """)
+        self._generation = None
+        self._segments = {}  # 段号 -> 内存映射的向量矩阵
+        self._live = {}  # 段号 -> 有效行掩码
+        self._refresh()
+
+    @property
+    def metadata(self) -> dict:
+        return {"backend": "numpy", "space": self.space, "dtype": self.dtype.name}
+
+    # ---------- 元信息 ----------
+    def _get_info(self, key: str, default=None):
+        row = self._conn.execute("SELECT value FROM info WHERE key = ?", (key,)).fetchone()
+        return json.loads(row[0]) if row else default
+
+    def _set_info(self, key: str, value):
+        self._conn.execute("INSERT OR REPLACE INTO info (key, value) VALUES (?, ?)", (key, json.dumps(value)))
+
+    def _segment_path(self, segment: int) -> str:
+        return os.path.join(self.root, f"seg_{segment:06d}.npy")
+
+    # 其他进程写入后（版本号变化）重新加载段列表与墓碑
+    def _refresh(self):
+        generation = self._get_info("generation", 0)
+        if generation == self._generation:
+            return
+        segments = self._get_info("segments", [])
+        self._segments = {seg: self._segments.get(seg) if seg in self._segments
+                          else np.load(self._segment_path(seg), mmap_mode="r") for seg in segments}
+        self._live = {seg: np.ones(len(vectors), dtype=bool) for seg, vectors in self._segments.items()}
+        for seg, row in self._conn.execute("SELECT segment, row FROM tombstones"):
+            if seg in self._live:
+                self._live[seg][row] = False
+        self._generation = generation
+
+    def _commit(self):
+        self._generation = self._get_info("generation", 0) + 1
+        self._set_info("generation", self._generation)
+        self._conn.commit()
+
+    # ---------- 写入 ----------
+    def _prepare(self, embeddings) -> np.ndarray:
+        vectors = np.asarray(embeddings, dtype=np.float32)
+        if vectors.ndim == 1:
+            vectors = vectors[None, :]
+        if self.space == "cosine":
+            vectors = vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+        return vectors
+
+    def add(self, ids: list, embeddings, metadatas: list = None, documents: list = None):
+        with self._lock:
+            self._refresh()
+            existing = self._existing_ids(ids)
+            if existing:
+                # 与ChromaDB一致：已存在的ID忽略
+                print(f"向量集合 {self.name} 中已存在 {len(existing)} 个ID，已忽略")
+            keep = [i for i, item_id in enumerate(ids) if item_id not in existing]
+            if not keep:
+                return
+            vectors = self._prepare(embeddings)[keep]
+            dim = self._get_info("dim")
+            if dim is None:
+                self._set_info("dim", int(vectors.shape[1]))
+            elif dim != vectors.shape[1]:
+                raise ValueError(f"向量维度不匹配：集合为{dim}维，传入{vectors.shape[1]}维")
+
+            # 写入新的只追加段（先写临时文件再改名，避免半写入的段被加载）
+            segment = self._get_info("next_segment", 0)
+            path = self._segment_path(segment)
+            with open(f"{path}.tmp", "wb") as f:
+                np.save(f, vectors.astype(self.dtype))
+            os.replace(f"{path}.tmp", path)
+
+            self._conn.executemany(
+                "INSERT INTO rows (id, segment, row, metadata, document) VALUES (?, ?, ?, ?, ?)",
+                [(ids[i], segment, row,
+                  json.dumps(metadatas[i], ensure_ascii=False) if metadatas else None,
+                  documents[i] if documents else None) for row, i in enumerate(keep)]
+            )
+            self._set_info("segments", self._get_info("segments", []) + [segment])
+            self._set_info("next_segment", segment + 1)
+            self._commit()
+            self._segments[segment] = np.load(path, mmap_mode="r")
+            self._live[segment] = np.ones(len(keep), dtype=bool)
+
+            if len(self._segments) > self.max_segments:
+                self.compact()
+
+    def upsert(self, ids: list, embeddings, metadatas: list = None, documents: list = None):
+        with self._lock:
+            self.delete(ids=ids)
+            self.add(ids=ids, embeddings=embeddings, metadatas=metadatas, documents=documents)
+
+    # 仅更新元数据/文档（向量不变）
+    def update(self, ids: list, metadatas: list = None, documents: list = None, embeddings=None):
+        if embeddings is not None:
+            return self.upsert(ids=ids, embeddings=embeddings, metadatas=metadatas, documents=documents)
+        with self._lock:
+            for i, item_id in enumerate(ids):
+                if metadatas is not None:
+                    self._conn.execute("UPDATE rows SET metadata = ? WHERE id = ?",
+                                       (json.dumps(metadatas[i], ensure_ascii=False), item_id))
+                if documents is not None:
+                    self._conn.execute("UPDATE rows SET document = ? WHERE id = ?", (documents[i], item_id))
+            self._commit()
+
+    # 删除（写墓碑，向量段文件不变）
+    def delete(self, ids: list = None, where: dict = None):
+        with self._lock:
+            self._refresh()
+            positions = []
+            if ids:
+                positions += self._positions_for_ids(ids)
+            if where:
+                where_sql, params = _where_to_sql(where)
+                positions += self._conn.execute(
+                    f"SELECT id, segment, row FROM rows WHERE {where_sql}", params).fetchall()
+            if not positions:
+                return
+            self._conn.executemany("INSERT INTO tombstones (segment, row) VALUES (?, ?)",
+                                   [(seg, row) for _, seg, row in positions])
+            self._conn.executemany("DELETE FROM rows WHERE id = ?", [(item_id,) for item_id, _, _ in positions])
+            self._commit()
+            for _, seg, row in positions:
+                self._live[seg][row] = False
+
+    # 合并所有段的有效行为一个新段，物理删除墓碑与旧段文件
+    def compact(self):
+        with self._lock:
+            self._refresh()
+            old_segments = list(self._segments)
+            if not old_segments:
+                return
+            positions = self._conn.execute("SELECT id, segment, row FROM rows ORDER BY segment, row").fetchall()
+            segment = self._get_info("next_segment", 0)
+            path = self._segment_path(segment)
+            dim = self._get_info("dim")
+            merged = np.empty((len(positions), dim), dtype=self.dtype)
+            position_segments = np.array([seg for _, seg, _ in positions], dtype=np.int64)
+            position_rows = np.array([row for _, _, row in positions], dtype=np.int64)
+            for seg in old_segments:
+                selected = position_segments == seg
+                if selected.any():
+                    merged[selected] = self._segments[seg][position_rows[selected]]
+            with open(f"{path}.tmp", "wb") as f:
+                np.save(f, merged)
+            os.replace(f"{path}.tmp", path)
+
+            self._conn.executemany("UPDATE rows SET segment = ?, row = ? WHERE id = ?",
+                                   [(segment, i, item_id) for i, (item_id, _, _) in enumerate(positions)])
+            self._conn.execute("DELETE FROM tombstones")
+            self._set_info("segments", [segment])
+            self._set_info("next_segment", segment + 1)
+            self._commit()
+            self._segments = {segment: np.load(path, mmap_mode="r")}
+            self._live = {segment: np.ones(len(positions), dtype=bool)}
+            for seg in old_segments:
+                try:
+                    os.remove(self._segment_path(seg))
+                except OSError:
+                    pass  # Windows下仍被其他进程映射时，留待下次合并清理
+
+    # ---------- 读取 ----------
+    def _existing_ids(self, ids: list) -> set:
+        return {row[0] for row in self._positions_for_ids(ids)}
+
+    def _positions_for_ids(self, ids: list) -> list:
+        positions = []
+        for start in range(0, len(ids), 500):
+            batch = ids[start:start + 500]
+            placeholders = ",".join("?" * len(batch))
+            positions += self._conn.execute(
+                f"SELECT id, segment, row FROM rows WHERE id IN ({placeholders})", batch).fetchall()
+        return positions
+
+    def count(self) -> int:
+        return self._conn.execute("SELECT COUNT(*) FROM rows").fetchone()[0]
+
+    # 按ID或where条件读取（顺序为写入顺序）
+    def get(self, ids: list = None, where: dict = None, limit: int = None, offset: int = None,
+            include: list = ("metadatas", "documents")) -> dict:
+        with self._lock:
+            self._refresh()
+            clauses, params = [], []
+            if ids is not None:
+                clauses.append(f"id IN ({','.join('?' * len(ids))})")
+                params += list(ids)
+            if where:
+                where_sql, where_params = _where_to_sql(where)
+                clauses.append(where_sql)
+                params += where_params
+            sql = "SELECT id, segment, row, metadata, document FROM rows"
+            if clauses:
+                sql += " WHERE " + " AND ".join(clauses)
+            sql += " ORDER BY segment, row"
+            if limit is not None or offset is not None:
+                sql += " LIMIT ? OFFSET ?"
+                params += [limit if limit is not None else -1, offset or 0]
+            rows = self._conn.execute(sql, params).fetchall()
+            result = {"ids": [row[0] for row in rows], "embeddings": None, "metadatas": None, "documents": None}
+            if "embeddings" in include:
+                result["embeddings"] = [self._segments[seg][r].astype(np.float32).tolist() for _, seg, r, _, _ in rows]
+            if "metadatas" in include:
+                result["metadatas"] = [json.loads(row[3]) if row[3] else None for row in rows]
+            if "documents" in include:
+                result["documents"] = [row[4] for row in rows]
+            return result
+
+    # 精确top-k检索：逐段分块矩阵乘法，合并各段候选（返回格式与ChromaDB一致）
+    def query(self, query_embeddings, n_results: int = 10, where: dict = None,
+              include: list = ("metadatas", "documents", "distances")) -> dict:
+        with self._lock:
+            self._refresh()
+            queries = self._prepare(query_embeddings)
+            allowed = None
+            if where:
+                where_sql, params = _where_to_sql(where)
+                allowed = {seg: np.zeros(len(mask), dtype=bool) for seg, mask in self._live.items()}
+                for seg, row in self._conn.execute(f"SELECT segment, row FROM rows WHERE {where_sql}", params):
+                    allowed[seg][row] = True
+
+            # 各分块的候选：分数、段号、行号，形状均为 (查询数, k)
+            candidate_scores, candidate_segments, candidate_rows = [], [], []
+            for seg, vectors in self._segments.items():
+                mask = self._live[seg] if allowed is None else self._live[seg] & allowed[seg]
+                if allowed is not None:
+                    # 过滤条件命中的行较少时只读取这些行，而不是扫描整个段
+                    selected = np.flatnonzero(mask)
+                    if len(selected) == 0:
+                        continue
+                    if len(selected) * 4 < len(vectors):
+                        for start in range(0, len(selected), self.block_rows):
+                            block_rows = selected[start:start + self.block_rows]
+                            scores = self._scores(queries, np.asarray(vectors[block_rows], dtype=np.float32))
+                            k = min(n_results, len(block_rows))
+                            top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+                            candidate_scores.append(np.take_along_axis(scores, top, axis=1))
+                            candidate_segments.append(np.full(top.shape, seg))
+                            candidate_rows.append(block_rows[top])
+                        continue
+                for start in range(0, len(vectors), self.block_rows):
+                    block_mask = mask[start:start + self.block_rows]
+                    valid = int(block_mask.sum())
+                    if valid == 0:
+                        continue
+                    block = np.asarray(vectors[start:start + self.block_rows], dtype=np.float32)
+                    scores = self._scores(queries, block)
+                    scores[:, ~block_mask] = -np.inf
+                    k = min(n_results, valid)
+                    top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+                    candidate_scores.append(np.take_along_axis(scores, top, axis=1))
+                    candidate_segments.append(np.full(top.shape, seg))
+                    candidate_rows.append(top + start)
+
+            result = {"ids": [], "distances": [], "metadatas": [], "documents": [], "embeddings": None}
+            if not candidate_scores:
+                for key in ("ids", "distances", "metadatas", "documents"):
+                    result[key] = [[] for _ in queries]
+                return result
+
+            # 合并各分块候选，按分数取最终top-k
+            scores = np.concatenate(candidate_scores, axis=1)
+            segments = np.concatenate(candidate_segments, axis=1)
+            rows = np.concatenate(candidate_rows, axis=1)
+            for q in range(len(queries)):
+                order = [i for i in np.argsort(-scores[q])[:n_results] if np.isfinite(scores[q][i])]
+                ids, metas, docs = [], [], []
+                for i in order:
+                    item_id, metadata, document = self._conn.execute(
+                        "SELECT id, metadata, document FROM rows WHERE segment = ? AND row = ?",
+                        (int(segments[q][i]), int(rows[q][i]))).fetchone()
+                    ids.append(item_id)
+                    metas.append(json.loads(metadata) if metadata else None)
+                    docs.append(document)
+                result["ids"].append(ids)
+                result["distances"].append([self._distance(float(scores[q][i])) for i in order])
+                result["metadatas"].append(metas)
+                result["documents"].append(docs)
+            return result
+
+    # 相似度分数（越大越相似）
+    def _scores(self, queries: np.ndarray, block: np.ndarray) -> np.ndarray:
+        if self.space == "l2":
+            return -(np.sum(queries ** 2, axis=1, keepdims=True) - 2 * queries @ block.T + np.sum(block ** 2, axis=1))
+        return queries @ block.T
+
+    # 分数 -> 与ChromaDB一致的距离（cosine/ip：1 - 点积；l2：平方欧氏距离）
+    def _distance(self, score: float) -> float:
+        return -score if self.space == "l2" else 1 - score
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
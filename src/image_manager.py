@@ -1,69 +1,271 @@
 import os
+import json
 import uuid
+import shutil
+import hashlib
+import threading
 from src.embedding import EmbeddingModels
 from src.vector_db import VectorDB
+from src.paper_registry import file_sha256
+from src.query_cache import LRUCache, normalize_query
+from src.thumbnails import ThumbnailCache
 
 class ImageManager:
-    def __init__(self, image_root: str = "./data/images"):
+    def __init__(self, image_root: str = "./data/images", manifest_path: str = "./data/image_manifest.json",
+                 vector_db: VectorDB = None, embedding_model: EmbeddingModels = None,
+                 thumbnail_root: str = "./data/thumbnails", sync_index: bool = True):
+        """
+        sync_index: 创建时增量同步图像索引；多进程服务的只读进程传False（只读取写入进程维护的清单）
+        """
         self.image_root = image_root
-        self.embedding_model = EmbeddingModels()
-        self.vector_db = VectorDB()
+        self.manifest_path = manifest_path  # 图像索引清单（路径 -> 大小/修改时间/内容哈希/向量ID）
+        self.embedding_model = embedding_model or EmbeddingModels()
+        self.vector_db = vector_db or VectorDB()  # 可注入共享实例（见 src/services.py）
         self.collection_name = "image_collection"  # 图像向量集合名
+        self.result_cache = LRUCache(max_size=512, ttl_seconds=300)  # 搜索结果缓存（集合写入后自动失效）
         self.supported_ext = [".jpg", ".jpeg", ".png", ".gif", ".bmp"]
+        self.thumbnails = ThumbnailCache(thumbnail_root)  # 缩略图缓存（按内容哈希失效）
+        self.grid_thumbnail_size = 256  # 搜索结果网格使用的缩略图尺寸（索引时预先生成）
+        self.embed_batch_size = 32  # 批量编码图像的批大小
+        self.decode_workers = min(4, os.cpu_count() or 1)  # 并行解码与预处理图像的线程数
 
         # 初始化图像目录
         os.makedirs(self.image_root, exist_ok=True)
-        # 首次运行时扫描图像并建立索引
-        self._init_image_index()
+        self._index_lock = threading.Lock()  # 保护索引清单的并发修改
+        self._manifest = self._load_manifest()
+        # 增量同步图像索引（仅处理新增/修改/删除的文件）
+        if sync_index:
+            with self._index_lock:
+                self._init_image_index()
+        elif self._manifest is None:
+            self._manifest = {}
 
-    # 初始化图像索引（扫描所有支持的图像文件）
+    # 重新读取索引清单（其他进程更新索引后调用）
+    def reload_manifest(self):
+        with self._index_lock:
+            self._manifest = self._load_manifest() or {}
+
+    # 读取索引清单（不存在或损坏时返回None）
+    def _load_manifest(self):
+        if not os.path.exists(self.manifest_path):
+            return None
+        try:
+            with open(self.manifest_path, "r", encoding="utf-8") as f:
+                return json.load(f).get("files", {})
+        except Exception as e:
+            print(f"图像索引清单读取失败，将重新建立：{e}")
+            return None
+
+    # 原子写入索引清单（先写临时文件再替换，避免中断导致清单损坏）
+    def _save_manifest(self):
+        manifest_dir = os.path.dirname(self.manifest_path)
+        if manifest_dir:
+            os.makedirs(manifest_dir, exist_ok=True)
+        tmp_path = f"{self.manifest_path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"version": 1, "files": self._manifest}, f, ensure_ascii=False)
+        os.replace(tmp_path, self.manifest_path)
+
+    # 根据路径生成确定性向量ID（同一文件重复索引时覆盖而非新增）
+    @staticmethod
+    def _image_id(path_key: str) -> str:
+        return f"image_{hashlib.sha1(path_key.encode('utf-8')).hexdigest()}"
+
+    # 初始化图像索引：与清单比对，只嵌入新增或内容变化的文件，删除已移除文件的向量
     def _init_image_index(self):
+        # 清单与向量库不一致（如向量库被删除或重建）时，按首次运行重新建立
+        if self._manifest is not None and len(self._manifest) != self.vector_db.count(self.collection_name):
+            print("图像索引清单与向量库不一致，重新建立索引")
+            self._manifest = None
+        first_run = self._manifest is None
+        old_manifest = self._manifest or {}
+        self._manifest = {}
+        changed = first_run
+        to_index = []  # 新增或内容变化、需要重新嵌入的图像 [(路径, stat, 内容哈希), ...]
+
         for root, _, files in os.walk(self.image_root):
             for file_name in files:
-                if any(file_name.lower().endswith(ext) for ext in self.supported_ext):
-                    image_path = os.path.join(root, file_name)
-                    # 避免重复索引（简化：直接添加，可优化为判断元数据）
-                    self.add_image(image_path)
+                if not any(file_name.lower().endswith(ext) for ext in self.supported_ext):
+                    continue
+                image_path = os.path.join(root, file_name)
+                path_key = os.path.normpath(image_path)
+                stat = os.stat(image_path)
+                entry = old_manifest.get(path_key)
+                # 大小与修改时间均未变化：直接复用，无需读取文件
+                if entry and entry["size"] == stat.st_size and entry["mtime_ns"] == stat.st_mtime_ns:
+                    self._manifest[path_key] = entry
+                    continue
+                digest = file_sha256(image_path)
+                # 仅修改时间变化而内容相同：更新清单，不重新嵌入
+                if entry and entry["sha256"] == digest:
+                    self._manifest[path_key] = dict(entry, size=stat.st_size, mtime_ns=stat.st_mtime_ns)
+                else:
+                    to_index.append((image_path, stat, digest))
+                changed = True
+
+        # 批量嵌入（并行解码 + 批量前向计算）
+        self._index_images(to_index)
+
+        # 删除已从磁盘移除的图像向量
+        removed_ids = [entry["id"] for key, entry in old_manifest.items() if key not in self._manifest]
+        if removed_ids:
+            self.vector_db.delete_data(self.collection_name, removed_ids)
+            changed = True
+
+        # 首次建立清单时，清理旧版本以随机ID重复写入的向量
+        if first_run:
+            known_ids = {entry["id"] for entry in self._manifest.values()}
+            stale_ids = [i for i in self.vector_db.get_ids(self.collection_name) if i not in known_ids]
+            self.vector_db.delete_data(self.collection_name, stale_ids)
+
+        if changed:
+            self._save_manifest()
+            # 清理已删除或内容已变化图像的缩略图
+            self.thumbnails.prune({entry["sha256"] for entry in self._manifest.values()})
+
+    # 批量嵌入图像并写入向量库与清单（不落盘清单），返回成功索引的路径集合
+    def _index_images(self, items: list) -> set:
+        indexed = set()
+        for start in range(0, len(items), 1000):
+            batch = items[start:start + 1000]
+            embeddings = self.embedding_model.get_image_embeddings(
+                [image_path for image_path, _, _ in batch],
+                batch_size=self.embed_batch_size,
+                num_workers=self.decode_workers,
+                digests=[digest for _, _, digest in batch]  # 清单已计算的内容哈希，作为嵌入缓存键
+            )
+            ids, vectors, metadatas, documents, entries = [], [], [], [], {}
+            for (image_path, stat, digest), image_embedding in zip(batch, embeddings):
+                if not image_embedding:
+                    continue
+                path_key = os.path.normpath(image_path)
+                image_id = self._image_id(path_key)
+                ids.append(image_id)
+                vectors.append(image_embedding)
+                metadatas.append({"path": image_path, "file_name": os.path.basename(image_path)})
+                documents.append(os.path.basename(image_path))
+                entries[image_path] = (path_key, {
+                    "size": stat.st_size,
+                    "mtime_ns": stat.st_mtime_ns,
+                    "sha256": digest,
+                    "id": image_id
+                })
+                # 预先生成结果网格尺寸的缩略图（其他尺寸在首次请求时生成）
+                try:
+                    self.thumbnails.get(image_path, self.grid_thumbnail_size, digest)
+                except Exception as e:
+                    print(f"缩略图生成失败（{image_path}）：{e}")
+            # 存入向量数据库（确定性ID，重复添加时覆盖）；写入成功后才记入清单，失败的图像下次同步时重试
+            if ids and self.vector_db.upsert_data(
+                collection_name=self.collection_name,
+                ids=ids,
+                embeddings=vectors,
+                metadatas=metadatas,
+                documents=documents
+            ):
+                for image_path, (path_key, entry) in entries.items():
+                    self._manifest[path_key] = entry
+                    indexed.add(image_path)
+        return indexed
 
     # 添加单张图像到向量库
     def add_image(self, image_path: str) -> str:
-        if not os.path.exists(image_path):
-            return f"错误：{image_path} 不存在"
-        # 生成图像嵌入
-        image_embedding = self.embedding_model.get_image_embedding(image_path)
-        if not image_embedding:
-            return f"错误：无法生成{image_path}的嵌入"
-        # 存入向量数据库
-        image_id = f"image_{uuid.uuid4().hex}"
-        self.vector_db.add_data(
-            collection_name=self.collection_name,
-            ids=[image_id],
-            embeddings=[image_embedding],
-            metadatas=[{"path": image_path, "file_name": os.path.basename(image_path)}],
-            documents=[os.path.basename(image_path)]
-        )
-        return f"成功：{image_path} 已添加到图像库"
+        return self.add_images([image_path])[0][1]
+
+    # 批量添加图像：不在图像目录下的文件先复制到图像目录（否则下次同步时会被视为已删除），再批量嵌入
+    def add_images(self, image_paths: list) -> list:
+        """
+        返回 [(输入路径, 结果信息), ...]，顺序与输入一致
+        """
+        results = {}
+        to_index = []
+        image_root = os.path.abspath(self.image_root)
+        for image_path in image_paths:
+            if not os.path.isfile(image_path):
+                results[image_path] = f"错误：{image_path} 不存在"
+                continue
+            if not any(image_path.lower().endswith(ext) for ext in self.supported_ext):
+                results[image_path] = f"错误：{image_path} 不是支持的图像格式"
+                continue
+            dest_path = image_path
+            if os.path.commonpath([image_root, os.path.abspath(image_path)]) != image_root:
+                file_base, file_ext = os.path.splitext(os.path.basename(image_path))
+                dest_path = os.path.join(self.image_root, f"{file_base}_{uuid.uuid4().hex[:8]}{file_ext}")
+                shutil.copy2(image_path, dest_path)
+            to_index.append((image_path, dest_path))
+
+        with self._index_lock:
+            indexed = self._index_images([(dest_path, os.stat(dest_path), file_sha256(dest_path))
+                                          for _, dest_path in to_index])
+            if indexed:
+                self._save_manifest()
+        for image_path, dest_path in to_index:
+            if dest_path in indexed:
+                results[image_path] = f"成功：{dest_path} 已添加到图像库"
+            else:
+                results[image_path] = f"错误：无法生成{image_path}的嵌入"
+        return [(image_path, results[image_path]) for image_path in image_paths]
+
+    # 图像的内容哈希（清单中记录且文件未变化时返回，否则返回None）
+    def image_digest(self, image_path: str):
+        entry = self._manifest.get(os.path.normpath(image_path))
+        if entry is None:
+            return None
+        try:
+            stat = os.stat(image_path)
+        except OSError:
+            return None
+        if entry["size"] == stat.st_size and entry["mtime_ns"] == stat.st_mtime_ns:
+            return entry["sha256"]
+        return None
+
+    # 获取图像缩略图路径（按需生成）
+    def get_thumbnail(self, image_path: str, size: int) -> str:
+        return self.thumbnails.get(image_path, size, self.image_digest(image_path))
 
     # 以文搜图（返回最匹配的图像）
     def search_image(self, query: str, n_results: int = 5) -> list:
-        # 生成查询的CLIP嵌入
-        query_embedding = self.embedding_model.get_clip_text_embedding(query)
-        if not query_embedding:
-            return []
-        # 查询向量数据库
-        results = self.vector_db.query(
-            collection_name=self.collection_name,
-            query_embeddings=[query_embedding],
-            n_results=n_results
-        )
-        # 格式化结果
-        search_results = []
-        for i in range(len(results["ids"][0])):
-            meta = results["metadatas"][0][i]
-            distance = results["distances"][0][i]
-            search_results.append({
-                "file_name": meta["file_name"],
-                "path": meta["path"],
-                "similarity": round(1 - distance, 4)
-            })
-        return search_results
\ No newline at end of file
+        return self.search_images_batch([query], n_results)[0]
+
+    # 批量文本搜索图像：未命中缓存的查询一次批量编码、一次向量查询，按输入顺序返回每个查询的结果列表
+    def search_images_batch(self, queries: list, n_results: int = 5) -> list:
+        # 结果缓存键包含集合版本号，集合有新写入时旧结果自然失效
+        version = self.vector_db.collection_version(self.collection_name)
+        cache_keys = [(normalize_query(query), n_results, version) for query in queries]
+        results_by_key = {}
+        misses = {}
+        for cache_key, query in zip(cache_keys, queries):
+            if cache_key in results_by_key or cache_key in misses:
+                continue
+            cached = self.result_cache.get(cache_key)
+            if cached is not None:
+                results_by_key[cache_key] = cached
+            elif cache_key[0]:
+                misses[cache_key] = query
+            else:
+                results_by_key[cache_key] = []  # 空查询
+
+        if misses:
+            # 生成查询的CLIP嵌入并查询向量数据库
+            query_embeddings = self.embedding_model.get_clip_text_embeddings(list(misses.values()))
+            results = self.vector_db.query(
+                collection_name=self.collection_name,
+                query_embeddings=query_embeddings,
+                n_results=n_results
+            )
+            # 格式化结果
+            for q, cache_key in enumerate(misses):
+                search_results = []
+                for i in range(len(results["ids"][q])):
+                    meta = results["metadatas"][q][i]
+                    distance = results["distances"][q][i]
+                    search_results.append({
+                        "file_name": meta["file_name"],
+                        "path": meta["path"],
+                        "similarity": round(1 - distance, 4)
+                    })
+                self.result_cache.put(cache_key, search_results)
+                results_by_key[cache_key] = search_results
+        # 文件是否存在在返回时检查（不缓存），前端无需逐个请求确认
+        return [[dict(result, exists=os.path.exists(result["path"])) for result in results_by_key[cache_key]]
+                for cache_key in cache_keys]
\ No newline at end of file
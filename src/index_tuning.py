@@ -0,0 +1,119 @@
+import time
+import uuid
+import shutil
+import tempfile
+import itertools
+import numpy as np
+import chromadb
+from chromadb.config import Settings
+from src.vector_db import DEFAULT_INDEX_CONFIG, to_hnsw_metadata
+from src.flat_index import FlatCollection
+
+
+# 读取集合中的全部向量（分批读取；超过max_vectors时只取前max_vectors条）
+def load_collection_vectors(vector_db, collection_name: str, max_vectors: int = 50000,
+                            batch_size: int = 5000) -> np.ndarray:
+    collection = vector_db.get_collection(collection_name)
+    total = min(collection.count(), max_vectors)
+    batches = []
+    for offset in range(0, total, batch_size):
+        batch = collection.get(include=["embeddings"], limit=min(batch_size, total - offset), offset=offset)
+        batches.append(np.asarray(batch["embeddings"], dtype=np.float32))
+    return np.concatenate(batches) if batches else np.zeros((0, 0), dtype=np.float32)
+
+
+# 精确检索（暴力计算），返回每个查询的top-k下标，作为召回率的基准
+def exact_top_k(vectors: np.ndarray, queries: np.ndarray, k: int, space: str = "cosine") -> np.ndarray:
+    if space == "cosine":
+        vectors = vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+        queries = queries / np.maximum(np.linalg.norm(queries, axis=1, keepdims=True), 1e-12)
+    if space == "l2":
+        scores = -(np.sum(queries ** 2, axis=1, keepdims=True) - 2 * queries @ vectors.T + np.sum(vectors ** 2, axis=1))
+    else:
+        scores = queries @ vectors.T
+    top = np.argpartition(-scores, kth=min(k, vectors.shape[0] - 1), axis=1)[:, :k]
+    # 对top-k内部按分数排序
+    order = np.argsort(-np.take_along_axis(scores, top, axis=1), axis=1)
+    return np.take_along_axis(top, order, axis=1)
+
+
+# 在给定向量集上评估多组HNSW参数：召回率@k、查询延迟p50/p99与建索引耗时
+def tune_index(vectors: np.ndarray, k: int = 10, n_queries: int = 100, space: str = None,
+               m_values=(16,), construction_ef_values=(100,), search_ef_values=(10, 50, 100, 200),
+               noise: float = 0.01, seed: int = 0, include_flat: bool = True) -> list:
+    """
+    查询向量从数据向量中随机抽样并加入少量高斯噪声（模拟与库中内容相近的真实查询）
+    返回每组参数一行：{M, construction_ef, search_ef, build_seconds, recall_at_k, p50_ms, p99_ms}
+    include_flat: 额外评估numpy精确检索后端（M等参数列为"flat"），便于与HNSW对比
+    """
+    space = space or DEFAULT_INDEX_CONFIG["space"]
+    rng = np.random.default_rng(seed)
+    n_queries = min(n_queries, len(vectors))
+    k = min(k, len(vectors))
+    sample = vectors[rng.choice(len(vectors), size=n_queries, replace=False)]
+    scale = noise * float(np.mean(np.linalg.norm(vectors, axis=1)))
+    queries = sample + rng.standard_normal(sample.shape).astype(np.float32) * scale / np.sqrt(vectors.shape[1])
+    expected = exact_top_k(vectors, queries, k, space)
+
+    client = chromadb.EphemeralClient(settings=Settings(anonymized_telemetry=False))
+    ids = [str(i) for i in range(len(vectors))]
+    rows = []
+    for m, construction_ef, search_ef in itertools.product(m_values, construction_ef_values, search_ef_values):
+        name = f"tune_{uuid.uuid4().hex[:12]}"
+        config = dict(DEFAULT_INDEX_CONFIG, space=space, M=m, construction_ef=construction_ef, search_ef=search_ef)
+        collection = client.create_collection(name=name, metadata=to_hnsw_metadata(config))
+        start = time.perf_counter()
+        for offset in range(0, len(vectors), 5000):
+            collection.add(ids=ids[offset:offset + 5000], embeddings=vectors[offset:offset + 5000].tolist())
+        build_seconds = time.perf_counter() - start
+
+        latencies = []
+        hits = 0
+        for query, truth in zip(queries, expected):
+            start = time.perf_counter()
+            result = collection.query(query_embeddings=[query.tolist()], n_results=k, include=[])
+            latencies.append((time.perf_counter() - start) * 1000)
+            hits += len(set(int(i) for i in result["ids"][0]) & set(truth.tolist()))
+        client.delete_collection(name=name)
+
+        rows.append(_result_row(m, construction_ef, search_ef, build_seconds, hits, k, latencies))
+
+    if include_flat:
+        rows.append(_benchmark_flat(vectors, queries, expected, ids, k, space))
+    return rows
+
+
+# 评估numpy精确检索后端（在临时目录中建库）
+def _benchmark_flat(vectors: np.ndarray, queries: np.ndarray, expected: np.ndarray, ids: list,
+                    k: int, space: str) -> dict:
+    root = tempfile.mkdtemp(prefix="flat_tune_")
+    try:
+        collection = FlatCollection(root, space=space)
+        start = time.perf_counter()
+        collection.add(ids=ids, embeddings=vectors)
+        build_seconds = time.perf_counter() - start
+
+        latencies = []
+        hits = 0
+        for query, truth in zip(queries, expected):
+            start = time.perf_counter()
+            result = collection.query(query_embeddings=[query], n_results=k, include=[])
+            latencies.append((time.perf_counter() - start) * 1000)
+            hits += len(set(int(i) for i in result["ids"][0]) & set(truth.tolist()))
+        collection.close()
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+    return _result_row("flat", "flat", "flat", build_seconds, hits, k, latencies)
+
+
+# 汇总一组参数的评估结果
+def _result_row(m, construction_ef, search_ef, build_seconds: float, hits: int, k: int, latencies: list) -> dict:
+    return {
+        "M": m,
+        "construction_ef": construction_ef,
+        "search_ef": search_ef,
+        "build_seconds": round(build_seconds, 3),
+        "recall_at_k": round(hits / (k * len(latencies)), 4),
+        "p50_ms": round(float(np.percentile(latencies, 50)), 3),
+        "p99_ms": round(float(np.percentile(latencies, 99)), 3)
+    }
@@ -0,0 +1,258 @@
+import os
+import json
+import time
+import uuid
+import shutil
+import threading
+from collections import deque
+from src.paper_registry import file_sha256
+
+
+class QueueFullError(Exception):
+    """任务队列已满（用于接口层返回背压提示）"""
+
+
+# 后台论文入库任务队列：任务状态持久化到磁盘，进程重启后自动恢复未完成的任务
+class IngestJobQueue:
+    def __init__(self, doc_manager_factory, validator=None, jobs_dir: str = "./data/jobs",
+                 max_queue_size: int = 20, workers: int = 1, parse_workers: int = 1, keep_finished: int = 200):
+        """
+        doc_manager_factory: 返回DocumentManager的可调用对象（每个工作线程调用一次）
+        validator: 可选的PDF校验函数 validator(path, parsed) -> (是否有效, 信息, 解析结果)
+        """
+        self.doc_manager_factory = doc_manager_factory
+        self.validator = validator
+        self.jobs_dir = jobs_dir
+        self.max_queue_size = max_queue_size  # 排队任务上限（超过时拒绝提交）
+        self.parse_workers = parse_workers  # 单个任务内并行解析PDF的进程数
+        self.keep_finished = keep_finished  # 保留的已结束任务记录数
+
+        self._jobs = {}
+        self._pending = deque()
+        self._lock = threading.Lock()
+        self._not_empty = threading.Condition(self._lock)
+
+        self.workers = workers
+        self._threads = []
+        os.makedirs(self.jobs_dir, exist_ok=True)
+
+    # 启动队列：恢复历史任务并启动有界工作线程池（幂等，只在实际处理请求的进程中调用）
+    def start(self):
+        with self._lock:
+            if self._threads:
+                return
+            self._recover_jobs()
+            for i in range(self.workers):
+                thread = threading.Thread(target=self._worker_loop, name=f"ingest-worker-{i}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    # 任务目录与上传文件暂存目录
+    def _job_dir(self, job_id: str) -> str:
+        return os.path.join(self.jobs_dir, job_id)
+
+    def files_dir(self, job_id: str) -> str:
+        return os.path.join(self._job_dir(job_id), "files")
+
+    # 生成新任务ID并创建暂存目录（上传文件先保存到此处，再调用submit提交）
+    def new_job_id(self) -> str:
+        job_id = uuid.uuid4().hex
+        os.makedirs(self.files_dir(job_id), exist_ok=True)
+        return job_id
+
+    # 原子写入任务状态
+    def _save_job(self, job: dict):
+        job_path = os.path.join(self._job_dir(job["id"]), "job.json")
+        tmp_path = f"{job_path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(job, f, ensure_ascii=False)
+        os.replace(tmp_path, job_path)
+
+    # 启动时加载历史任务：排队中/执行中的任务重新入队，未完成的文件重置为待处理
+    def _recover_jobs(self):
+        for job_id in os.listdir(self.jobs_dir):
+            job_path = os.path.join(self._job_dir(job_id), "job.json")
+            if not os.path.isfile(job_path):
+                # 提交前中断留下的暂存目录
+                shutil.rmtree(self._job_dir(job_id), ignore_errors=True)
+                continue
+            try:
+                with open(job_path, "r", encoding="utf-8") as f:
+                    job = json.load(f)
+            except Exception as e:
+                print(f"任务状态读取失败（{job_id}）：{e}")
+                continue
+            self._jobs[job_id] = job
+            if job["status"] in ("queued", "running"):
+                for file_entry in job["files"]:
+                    if file_entry["status"] == "running":
+                        file_entry["status"] = "pending"
+                job["status"] = "queued"
+                self._save_job(job)
+                self._pending.append(job_id)
+        self._pending = deque(sorted(self._pending, key=lambda i: self._jobs[i]["created_at"]))
+        self._prune_finished()
+
+    # 清理过旧的已结束任务记录
+    def _prune_finished(self):
+        finished = [job for job in self._jobs.values() if job["status"] in ("completed", "failed")]
+        finished.sort(key=lambda job: job["created_at"])
+        for job in finished[:max(0, len(finished) - self.keep_finished)]:
+            self._jobs.pop(job["id"], None)
+            shutil.rmtree(self._job_dir(job["id"]), ignore_errors=True)
+
+    # 提交任务（files为[(原始文件名, 暂存路径, 内容哈希), ...]，哈希可为None）；队列已满时抛出QueueFullError
+    def submit(self, job_id: str, files: list, topics: list, skipped: list = None, tag: str = None) -> str:
+        with self._lock:
+            if len(self._pending) >= self.max_queue_size:
+                raise QueueFullError(f"任务队列已满（最多{self.max_queue_size}个排队任务）")
+            job = {
+                "id": job_id,
+                "status": "queued",
+                "topics": topics,
+                "tag": tag,
+                "created_at": time.time(),
+                "started_at": None,
+                "finished_at": None,
+                "message": "",
+                # 上传阶段已判定失败的文件（如超出大小限制）
+                "skipped": skipped or [],
+                "files": [{
+                    "file": file_name,
+                    "path": path,
+                    "sha256": content_hash,
+                    "status": "pending",
+                    "result": "",
+                    "timings": {}
+                } for file_name, path, content_hash in files]
+            }
+            self._jobs[job_id] = job
+            self._save_job(job)
+            self._pending.append(job_id)
+            self._not_empty.notify()
+        return job_id
+
+    # 丢弃未提交的暂存目录（如提交被拒绝时）
+    def discard(self, job_id: str):
+        shutil.rmtree(self._job_dir(job_id), ignore_errors=True)
+
+    # 查询单个任务（包含每个文件的进度、阶段耗时与结果）
+    def get_job(self, job_id: str):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return self._job_view(job) if job else None
+
+    # 列出所有任务摘要（最新的在前）
+    def list_jobs(self) -> list:
+        with self._lock:
+            jobs = sorted(self._jobs.values(), key=lambda job: job["created_at"], reverse=True)
+            return [{
+                "id": job["id"],
+                "status": job["status"],
+                "created_at": job["created_at"],
+                "finished_at": job["finished_at"],
+                "progress": self._progress(job),
+                "message": job["message"]
+            } for job in jobs]
+
+    # 排队中的任务数
+    def queue_size(self) -> int:
+        with self._lock:
+            return len(self._pending)
+
+    @staticmethod
+    def _progress(job: dict) -> dict:
+        done = len([f for f in job["files"] if f["status"] in ("done", "failed")])
+        return {"done": done, "total": len(job["files"])}
+
+    # 对外返回的任务视图（隐藏暂存路径，附带与同步接口一致的details）
+    def _job_view(self, job: dict) -> dict:
+        files = [{key: value for key, value in f.items() if key not in ("path", "sha256")} for f in job["files"]]
+        details = job["skipped"] + [{"file": f["file"], "result": f["result"]} for f in job["files"] if f["result"]]
+        return dict(job, files=files, progress=self._progress(job), details=details)
+
+    # 更新任务状态并持久化
+    def _update(self, job: dict, **fields):
+        with self._lock:
+            job.update(fields)
+            self._save_job(job)
+
+    # 工作线程：循环取出任务执行
+    def _worker_loop(self):
+        doc_manager = None
+        while True:
+            with self._not_empty:
+                while not self._pending:
+                    self._not_empty.wait()
+                job = self._jobs[self._pending.popleft()]
+            if doc_manager is None:
+                doc_manager = self.doc_manager_factory()
+            try:
+                self._run_job(doc_manager, job)
+            except Exception as e:
+                print(f"入库任务执行失败（{job['id']}）：{e}")
+                self._update(job, status="failed", finished_at=time.time(), message=f"任务执行失败: {str(e)}")
+            with self._lock:
+                self._prune_finished()
+
+    # 执行单个任务：并行解析 → 校验 → 嵌入与写入，逐文件记录结果与阶段耗时
+    def _run_job(self, doc_manager, job: dict):
+        self._update(job, status="running", started_at=job["started_at"] or time.time())
+        entries = {f["path"]: f for f in job["files"] if f["status"] == "pending"}
+        for entry in entries.values():
+            entry["status"] = "running"
+        self._update(job)
+
+        # 内容已在库中的文件不解析、不嵌入，直接记录已有位置；按登记的内容哈希判断、不访问暂存路径
+        # （崩溃恢复时暂存文件可能已移入论文库，而文件状态尚未保存）
+        to_parse = []
+        for path, entry in entries.items():
+            if not entry.get("sha256") and os.path.isfile(path):
+                entry["sha256"] = file_sha256(path)
+            result = doc_manager.add_existing(entry["sha256"], tag=job.get("tag")) if entry.get("sha256") else None
+            if result is None:
+                to_parse.append(path)
+                continue
+            status = "failed" if result.startswith("错误") else "done"
+            self._finish_file(job, entry, status, result, {})
+
+        for path, parsed, chunks, error in doc_manager.parse_papers(to_parse, workers=self.parse_workers):
+            entry = entries[path]
+            timings = {}
+            if error is None:
+                timings["parse"] = round(parsed.extract_seconds, 4)
+            if self.validator is not None:
+                start = time.perf_counter()
+                is_valid, message, parsed = self.validator(path, parsed if error is None else None)
+                timings["validate"] = round(time.perf_counter() - start, 4)
+            else:
+                is_valid, message = error is None, str(error)
+
+            if not is_valid:
+                result, status = f"文件验证失败: {message}", "failed"
+            else:
+                try:
+                    # 暂存文件直接移入论文目录（与论文目录同一文件系统时为原子改名）
+                    result = doc_manager.add_paper(path, job["topics"], parsed=parsed, chunks=chunks,
+                                                   timings=timings, content_hash=entry.get("sha256"),
+                                                   tag=job.get("tag"), file_name=entry["file"], move=True)
+                    status = "failed" if result.startswith("错误") else "done"
+                except Exception as e:
+                    result, status = f"处理失败: {str(e)}", "failed"
+            self._finish_file(job, entry, status, result, timings)
+
+        failed = len([f for f in job["files"] if f["status"] == "failed"]) + len(job["skipped"])
+        total = len(job["files"]) + len(job["skipped"])
+        self._update(job, status="completed", finished_at=time.time(),
+                     message=f"批量处理完成：成功{total - failed}个，失败{failed}个")
+        shutil.rmtree(self.files_dir(job["id"]), ignore_errors=True)
+
+    # 记录单个文件的结果并清理其暂存文件
+    def _finish_file(self, job: dict, entry: dict, status: str, result: str, timings: dict):
+        try:
+            os.unlink(entry["path"])
+        except OSError:
+            pass
+        with self._lock:
+            entry.update(status=status, result=result, timings=timings)
+            self._save_job(job)
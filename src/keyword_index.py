@@ -0,0 +1,172 @@
+import os
+import re
+import json
+import math
+import sqlite3
+import threading
+from collections import Counter
+import numpy as np
+
+# 中日韩文字（无空格分词，按相邻二字切分）
+_CJK_PATTERN = re.compile(r"[\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af\uf900-\ufaff]+")
+_WORD_PATTERN = re.compile(r"[^\W_]+")
+
+
+# 分词：拉丁字母/数字按词切分（小写），中日韩文字切分为重叠二元组（单字时保留单字）
+def tokenize(text: str) -> list:
+    tokens = []
+    for word in _WORD_PATTERN.findall(_CJK_PATTERN.sub(lambda m: f" {m.group(0)} ", text.lower())):
+        if _CJK_PATTERN.match(word):
+            tokens.extend([word] if len(word) == 1 else [word[i:i + 2] for i in range(len(word) - 1)])
+        else:
+            tokens.append(word)
+    return tokens
+
+
+# 基于SQLite的BM25倒排索引（入库时增量写入，关键词检索无需模型推理）
+class KeywordIndex:
+    """
+    存储结构（<root>/bm25.sqlite3）：
+    - docs：内部文档号 -> 片段ID/长度（词数）/元数据/文本
+    - postings：词 -> 文档号/词频（按词聚簇，检索时每个查询词一次范围扫描）
+    - info：文档总数与总词数（计算平均长度）
+    """
+
+    def __init__(self, root: str = "./data/keyword_index", k1: float = 1.5, b: float = 0.75):
+        self.root = root
+        self.k1 = k1
+        self.b = b
+        self._lock = threading.RLock()
+        os.makedirs(self.root, exist_ok=True)
+        self._conn = sqlite3.connect(os.path.join(self.root, "bm25.sqlite3"), check_same_thread=False)
+        self._conn.executescript("""
+            PRAGMA journal_mode=WAL;
+            CREATE TABLE IF NOT EXISTS docs (
+                doc INTEGER PRIMARY KEY, id TEXT UNIQUE, length INTEGER, metadata TEXT, document TEXT);
+            CREATE TABLE IF NOT EXISTS postings (
+                term TEXT, doc INTEGER, tf INTEGER, PRIMARY KEY (term, doc)) WITHOUT ROWID;
+            CREATE INDEX IF NOT EXISTS postings_doc ON postings (doc);
+            CREATE TABLE IF NOT EXISTS info (key TEXT PRIMARY KEY, value INTEGER);
+        """)
+
+    def _get_info(self, key: str) -> int:
+        row = self._conn.execute("SELECT value FROM info WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else 0
+
+    def _add_info(self, key: str, delta: int):
+        self._conn.execute("INSERT OR REPLACE INTO info (key, value) VALUES (?, ?)", (key, self._get_info(key) + delta))
+
+    # 已索引的片段数
+    def count(self) -> int:
+        with self._lock:
+            return self._get_info("doc_count")
+
+    # 添加片段（已存在的ID忽略，与向量库行为一致）
+    def add(self, ids: list, documents: list, metadatas: list = None):
+        with self._lock:
+            existing = self._existing_ids(ids)
+            added = 0
+            total_length = 0
+            for i, item_id in enumerate(ids):
+                if item_id in existing:
+                    continue
+                terms = Counter(tokenize(documents[i] or ""))
+                length = sum(terms.values())
+                cursor = self._conn.execute(
+                    "INSERT INTO docs (id, length, metadata, document) VALUES (?, ?, ?, ?)",
+                    (item_id, length, json.dumps(metadatas[i], ensure_ascii=False) if metadatas else None,
+                     documents[i])
+                )
+                self._conn.executemany(
+                    "INSERT INTO postings (term, doc, tf) VALUES (?, ?, ?)",
+                    [(term, cursor.lastrowid, tf) for term, tf in terms.items()]
+                )
+                added += 1
+                total_length += length
+            self._add_info("doc_count", added)
+            self._add_info("total_length", total_length)
+            self._conn.commit()
+
+    # 按ID删除片段
+    def delete(self, ids: list):
+        with self._lock:
+            removed = 0
+            total_length = 0
+            for start in range(0, len(ids), 500):
+                batch = ids[start:start + 500]
+                rows = self._conn.execute(
+                    f"SELECT doc, length FROM docs WHERE id IN ({','.join('?' * len(batch))})", batch).fetchall()
+                for doc, length in rows:
+                    self._conn.execute("DELETE FROM postings WHERE doc = ?", (doc,))
+                    self._conn.execute("DELETE FROM docs WHERE doc = ?", (doc,))
+                    removed += 1
+                    total_length += length
+            self._add_info("doc_count", -removed)
+            self._add_info("total_length", -total_length)
+            self._conn.commit()
+
+    # 按ID改写片段元数据中的字段（如论文移动后的路径/分类；文本与倒排表不变）
+    def update_metadata(self, ids: list, changes: dict):
+        with self._lock:
+            for start in range(0, len(ids), 500):
+                batch = ids[start:start + 500]
+                rows = self._conn.execute(
+                    f"SELECT doc, metadata FROM docs WHERE id IN ({','.join('?' * len(batch))})", batch).fetchall()
+                self._conn.executemany("UPDATE docs SET metadata = ? WHERE doc = ?", [
+                    (json.dumps(dict(json.loads(metadata) if metadata else {}, **changes), ensure_ascii=False), doc)
+                    for doc, metadata in rows])
+            self._conn.commit()
+
+    def _existing_ids(self, ids: list) -> set:
+        existing = set()
+        for start in range(0, len(ids), 500):
+            batch = ids[start:start + 500]
+            existing.update(row[0] for row in self._conn.execute(
+                f"SELECT id FROM docs WHERE id IN ({','.join('?' * len(batch))})", batch))
+        return existing
+
+    # BM25检索，返回 [{"id", "score", "metadata", "document"}, ...]（按分数降序）
+    def search(self, query: str, n_results: int = 5) -> list:
+        with self._lock:
+            doc_count = self._get_info("doc_count")
+            if doc_count == 0:
+                return []
+            avg_length = self._get_info("total_length") / doc_count
+            doc_parts, score_parts = [], []
+            for term in set(tokenize(query)):
+                rows = self._conn.execute(
+                    "SELECT p.doc, p.tf, d.length FROM postings p JOIN docs d ON d.doc = p.doc WHERE p.term = ?",
+                    (term,)).fetchall()
+                if not rows:
+                    continue
+                postings = np.array(rows, dtype=np.float64)
+                idf = math.log(1 + (doc_count - len(rows) + 0.5) / (len(rows) + 0.5))
+                tf, length = postings[:, 1], postings[:, 2]
+                doc_parts.append(postings[:, 0].astype(np.int64))
+                score_parts.append(idf * tf * (self.k1 + 1) / (tf + self.k1 * (1 - self.b + self.b * length / avg_length)))
+            if not doc_parts:
+                return []
+
+            # 合并各查询词的得分（同一文档累加）
+            docs, inverse = np.unique(np.concatenate(doc_parts), return_inverse=True)
+            scores = np.zeros(len(docs))
+            np.add.at(scores, inverse, np.concatenate(score_parts))
+            top = np.argsort(-scores)[:n_results]
+
+            rows = {doc: (item_id, metadata, document) for doc, item_id, metadata, document in self._conn.execute(
+                f"SELECT doc, id, metadata, document FROM docs WHERE doc IN ({','.join('?' * len(top))})",
+                [int(docs[i]) for i in top])}
+            results = []
+            for i in top:
+                item_id, metadata, document = rows[int(docs[i])]
+                results.append({
+                    "id": item_id,
+                    "score": float(scores[i]),
+                    "metadata": json.loads(metadata) if metadata else None,
+                    "document": document
+                })
+            return results
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
\ No newline at end of file
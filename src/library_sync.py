@@ -0,0 +1,225 @@
+import os
+import json
+import time
+import threading
+from src.paper_registry import file_sha256
+from src.metrics import metrics
+
+
+# 论文库增量同步：对比论文目录与持久化清单（路径 -> 大小/修改时间/内容哈希），删除、改写或新增索引
+class LibrarySync:
+    """
+    - 新增：内容未登记的新文件 -> 解析、嵌入并建立索引（分类取所在的一级目录，根目录下的文件为Unclassified）
+    - 移动/改名/换分类：内容已登记但原路径已不存在 -> 只改写路径/分类/文件名元数据，不重新嵌入
+    - 内容变化：同一路径的内容哈希变化 -> 删除旧索引后重新建立
+    - 删除：清单中的文件已不存在 -> 删除其片段向量、论文级向量、关键词索引与登记
+    - 重复副本：内容与库中另一篇论文相同 -> 记入清单但不索引（原文件被删除时由副本接替）
+    大小与修改时间均未变化的文件不读取内容：库无变化时一次同步只需遍历目录并stat每个文件
+    """
+
+    def __init__(self, doc_manager, manifest_path: str = "./data/paper_manifest.json"):
+        self.doc_manager = doc_manager
+        self.paper_root = doc_manager.paper_root
+        self.manifest_path = manifest_path
+        self._lock = threading.Lock()  # 同一进程内的同步串行执行
+        self._manifest = self._load_manifest()
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    # 读取清单（不存在或损坏时返回None，下次同步按首次运行处理）
+    def _load_manifest(self):
+        if not os.path.exists(self.manifest_path):
+            return None
+        try:
+            with open(self.manifest_path, "r", encoding="utf-8") as f:
+                return json.load(f).get("files", {})
+        except Exception as e:
+            print(f"论文库清单读取失败，将重新建立：{e}")
+            return None
+
+    # 原子写入清单（先写临时文件再替换）
+    def _save_manifest(self):
+        manifest_dir = os.path.dirname(self.manifest_path)
+        if manifest_dir:
+            os.makedirs(manifest_dir, exist_ok=True)
+        tmp_path = f"{self.manifest_path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"version": 1, "files": self._manifest}, f, ensure_ascii=False)
+        os.replace(tmp_path, self.manifest_path)
+
+    # 文件所属分类：论文目录下的一级目录名
+    def _topic(self, path: str) -> str:
+        relative = os.path.relpath(os.path.dirname(path), self.paper_root)
+        return "Unclassified" if relative == os.curdir else relative.split(os.sep)[0]
+
+    # 遍历论文目录（跳过上传暂存目录等隐藏目录），返回 {路径: stat}
+    def _scan(self) -> dict:
+        files = {}
+        for root, dirs, names in os.walk(self.paper_root):
+            dirs[:] = [name for name in dirs if not name.startswith(".")]
+            for name in names:
+                if not name.endswith(".pdf"):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    files[path] = os.stat(path)
+                except FileNotFoundError:
+                    continue
+        return files
+
+    # 首次同步：读取向量库中已索引的论文 {路径: 片段元数据}（用于接管旧数据与清理失效片段）
+    def _indexed_papers(self) -> dict:
+        items = self.doc_manager.vector_db.get_metadatas(self.doc_manager.collection_name)
+        papers = {}
+        for meta in items["metadatas"]:
+            papers.setdefault(meta["path"], meta)
+        return papers
+
+    # 执行一次同步，返回各类变化的数量；full=True时忽略清单中的大小/修改时间，重新核对全部文件
+    def sync(self, workers: int = 1, full: bool = False) -> dict:
+        with self._lock, metrics.timed("library_sync_seconds"):
+            start = time.perf_counter()
+            stats = self._sync(workers, full)
+            stats["seconds"] = round(time.perf_counter() - start, 4)
+            return stats
+
+    def _sync(self, workers: int, full: bool) -> dict:
+        doc_manager = self.doc_manager
+        registry = doc_manager.registry
+        stats = {"added": 0, "moved": 0, "updated": 0, "removed": 0, "duplicates": 0, "failed": 0, "unchanged": 0}
+        # 清单与向量库不一致（如向量库被删除或重建）时，按首次运行处理
+        if self._manifest and doc_manager.vector_db.count(doc_manager.collection_name) == 0:
+            self._manifest = None
+        first_run = self._manifest is None or full
+        old_manifest = self._manifest or {}
+        manifest = {}
+        to_index = {}  # 需要解析与嵌入的文件 {路径: (清单记录, 是否替换了原有索引)}
+
+        # 扫描与比对在论文库写锁内完成：正在入库的文件要么尚未放入目录，要么已完成登记
+        with doc_manager.library_lock:
+            current = self._scan()
+            indexed = self._indexed_papers() if first_run else {}
+            # 上次同步时存在、本次已消失的已索引文件（移动的源路径或已删除）
+            missing = {path for path, entry in old_manifest.items()
+                       if path not in current and not entry.get("duplicate_of") and not entry.get("error")}
+            missing.update(path for path in indexed if path not in current)
+            new_hashes = {}  # 本次新增文件的内容哈希 -> 路径（同一批中的重复副本）
+
+            for path, stat in current.items():
+                entry = old_manifest.get(path)
+                if not first_run and entry and entry["size"] == stat.st_size and entry["mtime_ns"] == stat.st_mtime_ns:
+                    manifest[path] = entry
+                    stats["unchanged"] += 1
+                    continue
+                try:
+                    digest = file_sha256(path)
+                except OSError:
+                    continue
+                record = {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "sha256": digest}
+                if entry and entry["sha256"] == digest and not first_run:
+                    manifest[path] = dict(entry, **record)
+                    stats["unchanged"] += 1
+                    continue
+
+                known = registry.lookup(digest)
+                if known is None and path in indexed:
+                    # 旧版本入库、尚未登记的论文：按片段元数据补登记，不重新嵌入
+                    meta = indexed[path]
+                    registry.register(digest, path, meta["topic"], meta.get("paper_id"), meta["file_name"])
+                    manifest[path] = record
+                    stats["unchanged"] += 1
+                    continue
+                if known is not None and known["path"] == path:
+                    # 已由入库流程索引（如上传）的文件：记入清单即可
+                    manifest[path] = record
+                    stats["unchanged"] += 1
+                    continue
+
+                # 同一路径原有其他内容的索引（内容被替换）：先删除旧索引
+                replaced = (entry is not None and not entry.get("duplicate_of") and not entry.get("error")) \
+                    or path in indexed or registry.lookup_path(path) is not None
+                if replaced:
+                    doc_manager.remove_paper(path, delete_file=False)
+
+                if known is not None and known["path"] not in current:
+                    # 内容已登记、原路径已不存在：移动/改名/换分类，只改写元数据
+                    doc_manager.move_paper(known["path"], path, self._topic(path))
+                    missing.discard(known["path"])
+                    manifest[path] = record
+                    stats["moved"] += 1
+                elif known is not None or digest in new_hashes:
+                    manifest[path] = dict(record, duplicate_of=known["path"] if known else new_hashes[digest])
+                    stats["duplicates"] += 1
+                else:
+                    new_hashes[digest] = path
+                    to_index[path] = (record, replaced)
+
+            # 已消失的文件：有重复副本时由副本接替（改写元数据），否则删除索引
+            for path in sorted(missing):
+                successors = sorted(p for p, entry in manifest.items() if entry.get("duplicate_of") == path)
+                if successors:
+                    doc_manager.move_paper(path, successors[0], self._topic(successors[0]))
+                    manifest[successors[0]] = {key: value for key, value in manifest[successors[0]].items()
+                                               if key != "duplicate_of"}
+                    for other in successors[1:]:
+                        manifest[other] = dict(manifest[other], duplicate_of=successors[0])
+                    stats["moved"] += 1
+                    continue
+                doc_manager.remove_paper(path, delete_file=False)
+                stats["removed"] += 1
+
+        # 解析与嵌入不持有写锁（进程池并行解析，父进程批量嵌入）
+        for path, parsed, chunks, error in doc_manager.parse_papers(list(to_index), workers):
+            record, replaced = to_index[path]
+            result = f"错误：{error}" if error is not None else doc_manager.index_paper(
+                path, self._topic(path), parsed=parsed, chunks=chunks, content_hash=record["sha256"])
+            if result.startswith("错误"):
+                # 记录失败原因，文件内容变化前不再重试
+                metrics.inc("errors_total", stage="library_sync")
+                print(f"论文索引失败（{path}）：{result}")
+                record["error"] = result
+                stats["failed"] += 1
+            else:
+                stats["updated" if replaced else "added"] += 1
+            manifest[path] = record
+
+        if first_run or manifest != old_manifest:
+            self._manifest = manifest
+            self._save_manifest()
+            doc_manager.result_cache.clear()
+        return stats
+
+    # 同步结果摘要
+    @staticmethod
+    def format_stats(stats: dict) -> str:
+        return (f"成功：论文库同步完成（新增{stats['added']}，移动{stats['moved']}，内容更新{stats['updated']}，"
+                f"删除{stats['removed']}，重复副本{stats['duplicates']}，失败{stats['failed']}，"
+                f"未变化{stats['unchanged']}，耗时{stats['seconds']}s）")
+
+    # 轮询监视：每隔 interval 秒同步一次，有变化时输出摘要（stop() 或 Ctrl+C 结束）
+    def watch(self, interval: float = 5.0, workers: int = 1):
+        self._stop_event.clear()
+        while not self._stop_event.is_set():
+            try:
+                stats = self.sync(workers)
+                if any(stats[key] for key in ("added", "moved", "updated", "removed", "duplicates", "failed")):
+                    print(f"[{time.strftime('%H:%M:%S')}] {self.format_stats(stats)}")
+            except Exception as e:
+                metrics.inc("errors_total", stage="library_sync")
+                print(f"论文库同步失败：{e}")
+            self._stop_event.wait(interval)
+
+    # 在后台线程中轮询监视（Web服务内使用）
+    def start_watcher(self, interval: float = 5.0, workers: int = 1):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._thread = threading.Thread(target=self.watch, args=(interval, workers), name="library-sync", daemon=True)
+        self._thread.start()
+
+    # 停止监视
+    def stop(self):
+        if self._stop_event is not None:
+            self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join(timeout=30)
+            self._thread = None
\ No newline at end of file
@@ -0,0 +1,231 @@
+import os
+import json
+import time
+import threading
+from contextlib import contextmanager
+
+# 延迟直方图的桶上限（秒）
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+# 已知指标的类型与说明（/metrics 输出的 HELP/TYPE 行）
+METRIC_HELP = {
+    "pdf_page_extract_seconds": ("histogram", "单页PDF文本提取耗时"),
+    "pdf_pages_total": ("counter", "已提取文本的PDF页数"),
+    "pdf_chunk_seconds": ("histogram", "单篇论文拆分片段耗时"),
+    "pdf_chunks_total": ("counter", "拆分得到的文本片段数"),
+    "embedding_batch_seconds": ("histogram", "单批嵌入前向计算耗时"),
+    "embedding_item_seconds": ("histogram", "每批嵌入的平均单条耗时"),
+    "embedding_items_total": ("counter", "经模型计算的嵌入条数（不含缓存命中）"),
+    "image_decode_seconds": ("histogram", "单张图像解码与预处理耗时"),
+    "vector_db_seconds": ("histogram", "向量库操作耗时"),
+    "vector_db_items_total": ("counter", "向量库写入或查询的条数"),
+    "ingest_stage_seconds": ("histogram", "论文入库各阶段耗时"),
+    "library_sync_seconds": ("histogram", "一次论文库同步的耗时"),
+    "http_request_seconds": ("histogram", "HTTP请求处理耗时"),
+    "http_requests_total": ("counter", "HTTP请求数"),
+    "errors_total": ("counter", "各阶段的错误数"),
+}
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def _format_labels(labels: tuple, extra: tuple = ()) -> str:
+    items = list(labels) + list(extra)
+    if not items:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in items) + "}"
+
+
+# 进程内指标登记表：计数器与延迟直方图，按（指标名, 标签）分别累计
+class MetricsRegistry:
+    def __init__(self, namespace: str = "paper_assistant", buckets: tuple = DEFAULT_BUCKETS):
+        self.namespace = namespace  # 输出时的指标名前缀
+        self.buckets = tuple(sorted(buckets))
+        self._lock = threading.Lock()
+        self._counters = {}  # (指标名, 标签) -> 累计值
+        self._histograms = {}  # (指标名, 标签) -> [各桶计数..., 总和, 次数, 最大值]
+
+    # 计数器累加
+    def inc(self, name: str, value: float = 1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    # 记录一次耗时（秒）
+    def observe(self, name: str, seconds: float, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            series = self._histograms.get(key)
+            if series is None:
+                series = self._histograms[key] = [0] * len(self.buckets) + [0.0, 0, 0.0]
+            for i, bound in enumerate(self.buckets):
+                if seconds <= bound:
+                    series[i] += 1
+                    break
+            series[-3] += seconds
+            series[-2] += 1
+            series[-1] = max(series[-1], seconds)
+
+    # 计时上下文：with metrics.timed("vector_db_seconds", op="query"): ...（出现异常时同样记录）
+    @contextmanager
+    def timed(self, name: str, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def reset(self):
+        with self._lock:
+            self._counters.clear()
+            self._histograms.clear()
+
+    # 当前累计值（写入基准测试结果）：{"counters": {序列: 值}, "histograms": {序列: {次数, 总耗时, 最大耗时}}}
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "counters": {f"{name}{_format_labels(labels)}": value
+                             for (name, labels), value in sorted(self._counters.items())},
+                "histograms": {f"{name}{_format_labels(labels)}": {
+                    "count": series[-2], "total_seconds": round(series[-3], 6), "max_seconds": round(series[-1], 6)
+                } for (name, labels), series in sorted(self._histograms.items())}
+            }
+
+    # 可序列化的累计值（多进程服务中各进程定期写入共享目录，见 MetricsDirectory）
+    def export_state(self) -> dict:
+        with self._lock:
+            return {
+                "counters": [[name, [list(item) for item in labels], value]
+                             for (name, labels), value in self._counters.items()],
+                "histograms": [[name, [list(item) for item in labels], list(series)]
+                               for (name, labels), series in self._histograms.items()]
+            }
+
+    # 合并其他进程的累计值（计数与直方图各桶相加，最大值取较大者）
+    def merge_state(self, state: dict):
+        with self._lock:
+            for name, labels, value in state["counters"]:
+                key = (name, tuple(tuple(item) for item in labels))
+                self._counters[key] = self._counters.get(key, 0) + value
+            for name, labels, series in state["histograms"]:
+                key = (name, tuple(tuple(item) for item in labels))
+                current = self._histograms.get(key)
+                self._histograms[key] = list(series) if current is None else \
+                    [a + b for a, b in zip(current[:-1], series[:-1])] + [max(current[-1], series[-1])]
+
+    # Prometheus文本格式（0.0.4）
+    def render(self) -> str:
+        with self._lock:
+            counters = sorted(self._counters.items())
+            histograms = sorted((key, list(series)) for key, series in self._histograms.items())
+        lines = []
+        described = set()
+
+        def describe(name, kind):
+            if name in described:
+                return
+            described.add(name)
+            help_text = METRIC_HELP.get(name, (kind, name))[1]
+            lines.append(f"# HELP {self.namespace}_{name} {help_text}")
+            lines.append(f"# TYPE {self.namespace}_{name} {kind}")
+
+        for (name, labels), value in counters:
+            describe(name, "counter")
+            lines.append(f"{self.namespace}_{name}{_format_labels(labels)} {value}")
+        for (name, labels), series in histograms:
+            describe(name, "histogram")
+            cumulative = 0
+            for bound, count in zip(self.buckets, series):
+                cumulative += count
+                lines.append(f"{self.namespace}_{name}_bucket{_format_labels(labels, (('le', bound),))} {cumulative}")
+            lines.append(f"{self.namespace}_{name}_bucket{_format_labels(labels, (('le', '+Inf'),))} {series[-2]}")
+            lines.append(f"{self.namespace}_{name}_sum{_format_labels(labels)} {series[-3]}")
+            lines.append(f"{self.namespace}_{name}_count{_format_labels(labels)} {series[-2]}")
+        return "\n".join(lines) + "\n"
+
+    # 按阶段汇总耗时（命令行 --profile 输出），按总耗时降序
+    def format_summary(self, wall_seconds: float = None) -> str:
+        with self._lock:
+            rows = [(name, labels, series[-3], series[-2], series[-1])
+                    for (name, labels), series in self._histograms.items()]
+            counters = sorted(self._counters.items())
+        rows.sort(key=lambda row: row[2], reverse=True)
+        lines = ["=== 各阶段耗时 ===" + (f"（总耗时 {wall_seconds:.3f}s；多进程/多线程阶段为累计耗时，占比可超过100%）"
+                                         if wall_seconds else "")]
+        lines.append(f"{'阶段':<56}{'次数':>8}{'总耗时(s)':>12}{'平均(ms)':>12}{'最大(ms)':>12}{'占比':>8}")
+        for name, labels, total, count, maximum in rows:
+            stage = f"{name}{_format_labels(labels)}"
+            share = f"{total / wall_seconds:.1%}" if wall_seconds else "-"
+            lines.append(f"{stage:<56}{count:>8}{total:>12.3f}{total / count * 1000:>12.2f}{maximum * 1000:>12.2f}{share:>8}")
+        if counters:
+            lines.append("=== 计数 ===")
+            lines.extend(f"{name}{_format_labels(labels)}: {value:g}" for (name, labels), value in counters)
+        return "\n".join(lines)
+
+
+# 多进程指标汇总目录：各进程定期写入 <pid>.json；已退出进程的文件由主进程并入 archive.json（计数不因进程重启而回退）
+class MetricsDirectory:
+    def __init__(self, path: str):
+        self.path = path
+        os.makedirs(self.path, exist_ok=True)
+
+    def _file(self, name) -> str:
+        return os.path.join(self.path, f"{name}.json")
+
+    def _read(self, name):
+        try:
+            with open(self._file(name), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _write(self, name, data: dict):
+        tmp_path = f"{self._file(name)}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f)
+        os.replace(tmp_path, self._file(name))
+
+    # 写入当前进程的累计值
+    def write(self, registry: MetricsRegistry):
+        self._write(os.getpid(), registry.export_state())
+
+    # 将已退出进程的累计值并入归档（主进程回收子进程后调用；归档记录已并入的进程，避免重复计算）
+    def absorb(self, pid: int):
+        state = self._read(pid)
+        if state is not None:
+            archive = self._read("archive") or {"pids": [], "counters": [], "histograms": []}
+            merged = MetricsRegistry()
+            merged.merge_state(archive)
+            merged.merge_state(state)
+            self._write("archive", dict(merged.export_state(), pids=archive["pids"][-1000:] + [pid]))
+        try:
+            os.unlink(self._file(pid))
+        except FileNotFoundError:
+            pass
+
+    # 所有进程合计的Prometheus文本（当前进程使用实时值，其他进程为最近一次写入的值）
+    def render(self, registry: MetricsRegistry) -> str:
+        merged = MetricsRegistry(registry.namespace, registry.buckets)
+        merged.merge_state(registry.export_state())
+        # 先读各进程文件、后读归档：进程文件在归档更新后才删除，已并入归档的进程按归档计算
+        states = {}
+        for file_name in os.listdir(self.path):
+            name = file_name[:-len(".json")]
+            if file_name.endswith(".json") and name.isdigit() and int(name) != os.getpid():
+                state = self._read(name)
+                if state is not None:
+                    states[int(name)] = state
+        archive = self._read("archive")
+        if archive is not None:
+            merged.merge_state(archive)
+            for pid in archive["pids"]:
+                states.pop(pid, None)
+        for state in states.values():
+            merged.merge_state(state)
+        return merged.render()
+
+
+# 进程级默认登记表
+metrics = MetricsRegistry()
\ No newline at end of file
@@ -0,0 +1,109 @@
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+
+
+# 计算文件内容的SHA-256（分块读取，避免大文件占用内存）
+def file_sha256(file_path: str) -> str:
+    sha = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            sha.update(block)
+    return sha.hexdigest()
+
+
+# 论文内容哈希登记表：SHA-256 -> 库中位置/分类/paper_id/标签（重复入库时O(1)查到已有论文）
+class PaperRegistry:
+    def __init__(self, db_path: str = "./data/paper_registry.sqlite3"):
+        self.db_path = db_path
+        self._lock = threading.RLock()
+        db_dir = os.path.dirname(self.db_path)
+        if db_dir:
+            os.makedirs(db_dir, exist_ok=True)
+        self._conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        self._conn.executescript("""
+            PRAGMA journal_mode=WAL;
+            CREATE TABLE IF NOT EXISTS papers (
+                sha256 TEXT PRIMARY KEY, path TEXT, topic TEXT, paper_id TEXT, file_name TEXT,
+                tags TEXT, added_at REAL);
+            CREATE INDEX IF NOT EXISTS papers_path ON papers (path);
+        """)
+
+    @staticmethod
+    def _row_to_entry(row) -> dict:
+        sha256, path, topic, paper_id, file_name, tags, added_at = row
+        return {
+            "sha256": sha256,
+            "path": path,
+            "topic": topic,
+            "paper_id": paper_id,
+            "file_name": file_name,
+            "tags": json.loads(tags) if tags else [],
+            "added_at": added_at
+        }
+
+    # 按内容哈希查找（不存在时返回None）
+    def lookup(self, sha256: str):
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM papers WHERE sha256 = ?", (sha256,)).fetchone()
+        return self._row_to_entry(row) if row else None
+
+    # 按库中路径查找
+    def lookup_path(self, path: str):
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM papers WHERE path = ?", (path,)).fetchone()
+        return self._row_to_entry(row) if row else None
+
+    # 登记论文（同一哈希已登记时保留原记录，返回False）
+    def register(self, sha256: str, path: str, topic: str, paper_id: str, file_name: str, tags: list = None) -> bool:
+        with self._lock:
+            cursor = self._conn.execute(
+                "INSERT OR IGNORE INTO papers (sha256, path, topic, paper_id, file_name, tags, added_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (sha256, path, topic, paper_id, file_name, json.dumps(tags or [], ensure_ascii=False), time.time())
+            )
+            self._conn.commit()
+            return cursor.rowcount == 1
+
+    # 为已登记的论文添加标签（已有该标签时不重复添加），返回更新后的记录
+    def add_tag(self, sha256: str, tag: str):
+        with self._lock:
+            entry = self.lookup(sha256)
+            if entry is None:
+                return None
+            if tag not in entry["tags"]:
+                entry["tags"].append(tag)
+                self._conn.execute("UPDATE papers SET tags = ? WHERE sha256 = ?",
+                                   (json.dumps(entry["tags"], ensure_ascii=False), sha256))
+                self._conn.commit()
+            return entry
+
+    # 论文在库中移动或改名后更新位置
+    def update_location(self, sha256: str, path: str, topic: str, file_name: str):
+        with self._lock:
+            self._conn.execute("UPDATE papers SET path = ?, topic = ?, file_name = ? WHERE sha256 = ?",
+                               (path, topic, file_name, sha256))
+            self._conn.commit()
+
+    # 删除登记
+    def remove(self, sha256: str):
+        with self._lock:
+            self._conn.execute("DELETE FROM papers WHERE sha256 = ?", (sha256,))
+            self._conn.commit()
+
+    # 全部登记记录
+    def entries(self) -> list:
+        with self._lock:
+            rows = self._conn.execute("SELECT * FROM papers ORDER BY added_at").fetchall()
+        return [self._row_to_entry(row) for row in rows]
+
+    def count(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM papers").fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
\ No newline at end of file
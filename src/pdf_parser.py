@@ -0,0 +1,58 @@
+import hashlib
+import io
+import time
+from PyPDF2 import PdfReader
+
+
+# 一次解析的PDF文档：在上传校验、分类与片段索引之间共享，避免同一文件被重复打开解析
+class ParsedDocument:
+    def __init__(self, path: str, data: bytes, content_hash: str = None):
+        start = time.perf_counter()
+        self.path = path
+        self.content_hash = content_hash or hashlib.sha256(data).hexdigest()  # 文件内容哈希（上传时已计算则直接复用）
+        self._reader = PdfReader(io.BytesIO(data))
+        self.page_count = len(self._reader.pages)
+        self._page_texts = [None] * self.page_count  # 按需提取并缓存的页面文本
+        self.page_seconds = []  # 每页文本提取耗时（随解析结果返回父进程后记录到指标）
+        self.chunk_seconds = 0.0  # 拆分片段耗时（见 document_manager.build_chunks）
+        self.extract_seconds = time.perf_counter() - start  # 累计解析耗时（秒）
+
+    # 读取文件并解析（文件只读取一次，哈希与解析共用同一份字节）
+    @classmethod
+    def from_file(cls, pdf_path: str, content_hash: str = None) -> "ParsedDocument":
+        with open(pdf_path, "rb") as f:
+            return cls(pdf_path, f.read(), content_hash)
+
+    # 获取指定页文本（页码从1开始，首次访问时提取）
+    def page_text(self, page_num: int) -> str:
+        index = page_num - 1
+        if self._page_texts[index] is None:
+            start = time.perf_counter()
+            self._page_texts[index] = self._reader.pages[index].extract_text() or ""
+            elapsed = time.perf_counter() - start
+            self.page_seconds.append(elapsed)
+            self.extract_seconds += elapsed
+        return self._page_texts[index]
+
+    # 提取全部页面文本
+    def extract_all(self):
+        for page_num in range(1, self.page_count + 1):
+            self.page_text(page_num)
+
+    # 所有非空页：[(页码, 页面文本), ...]
+    @property
+    def pages(self) -> list:
+        self.extract_all()
+        return [(index + 1, text) for index, text in enumerate(self._page_texts) if text]
+
+    # 全文文本
+    @property
+    def full_text(self) -> str:
+        return "\n".join(text for _, text in self.pages)
+
+    # 序列化时提取全部页面并丢弃解析器（便于跨进程传递）
+    def __getstate__(self):
+        self.extract_all()
+        state = self.__dict__.copy()
+        state["_reader"] = None
+        return state
\ No newline at end of file
@@ -0,0 +1,367 @@
+import os
+import gc
+import sys
+import mmap
+import time
+import errno
+import signal
+import socket
+import struct
+import select
+import shutil
+import tempfile
+import threading
+from werkzeug.serving import make_server
+from werkzeug.wsgi import ClosingIterator
+from src.metrics import metrics, MetricsDirectory
+
+METRICS_FLUSH_INTERVAL = 2.0  # 多进程模式下各进程写入指标累计值的间隔（秒）
+
+
+# 整体就绪状态（主进程写入匿名共享内存，各工作进程的 /ready 读取）：就绪的只读进程数 / 只读进程总数 / 写入进程是否就绪
+class ReadinessBoard:
+    _format = "iii"
+
+    def __init__(self):
+        self._buffer = mmap.mmap(-1, struct.calcsize(self._format))
+
+    def update(self, workers_ready: int, workers: int, writer_ready: bool):
+        struct.pack_into(self._format, self._buffer, 0, workers_ready, workers, int(writer_ready))
+
+    def summary(self) -> dict:
+        workers_ready, workers, writer_ready = struct.unpack_from(self._format, self._buffer, 0)
+        return {"workers_ready": workers_ready, "workers": workers, "writer_ready": bool(writer_ready)}
+
+
+# 统计处理中的请求数（优雅退出时等待已接收的请求处理完）
+class _InflightCounter:
+    def __init__(self, app):
+        self.app = app
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def _done(self):
+        with self._lock:
+            self.count -= 1
+
+    def __call__(self, environ, start_response):
+        with self._lock:
+            self.count += 1
+        try:
+            return ClosingIterator(self.app(environ, start_response), self._done)
+        except BaseException:
+            self._done()
+            raise
+
+
+# 创建监听套接字（非阻塞：多个进程共享同一套接字时，未抢到连接的进程立即返回而不是阻塞在accept）
+def _listen(host: str, port: int) -> socket.socket:
+    listener = socket.socket(socket.AF_INET6 if ":" in host else socket.AF_INET, socket.SOCK_STREAM)
+    listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    listener.bind((host, port))
+    listener.listen(128)
+    listener.setblocking(False)
+    listener.set_inheritable(True)
+    return listener
+
+
+# 在当前进程中运行一个工作进程：配置角色、后台预热、服务请求，收到SIGTERM后停止接收新连接并等待处理中的请求
+def run_worker(role: str, listener: socket.socket, writer_address: tuple = None, board: ReadinessBoard = None,
+               ready_fd: int = None, threads: int = None, graceful_timeout: float = 30.0,
+               metrics_dir: MetricsDirectory = None):
+    """
+    role: "single"（单进程：读写均在本进程）/ "reader"（只读，写入请求转发给写入进程）/ "writer"（唯一写入索引的进程）
+    ready_fd: 预热完成后写入一个字节通知主进程
+    metrics_dir: 多进程指标汇总目录（定期写入本进程的累计值，/metrics 输出所有进程的合计）
+    """
+    import app as app_module
+    from src.services import services
+    flask_app = app_module.app
+    flask_app.config['SERVER_ROLE'] = role
+    flask_app.config['WRITER_ADDRESS'] = writer_address
+    flask_app.config['READINESS'] = board
+    flask_app.config['METRICS_DIR'] = metrics_dir
+    services.configure_role(role)
+    if threads:
+        try:
+            import torch
+            torch.set_num_threads(threads)
+        except ImportError:
+            pass
+
+    inflight = _InflightCounter(flask_app)
+    host, port = listener.getsockname()[:2]
+    server = make_server(host, port, inflight, threaded=True, fd=listener.fileno())
+    server.socket.setblocking(False)
+    listener.close()  # make_server 已复制该套接字
+
+    # 预热在后台进行，期间 /health 与 /ready 可以响应（/ready 返回503）
+    def warm_up():
+        try:
+            services.warm_up()
+            if role != "reader":
+                app_module.start_background_tasks()
+        except Exception as e:
+            print(f"[{role} {os.getpid()}] 预热失败：{e}", file=sys.stderr)
+            os._exit(1)
+        if ready_fd is not None:
+            os.write(ready_fd, b"1")
+            os.close(ready_fd)
+        print(f"[{role} {os.getpid()}] 预热完成，开始服务")
+
+    def stop(signum, frame):
+        threading.Thread(target=server.shutdown, daemon=True).start()
+
+    flush_stop = threading.Event()
+
+    def flush_metrics():
+        while not flush_stop.wait(METRICS_FLUSH_INTERVAL):
+            metrics_dir.write(metrics)
+
+    signal.signal(signal.SIGTERM, stop)
+    if role != "single":
+        # Ctrl+C 会发给整个进程组，由主进程统一协调退出；SIGHUP 只由主进程处理
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+        signal.signal(signal.SIGHUP, signal.SIG_IGN)
+    threading.Thread(target=warm_up, name="warm-up", daemon=True).start()
+    if metrics_dir is not None:
+        threading.Thread(target=flush_metrics, name="metrics-flush", daemon=True).start()
+    try:
+        server.serve_forever(poll_interval=0.5)
+    except KeyboardInterrupt:
+        pass
+    # 优雅退出：不再接收新连接，等待处理中的请求完成（最多 graceful_timeout 秒）
+    deadline = time.monotonic() + graceful_timeout
+    while inflight.count > 0 and time.monotonic() < deadline:
+        time.sleep(0.1)
+    server.server_close()
+    services.close()
+    if metrics_dir is not None:
+        flush_stop.set()
+        metrics_dir.write(metrics)
+
+
+# 预分叉（pre-fork）多进程服务：主进程加载模型后fork出1个写入进程与N个只读进程，共享同一监听端口
+class PreforkServer:
+    """
+    - 模型权重在fork前加载，子进程以写时复制方式共享（不在主进程中打开向量库/SQLite，避免fork后共用连接）
+    - 只读进程处理检索等请求；入库、任务查询等写入类请求转发给唯一的写入进程（ChromaDB持久化客户端不支持多进程同时写入）
+    - 写入进程更新索引后只读进程自动重新打开向量库（见 ServiceContainer.refresh_if_stale）
+    - SIGHUP：先重启写入进程，再逐个启动新的只读进程、待其预热完成后停止对应的旧进程（重新打开索引与数据库连接）
+    - SIGTERM / Ctrl+C：所有子进程停止接收新连接，处理完已接收的请求后退出
+    """
+
+    def __init__(self, host: str = "0.0.0.0", port: int = 5000, workers: int = 2, graceful_timeout: float = 30.0,
+                 preload: bool = True):
+        self.host = host
+        self.port = port
+        self.workers = workers
+        self.graceful_timeout = graceful_timeout
+        self.preload = preload
+        self.threads = max(1, (os.cpu_count() or 1) // (workers + 1))  # 每个子进程的推理线程数
+        self.board = ReadinessBoard()
+        self._children = {}  # pid -> {"role", "ready", "draining", "ready_fd", "started"}
+        self._stopping = False
+        self._reload_requested = False
+        self.metrics_dir = None
+
+    # 加载模型权重（不执行推理；GPU模式下CUDA上下文不能跨fork，改为各子进程自行加载）
+    def _preload_models(self):
+        from src.embedding import EmbeddingModels
+        try:
+            import torch
+            if torch.cuda.is_available():
+                print("检测到GPU：模型由各子进程自行加载（CUDA上下文不能在fork后共享）")
+                return
+        except ImportError:
+            pass
+        start = time.perf_counter()
+        EmbeddingModels().preload()
+        print(f"模型已在主进程中加载（{time.perf_counter() - start:.1f}s），子进程共享权重内存")
+
+    def _spawn(self, role: str) -> int:
+        read_fd, write_fd = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            code = 0
+            try:
+                os.close(read_fd)
+                for child in self._children.values():
+                    os.close(child["ready_fd"])
+                if role == "writer":
+                    self.listener.close()
+                    listener = self.writer_listener
+                else:
+                    self.writer_listener.close()
+                    listener = self.listener
+                run_worker(role, listener, writer_address=self.writer_address, board=self.board, ready_fd=write_fd,
+                           threads=self.threads, graceful_timeout=self.graceful_timeout, metrics_dir=self.metrics_dir)
+            except BaseException as e:
+                print(f"[{role} {os.getpid()}] 异常退出：{e}", file=sys.stderr)
+                code = 1
+            finally:
+                sys.stdout.flush()
+                sys.stderr.flush()
+                os._exit(code)
+        os.close(write_fd)
+        self._children[pid] = {"role": role, "ready": False, "draining": False, "ready_fd": read_fd,
+                               "started": time.monotonic()}
+        self._publish()
+        return pid
+
+    # 更新共享的就绪状态（平滑重启期间旧的只读进程退出前仍计入，就绪数不超过配置的进程数）
+    def _publish(self):
+        readers = [child for child in self._children.values() if child["role"] == "reader"]
+        writers = [child for child in self._children.values() if child["role"] == "writer" and not child["draining"]]
+        self.board.update(min(self.workers, sum(child["ready"] for child in readers)), self.workers,
+                          any(child["ready"] for child in writers))
+
+    # 处理预热完成通知与已退出的子进程（异常退出的子进程自动补充）
+    def _poll(self, timeout: float):
+        fds = {child["ready_fd"]: pid for pid, child in self._children.items() if not child["ready"]}
+        try:
+            readable = select.select(list(fds), [], [], timeout)[0] if fds else []
+        except InterruptedError:
+            readable = []
+        if not fds:
+            time.sleep(timeout)
+        for fd in readable:
+            child = self._children[fds[fd]]
+            child["ready"] = bool(os.read(fd, 1))
+        while True:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                break
+            if pid == 0:
+                break
+            child = self._children.pop(pid, None)
+            if child is None:
+                continue
+            os.close(child["ready_fd"])
+            self.metrics_dir.absorb(pid)  # 已退出进程的指标并入归档
+            if not child["draining"] and not self._stopping:
+                print(f"{child['role']} 进程 {pid} 意外退出（状态{status}），重新启动")
+                if time.monotonic() - child["started"] < 5:
+                    time.sleep(1)  # 启动即失败时避免快速循环重启
+                self._spawn(child["role"])
+        self._publish()
+
+    # 停止子进程（wait=True时等待其退出，超时后强制结束）
+    def _stop_child(self, pid: int, wait: bool):
+        child = self._children.get(pid)
+        if child is None:
+            return
+        child["draining"] = True
+        self._publish()
+        try:
+            os.kill(pid, signal.SIGTERM)
+        except ProcessLookupError:
+            return
+        if not wait:
+            return
+        deadline = time.monotonic() + self.graceful_timeout + 5
+        while pid in self._children and time.monotonic() < deadline:
+            self._poll(0.2)
+        if pid in self._children:
+            os.kill(pid, signal.SIGKILL)
+            while pid in self._children:
+                self._poll(0.2)
+
+    # 等待子进程预热完成（超时返回False）
+    def _wait_ready(self, pid: int, timeout: float) -> bool:
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            child = self._children.get(pid)
+            if child is None:
+                return False
+            if child["ready"]:
+                return True
+            self._poll(0.2)
+        return False
+
+    # 平滑重启：任何时刻最多一个写入进程；只读进程先启动新进程、就绪后再停止旧进程
+    def _reload(self):
+        print("收到SIGHUP，开始平滑重启子进程...")
+        for pid in [pid for pid, child in self._children.items() if child["role"] == "writer" and not child["draining"]]:
+            self._stop_child(pid, wait=True)
+        self._spawn("writer")
+        for pid in [pid for pid, child in self._children.items() if child["role"] == "reader" and not child["draining"]]:
+            new_pid = self._spawn("reader")
+            if not self._wait_ready(new_pid, self.graceful_timeout * 4):
+                print(f"新的只读进程 {new_pid} 未能按时就绪，保留旧进程 {pid}")
+                continue
+            self._stop_child(pid, wait=False)
+        print("平滑重启完成")
+
+    def _handle_signal(self, signum, frame):
+        if signum == signal.SIGHUP:
+            self._reload_requested = True
+        else:
+            self._stopping = True
+
+    def run(self):
+        self.listener = _listen(self.host, self.port)
+        self.writer_listener = _listen("127.0.0.1", 0)  # 写入进程只在本机回环地址上接收只读进程转发的请求
+        self.writer_address = self.writer_listener.getsockname()[:2]
+        self.metrics_dir = MetricsDirectory(tempfile.mkdtemp(prefix="paper-assistant-metrics-"))
+        import app  # noqa: F401  应用在fork前导入，子进程共享已导入的模块
+        if self.preload:
+            self._preload_models()
+        gc.freeze()  # 已加载的对象移出GC跟踪，减少子进程因GC写引用计数而复制内存页
+
+        for signum in (signal.SIGTERM, signal.SIGINT, signal.SIGHUP):
+            signal.signal(signum, self._handle_signal)
+        # 写入进程先完成预热（创建集合、同步图像索引），只读进程再启动
+        writer_pid = self._spawn("writer")
+        while not self._stopping and not self._wait_ready(writer_pid, 1.0) and writer_pid in self._children:
+            pass
+        for _ in range(self.workers):
+            self._spawn("reader")
+        print(f"主进程 {os.getpid()}：{self.workers} 个只读进程 + 1 个写入进程，监听 http://{self.host}:{self.port}"
+              f"（kill -HUP {os.getpid()} 平滑重启）")
+
+        while not self._stopping:
+            if self._reload_requested:
+                self._reload_requested = False
+                self._reload()
+            self._poll(0.5)
+
+        print("正在停止子进程（等待处理中的请求完成）...")
+        for pid in list(self._children):
+            self._stop_child(pid, wait=False)
+        deadline = time.monotonic() + self.graceful_timeout + 5
+        while self._children and time.monotonic() < deadline:
+            self._poll(0.2)
+        for pid in list(self._children):
+            try:
+                os.kill(pid, signal.SIGKILL)
+            except ProcessLookupError:
+                pass
+        self.listener.close()
+        self.writer_listener.close()
+        shutil.rmtree(self.metrics_dir.path, ignore_errors=True)
+
+
+# 服务入口：workers>1 且平台支持fork时使用预分叉多进程，否则（如Windows）单进程多线程运行
+def serve(host: str = "0.0.0.0", port: int = 5000, workers: int = 2, graceful_timeout: float = 30.0):
+    if workers > 1 and not hasattr(os, "fork"):
+        print("提示：当前平台不支持fork，以单进程多线程模式运行（--workers 参数无效）")
+        workers = 1
+    if workers <= 1:
+        try:
+            listener = _listen(host, port)
+        except OSError as e:
+            print(f"错误：无法监听 {host}:{port}：{e}")
+            return
+        listener.setblocking(True)  # 单进程时无需与其他进程竞争连接
+        print(f"单进程模式，监听 http://{host}:{port}")
+        run_worker("single", listener, graceful_timeout=graceful_timeout)
+        return
+    try:
+        PreforkServer(host, port, workers, graceful_timeout).run()
+    except OSError as e:
+        if e.errno == errno.EADDRINUSE:
+            print(f"错误：端口 {port} 已被占用")
+        else:
+            raise
\ No newline at end of file
@@ -0,0 +1,160 @@
+import os
+import time
+import atexit
+import threading
+from src.embedding import EmbeddingModels
+from src.vector_db import VectorDB
+from src.document_manager import DocumentManager
+from src.image_manager import ImageManager
+from src.library_sync import LibrarySync
+
+# 各集合的向量存储后端："chroma"（默认，HNSW近似检索）或 "numpy"（内存映射矩阵精确检索，适合十万级以下的集合）
+# 切换后端后运行 python main.py migrate_index --collection <集合名> 复制已有数据
+VECTOR_BACKENDS = {}
+
+
+# 进程级服务容器：DocumentManager / ImageManager / VectorDB 只创建一次，供所有路由与命令行共享
+class ServiceContainer:
+    def __init__(self, db_path: str = "./data/chroma_db", paper_root: str = "./data/papers",
+                 image_root: str = "./data/images", embedding_model: EmbeddingModels = None):
+        self.db_path = db_path
+        self.paper_root = paper_root
+        self.image_root = image_root
+        self.embedding_model = embedding_model  # 可替换的嵌入模型（需在首次创建管理器前设置，如基准测试的伪嵌入器）
+        self._lock = threading.RLock()
+        self._vector_db = None
+        self._document_manager = None
+        self._image_manager = None
+        self._library_sync = None
+        self._closed = False
+        self.warmed_up = False
+        # 多进程服务中的角色（见 src/server.py）："single"（单进程）/ "reader"（只读）/ "writer"（唯一写入索引的进程）
+        self.role = "single"
+        self.generation_path = "./data/index_generation"  # 写入进程每次写入后更新，只读进程据此重新打开索引
+        self.refresh_interval = 1.0  # 只读进程检查代次文件的最短间隔（秒）
+        self._generation = None
+        self._next_refresh = 0.0
+        atexit.register(self.close)
+
+    # 设置进程角色（需在首次创建管理器前调用）
+    def configure_role(self, role: str):
+        self.role = role
+        EmbeddingModels.embedding_cache_read_only = role == "reader"
+        self._generation = self._read_generation()
+
+    # 代次文件的 (修改时间, inode)；不存在时返回None
+    def _read_generation(self):
+        try:
+            stat = os.stat(self.generation_path)
+        except FileNotFoundError:
+            return None
+        return stat.st_mtime_ns, stat.st_ino
+
+    # 共享的向量数据库客户端（首次访问时创建）
+    @property
+    def vector_db(self) -> VectorDB:
+        if self._vector_db is None:
+            with self._lock:
+                if self._vector_db is None:
+                    self._vector_db = VectorDB(self.db_path, backends=VECTOR_BACKENDS,
+                                               generation_path=self.generation_path if self.role == "writer" else None,
+                                               read_only=self.role == "reader")
+        return self._vector_db
+
+    # 共享的论文管理器
+    @property
+    def document_manager(self) -> DocumentManager:
+        if self._document_manager is None:
+            with self._lock:
+                if self._document_manager is None:
+                    self._document_manager = DocumentManager(self.paper_root, vector_db=self.vector_db,
+                                                             embedding_model=self.embedding_model)
+        return self._document_manager
+
+    # 共享的图像管理器（创建时完成一次增量索引同步；只读进程不同步，由写入进程维护索引）
+    @property
+    def image_manager(self) -> ImageManager:
+        if self._image_manager is None:
+            with self._lock:
+                if self._image_manager is None:
+                    self._image_manager = ImageManager(self.image_root, vector_db=self.vector_db,
+                                                       embedding_model=self.embedding_model,
+                                                       sync_index=self.role != "reader")
+        return self._image_manager
+
+    # 论文库同步（对比论文目录与清单，增量删除/移动/新增索引）
+    @property
+    def library_sync(self) -> LibrarySync:
+        if self._library_sync is None:
+            with self._lock:
+                if self._library_sync is None:
+                    self._library_sync = LibrarySync(self.document_manager)
+        return self._library_sync
+
+    # 预热：提前创建管理器、加载模型并执行一次推理，避免首个请求变慢
+    def warm_up(self):
+        with self._lock:
+            if self.warmed_up:
+                return
+            # 访问属性即触发创建（图像管理器同时完成索引同步）
+            self.document_manager
+            self.image_manager
+            embedding_model = self.embedding_model or EmbeddingModels()
+            embedding_model.get_text_embeddings(["warm up"])
+            embedding_model.get_clip_text_embedding("warm up")
+            self.warmed_up = True
+
+    # 只读进程：代次文件变化（写入进程更新了索引）时重新打开向量库并重新读取图像清单
+    def refresh_if_stale(self):
+        if self.role != "reader" or time.monotonic() < self._next_refresh:
+            return
+        with self._lock:
+            if time.monotonic() < self._next_refresh:
+                return
+            self._next_refresh = time.monotonic() + self.refresh_interval
+            generation = self._read_generation()
+            if generation == self._generation or self._vector_db is None:
+                return
+            try:
+                self._vector_db.reopen()
+                if self._image_manager is not None:
+                    self._image_manager.reload_manifest()
+                if self._document_manager is not None:
+                    self._document_manager.result_cache.clear()
+                self._generation = generation
+            except Exception as e:
+                print(f"重新打开索引失败：{e}")
+
+    # 查询缓存统计（只统计已创建的管理器，不触发创建）
+    def cache_stats(self) -> dict:
+        stats = {"query_embedding": EmbeddingModels.query_cache.stats()}
+        if self._document_manager is not None:
+            stats["paper_results"] = self._document_manager.result_cache.stats()
+        if self._image_manager is not None:
+            stats["image_results"] = self._image_manager.result_cache.stats()
+        embedding_disk = EmbeddingModels.embedding_cache_stats()
+        if embedding_disk is not None:
+            stats["embedding_disk"] = embedding_disk
+        return stats
+
+    # 关闭共享资源（进程退出时自动调用）
+    def close(self):
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            if self._library_sync is not None:
+                self._library_sync.stop()
+            if self._document_manager is not None:
+                self._document_manager.keyword_index.close()
+                self._document_manager.registry.close()
+            if self._vector_db is not None:
+                self._vector_db.close()
+            self._vector_db = None
+            self._document_manager = None
+            self._image_manager = None
+            self._library_sync = None
+
+
+# 默认的进程级容器
+services = ServiceContainer()
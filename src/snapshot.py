@@ -0,0 +1,247 @@
+import os
+import json
+import time
+import shutil
+import numpy as np
+from src.paper_registry import file_sha256
+
+SNAPSHOT_FORMAT = "paper-assistant-vector-snapshot"
+SNAPSHOT_VERSION = 1
+
+
+# 变长字符串列的写入器：<名称>.bin 为UTF-8拼接的字节，<名称>.offsets.npy 为 N+1 个偏移（None记为空串并在掩码中标记）
+class _StringColumnWriter:
+    def __init__(self, folder: str, name: str):
+        self.folder = folder
+        self.name = name
+        self._file = open(os.path.join(folder, f"{name}.bin"), "wb")
+        self._offsets = [0]
+        self._missing = []
+
+    def extend(self, values: list):
+        for value in values:
+            data = b"" if value is None else value.encode("utf-8")
+            self._file.write(data)
+            self._offsets.append(self._offsets[-1] + len(data))
+            self._missing.append(value is None)
+
+    # 结束写入，返回列描述
+    def close(self) -> dict:
+        self._file.close()
+        np.save(os.path.join(self.folder, f"{self.name}.offsets.npy"), np.asarray(self._offsets, dtype=np.int64))
+        spec = {"type": "str", "file": self.name}
+        if any(self._missing):
+            np.save(os.path.join(self.folder, f"{self.name}.missing.npy"), np.asarray(self._missing, dtype=bool))
+            spec["missing"] = True
+        return spec
+
+
+# 元数据列的类型：bool / int / float / str；混合类型的列按JSON字符串保存
+def _column_type(values: list) -> str:
+    present = [value for value in values if value is not None]
+    if all(isinstance(value, bool) for value in present):
+        return "bool"
+    if all(isinstance(value, int) and not isinstance(value, bool) for value in present):
+        return "int"
+    if all(isinstance(value, (int, float)) and not isinstance(value, bool) for value in present):
+        return "float"
+    if all(isinstance(value, str) for value in present):
+        return "str"
+    return "json"
+
+
+# 写入一列元数据：数值列为 .npy；字符串列按字典编码（路径/分类等大量重复的值只存一次）
+def _write_metadata_column(folder: str, name: str, values: list) -> dict:
+    kind = _column_type(values)
+    missing = np.asarray([value is None for value in values], dtype=bool)
+    if kind in ("str", "json"):
+        if kind == "json":
+            values = [None if value is None else json.dumps(value, ensure_ascii=False) for value in values]
+        codes, dictionary = np.full(len(values), -1, dtype=np.int32), {}
+        for i, value in enumerate(values):
+            if value is not None:
+                codes[i] = dictionary.setdefault(value, len(dictionary))
+        writer = _StringColumnWriter(folder, f"{name}.dict")
+        writer.extend(list(dictionary))
+        writer.close()
+        np.save(os.path.join(folder, f"{name}.codes.npy"), codes)
+        return {"type": kind, "file": name, "encoding": "dictionary", "distinct": len(dictionary)}
+    dtype = {"bool": np.bool_, "int": np.int64, "float": np.float64}[kind]
+    np.save(os.path.join(folder, f"{name}.npy"),
+            np.asarray([0 if value is None else value for value in values], dtype=dtype))
+    spec = {"type": kind, "file": name}
+    if missing.any():
+        np.save(os.path.join(folder, f"{name}.missing.npy"), missing)
+        spec["missing"] = True
+    return spec
+
+
+# 写入集合快照（目录）：vectors.npy（float16矩阵）、ids / documents（变长字符串列）、metadata/（列式元数据）、manifest.json
+def write_snapshot(path: str, collection_name: str, count: int, batches, info: dict = None,
+                   overwrite: bool = False) -> dict:
+    """
+    batches: 依次产出 {"ids", "embeddings", "metadatas", "documents"} 的可迭代对象（合计 count 条）
+    info: 写入清单的附加信息（如索引配置、来源后端）
+    先写入临时目录，完成后改名为 path（中断时不会留下半写入的快照）
+    """
+    if os.path.exists(path) and not overwrite:
+        raise FileExistsError(f"快照目录已存在：{path}")
+    tmp_path = f"{path}.tmp-{os.getpid()}"
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    os.makedirs(os.path.join(tmp_path, "metadata"))
+    try:
+        vectors = None
+        ids = _StringColumnWriter(tmp_path, "ids")
+        documents = _StringColumnWriter(tmp_path, "documents")
+        metadatas = []
+        written = 0
+        for batch in batches:
+            embeddings = np.asarray(batch["embeddings"], dtype=np.float32)
+            if len(embeddings) == 0:
+                continue
+            if vectors is None:
+                vectors = np.lib.format.open_memmap(os.path.join(tmp_path, "vectors.npy"), mode="w+",
+                                                    dtype=np.float16, shape=(count, embeddings.shape[1]))
+            vectors[written:written + len(embeddings)] = embeddings
+            written += len(embeddings)
+            ids.extend(batch["ids"])
+            documents.extend(batch["documents"] or [None] * len(embeddings))
+            metadatas.extend(batch["metadatas"] or [None] * len(embeddings))
+        if written != count:
+            raise ValueError(f"集合在导出期间发生变化（预期{count}条，实际{written}条）")
+        dim = 0 if vectors is None else int(vectors.shape[1])
+        if vectors is None:
+            np.save(os.path.join(tmp_path, "vectors.npy"), np.zeros((0, 0), dtype=np.float16))
+        else:
+            vectors.flush()
+            del vectors
+
+        # 元数据按键拆分为列（某条记录缺少该键时记为缺失）
+        keys = sorted({key for meta in metadatas if meta for key in meta})
+        columns = {}
+        for i, key in enumerate(keys):
+            values = [meta.get(key) if meta else None for meta in metadatas]
+            columns[key] = _write_metadata_column(os.path.join(tmp_path, "metadata"), f"col_{i:03d}", values)
+
+        manifest = dict(info or {}, **{
+            "format": SNAPSHOT_FORMAT,
+            "version": SNAPSHOT_VERSION,
+            "collection": collection_name,
+            "count": count,
+            "dim": dim,
+            "dtype": "float16",
+            "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "id_column": ids.close(),
+            "document_column": documents.close(),
+            "metadata_columns": columns,
+        })
+        # 逐个文件的大小与哈希（导入时校验完整性）
+        manifest["files"] = {}
+        for root, _, files in os.walk(tmp_path):
+            for file_name in sorted(files):
+                file_path = os.path.join(root, file_name)
+                relative = os.path.relpath(file_path, tmp_path).replace(os.sep, "/")
+                manifest["files"][relative] = {"bytes": os.path.getsize(file_path), "sha256": file_sha256(file_path)}
+        with open(os.path.join(tmp_path, "manifest.json"), "w", encoding="utf-8") as f:
+            json.dump(manifest, f, ensure_ascii=False, indent=2)
+
+        if os.path.exists(path):
+            shutil.rmtree(path)
+        os.replace(tmp_path, path)
+        return manifest
+    except Exception:
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        raise
+
+
+# 集合快照读取器：向量与字符串列均以内存映射方式打开，按区间解码
+class SnapshotReader:
+    def __init__(self, path: str):
+        self.path = path
+        manifest_path = os.path.join(path, "manifest.json")
+        if not os.path.isfile(manifest_path):
+            raise ValueError(f"不是有效的快照目录（缺少manifest.json）：{path}")
+        with open(manifest_path, "r", encoding="utf-8") as f:
+            self.manifest = json.load(f)
+        if self.manifest.get("format") != SNAPSHOT_FORMAT:
+            raise ValueError(f"不是有效的快照目录（格式标识不符）：{path}")
+        if self.manifest.get("version", 0) > SNAPSHOT_VERSION:
+            raise ValueError(f"快照版本 {self.manifest['version']} 高于当前支持的版本 {SNAPSHOT_VERSION}，请升级程序")
+        self.collection_name = self.manifest["collection"]
+        self.count = self.manifest["count"]
+        self.dim = self.manifest["dim"]
+        self.vectors = np.load(os.path.join(path, "vectors.npy"), mmap_mode="r")
+        self._ids = self._open_strings(self.manifest["id_column"], path)
+        self._documents = self._open_strings(self.manifest["document_column"], path)
+        self._columns = {key: self._open_column(spec) for key, spec in self.manifest["metadata_columns"].items()}
+
+    # 校验各文件的大小与哈希，返回不一致的文件列表
+    def verify(self) -> list:
+        broken = []
+        for relative, expected in self.manifest["files"].items():
+            file_path = os.path.join(self.path, *relative.split("/"))
+            if not os.path.isfile(file_path) or os.path.getsize(file_path) != expected["bytes"] \
+                    or file_sha256(file_path) != expected["sha256"]:
+                broken.append(relative)
+        return broken
+
+    @staticmethod
+    def _open_strings(spec: dict, folder: str) -> dict:
+        base = os.path.join(folder, spec["file"])
+        offsets = np.load(f"{base}.offsets.npy", mmap_mode="r")
+        data = np.memmap(f"{base}.bin", dtype=np.uint8, mode="r") if offsets[-1] > 0 else np.zeros(0, dtype=np.uint8)
+        missing = np.load(f"{base}.missing.npy", mmap_mode="r") if spec.get("missing") else None
+        return {"offsets": offsets, "data": data, "missing": missing}
+
+    # 解码 [start, end) 区间的字符串
+    @staticmethod
+    def _read_strings(column: dict, start: int, end: int) -> list:
+        offsets = np.asarray(column["offsets"][start:end + 1]) - column["offsets"][start]
+        blob = bytes(column["data"][column["offsets"][start]:column["offsets"][end]])
+        values = [blob[offsets[i]:offsets[i + 1]].decode("utf-8") for i in range(end - start)]
+        if column["missing"] is not None:
+            values = [None if missing else value for value, missing in zip(values, column["missing"][start:end])]
+        return values
+
+    def _open_column(self, spec: dict) -> dict:
+        base = os.path.join(self.path, "metadata", spec["file"])
+        column = {"spec": spec}
+        if spec.get("encoding") == "dictionary":
+            dictionary = self._open_strings({"file": f"{spec['file']}.dict"}, os.path.join(self.path, "metadata"))
+            values = self._read_strings(dictionary, 0, len(dictionary["offsets"]) - 1)
+            if spec["type"] == "json":
+                values = [json.loads(value) for value in values]
+            column["dictionary"] = values
+            column["codes"] = np.load(f"{base}.codes.npy", mmap_mode="r")
+        else:
+            column["values"] = np.load(f"{base}.npy", mmap_mode="r")
+            column["missing"] = np.load(f"{base}.missing.npy", mmap_mode="r") if spec.get("missing") else None
+        return column
+
+    # [start, end) 区间的元数据字典（缺失的键不出现在字典中）
+    def _read_metadatas(self, start: int, end: int) -> list:
+        metadatas = [{} for _ in range(end - start)]
+        for key, column in self._columns.items():
+            if "dictionary" in column:
+                dictionary = column["dictionary"]
+                for meta, code in zip(metadatas, column["codes"][start:end].tolist()):
+                    if code >= 0:
+                        meta[key] = dictionary[code]
+                continue
+            values = column["values"][start:end].tolist()
+            missing = column["missing"][start:end] if column["missing"] is not None else [False] * len(values)
+            for meta, value, is_missing in zip(metadatas, values, missing):
+                if not is_missing:
+                    meta[key] = value
+        return [meta or None for meta in metadatas]
+
+    # 按批读取：{"ids", "embeddings"(float32矩阵), "metadatas", "documents"}
+    def iter_batches(self, batch_size: int = 10000):
+        for start in range(0, self.count, batch_size):
+            end = min(start + batch_size, self.count)
+            yield {
+                "ids": self._read_strings(self._ids, start, end),
+                "embeddings": np.asarray(self.vectors[start:end], dtype=np.float32),
+                "metadatas": self._read_metadatas(start, end),
+                "documents": self._read_strings(self._documents, start, end)
+            }
\ No newline at end of file
@@ -0,0 +1,71 @@
+import os
+import uuid
+import hashlib
+from PIL import Image
+
+THUMBNAIL_SIZES = (128, 256, 512)  # 缩略图边长（像素，等比缩放到不超过该尺寸）
+
+
+# 磁盘缩略图缓存：按 内容哈希 + 尺寸 存储，文件内容变化时哈希随之变化，旧缩略图自然失效
+class ThumbnailCache:
+    def __init__(self, cache_root: str = "./data/thumbnails", sizes=THUMBNAIL_SIZES, quality: int = 85):
+        self.cache_root = cache_root
+        self.sizes = tuple(sorted(sizes))
+        self.quality = quality  # JPEG质量
+
+    # 将请求尺寸对齐到已配置的尺寸（向上取整，超过最大尺寸时取最大值）
+    def normalize_size(self, size: int) -> int:
+        for candidate in self.sizes:
+            if size <= candidate:
+                return candidate
+        return self.sizes[-1]
+
+    # 文件版本标识：优先使用内容哈希（来自图像索引清单），否则按大小与修改时间生成
+    @staticmethod
+    def file_version(image_path: str, digest: str = None) -> str:
+        if digest:
+            return digest
+        stat = os.stat(image_path)
+        return hashlib.sha1(f"{os.path.abspath(image_path)}|{stat.st_size}|{stat.st_mtime_ns}".encode("utf-8")).hexdigest()
+
+    def _thumbnail_path(self, version: str, size: int) -> str:
+        return os.path.join(self.cache_root, str(size), f"{version}.jpg")
+
+    # 获取缩略图路径（不存在时生成；先写临时文件再改名，并发请求不会读到半写入的文件）
+    def get(self, image_path: str, size: int, digest: str = None) -> str:
+        size = self.normalize_size(size)
+        thumbnail_path = self._thumbnail_path(self.file_version(image_path, digest), size)
+        if os.path.exists(thumbnail_path):
+            return thumbnail_path
+        os.makedirs(os.path.dirname(thumbnail_path), exist_ok=True)
+        with Image.open(image_path) as image:
+            # JPEG按目标尺寸直接以较低分辨率解码，避免解码整张大图
+            image.draft("RGB", (size, size))
+            if image.mode in ("RGBA", "LA", "P"):
+                image = image.convert("RGBA")
+                background = Image.new("RGB", image.size, (255, 255, 255))
+                background.paste(image, mask=image.split()[-1])
+                image = background
+            else:
+                image = image.convert("RGB")
+            image.thumbnail((size, size))
+            tmp_path = f"{thumbnail_path}.{uuid.uuid4().hex}.tmp"
+            image.save(tmp_path, "JPEG", quality=self.quality, optimize=True)
+        os.replace(tmp_path, thumbnail_path)
+        return thumbnail_path
+
+    # 删除不再被引用的缩略图（valid_versions 为当前有效的文件版本集合）
+    def prune(self, valid_versions: set):
+        for size in self.sizes:
+            size_dir = os.path.join(self.cache_root, str(size))
+            if not os.path.isdir(size_dir):
+                continue
+            for file_name in os.listdir(size_dir):
+                if file_name.endswith(".tmp"):
+                    continue  # 正在生成中的临时文件
+                version = file_name.split(".")[0]
+                if version not in valid_versions:
+                    try:
+                        os.unlink(os.path.join(size_dir, file_name))
+                    except OSError:
+                        pass
\ No newline at end of file
@@ -0,0 +1,62 @@
+import os
+import errno
+import shutil
+import hashlib
+import tempfile
+
+PDF_MAGIC = b"%PDF-"  # PDF文件头
+
+
+# 上传被拒绝（超出大小限制、文件头不符等），消息可直接返回给用户
+class UploadRejected(Exception):
+    pass
+
+
+# 流式接收上传：边写入边计算SHA-256、检查文件头与大小上限，请求体只读取一次
+def stream_upload(stream, dest_dir: str, suffix: str = "", prefix: str = "upload_", max_size: int = None,
+                  min_size: int = 0, magic: bytes = None, chunk_size: int = 1024 * 1024):
+    """
+    写入 dest_dir 下唯一命名的临时文件（mkstemp，同名文件并发上传互不覆盖），返回 (临时路径, 文件大小, 内容哈希)
+    dest_dir 应与最终存放位置在同一文件系统，入库时可用 move_into_place 原子改名而非复制
+    不满足条件时删除临时文件并抛出 UploadRejected
+    """
+    os.makedirs(dest_dir, exist_ok=True)
+    fd, temp_path = tempfile.mkstemp(prefix=prefix, suffix=suffix, dir=dest_dir)
+    sha = hashlib.sha256()
+    file_size = 0
+    head = b""
+    try:
+        with os.fdopen(fd, "wb") as f:
+            for block in iter(lambda: stream.read(chunk_size), b""):
+                file_size += len(block)
+                if max_size is not None and file_size > max_size:
+                    raise UploadRejected(f"文件太大，不能超过{max_size // (1024 * 1024)}MB")
+                # 文件头可能跨越多个数据块，凑齐后再比较
+                if magic and len(head) < len(magic):
+                    head += block[:len(magic) - len(head)]
+                    if len(head) == len(magic) and head != magic:
+                        raise UploadRejected("文件头部不是PDF格式" if magic == PDF_MAGIC else "文件头部格式不符")
+                sha.update(block)
+                f.write(block)
+        if file_size == 0:
+            raise UploadRejected("文件为空")
+        if file_size < min_size or (magic and len(head) < len(magic)):
+            raise UploadRejected("文件大小异常")
+        os.chmod(temp_path, 0o644)  # mkstemp创建的文件仅所有者可读，入库后按普通文件权限保存
+    except BaseException:
+        try:
+            os.unlink(temp_path)
+        except OSError:
+            pass
+        raise
+    return temp_path, file_size, sha.hexdigest()
+
+
+# 将文件移动到目标位置：同一文件系统内为原子改名，跨文件系统时退化为复制后删除
+def move_into_place(src_path: str, dest_path: str):
+    try:
+        os.replace(src_path, dest_path)
+    except OSError as e:
+        if e.errno != errno.EXDEV:
+            raise
+        shutil.move(src_path, dest_path)
\ No newline at end of file
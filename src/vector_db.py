@@ -1,35 +1,421 @@
+import os
+import time
+import shutil
+import threading
 import chromadb
 from chromadb.config import Settings
+from src.flat_index import FlatCollection
+from src.metrics import metrics
+from src.snapshot import write_snapshot, SnapshotReader
+
+# 默认HNSW索引配置：余弦空间（CLIP向量未归一化，L2空间下 1-distance 不是相似度）
+DEFAULT_INDEX_CONFIG = {
+    "space": "cosine",  # cosine / ip（内积，要求向量预先归一化）/ l2
+    "M": 16,  # 每个节点的邻居数（越大召回越高、内存越大）
+    "construction_ef": 100,  # 建索引时的候选集大小
+    "search_ef": 100  # 查询时的候选集大小（越大召回越高、延迟越高）
+}
+
+
+# 索引配置 -> ChromaDB集合元数据
+def to_hnsw_metadata(index_config: dict) -> dict:
+    return {f"hnsw:{key}": value for key, value in index_config.items()}
+
+
+# 只读模式下尚不存在的集合：按空集合处理（不创建，集合由写入进程创建）
+class _MissingCollection:
+    def __init__(self, name: str):
+        self.name = name
+        self.metadata = {}
+
+    def count(self) -> int:
+        return 0
+
+    def get(self, ids: list = None, where: dict = None, limit: int = None, offset: int = None, include: list = None):
+        return {"ids": [], "embeddings": [], "metadatas": [], "documents": []}
+
+    def query(self, query_embeddings, n_results: int = 10, where: dict = None, include: list = None):
+        empty = [[] for _ in query_embeddings]
+        return {"ids": empty, "distances": empty, "metadatas": empty, "documents": empty, "embeddings": None}
+
 
 class VectorDB:
-    def __init__(self, db_path: str = "./data/chroma_db"):
+    def __init__(self, db_path: str = "./data/chroma_db", index_configs: dict = None, backends: dict = None,
+                 flat_index_path: str = "./data/flat_index", flat_dtype: str = "float32",
+                 generation_path: str = None, read_only: bool = False):
+        """
+        index_configs: 按集合名指定的索引配置，未指定的键使用 DEFAULT_INDEX_CONFIG
+                       例如 {"image_collection": {"M": 32, "search_ef": 200}}
+        backends: 按集合名指定的存储后端，"chroma"（默认，HNSW近似检索）或 "numpy"（内存映射矩阵精确检索）
+        flat_index_path / flat_dtype: numpy后端的存储目录与向量精度（float32 / float16）
+        generation_path: 每次写入后更新的代次文件（多进程服务中只读进程据此重新打开数据库，见 reopen）
+        read_only: 只读模式（多进程服务的只读进程）：不创建集合，不存在的集合按空集合处理
+        """
+        self.db_path = db_path
+        self.generation_path = generation_path
+        self.read_only = read_only
         # 初始化ChromaDB（持久化存储）
         self.client = chromadb.PersistentClient(
             path=db_path,
             settings=Settings(allow_reset=True, anonymized_telemetry=False)  # 关闭匿名统计
         )
+        self._write_lock = threading.Lock()  # 串行化写操作（多线程共享同一实例时）
+        self._versions = {}  # 集合名 -> 版本号（每次写入递增，用于查询结果缓存失效）
+        self.index_configs = index_configs or {}
+        self.backends = backends or {}
+        self.flat_index_path = flat_index_path
+        self.flat_dtype = flat_dtype
+        self._collections = {}  # 集合对象缓存
+        self._retired_client = None  # reopen 替换下的旧客户端
+
+    # 集合当前版本号
+    def collection_version(self, collection_name: str) -> int:
+        return self._versions.get(collection_name, 0)
+
+    # 写入后递增集合版本号（调用方需持有写锁）
+    def _bump_version(self, collection_name: str):
+        self._versions[collection_name] = self._versions.get(collection_name, 0) + 1
+        if self.generation_path:
+            self._write_generation()
+
+    # 原子更新代次文件（内容为写入时间，只读进程比较文件的修改时间与inode）
+    def _write_generation(self):
+        generation_dir = os.path.dirname(self.generation_path)
+        if generation_dir:
+            os.makedirs(generation_dir, exist_ok=True)
+        tmp_path = f"{self.generation_path}.tmp-{os.getpid()}"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(str(time.time_ns()))
+        os.replace(tmp_path, self.generation_path)
 
-    # 获取或创建集合
+    # 集合的索引配置（默认配置 + 按集合覆盖的配置）
+    def index_config(self, collection_name: str) -> dict:
+        return dict(DEFAULT_INDEX_CONFIG, **self.index_configs.get(collection_name, {}))
+
+    # 集合使用的存储后端
+    def backend(self, collection_name: str) -> str:
+        return self.backends.get(collection_name, "chroma")
+
+    # 获取或创建集合（新建时应用索引配置；已有集合保持原索引，配置不一致时提示迁移）
     def get_collection(self, collection_name: str):
-        return self.client.get_or_create_collection(name=collection_name)
+        collection = self._collections.get(collection_name)
+        if collection is not None:
+            return collection
+        if self.backend(collection_name) == "numpy":
+            root = os.path.join(self.flat_index_path, collection_name)
+            if self.read_only and not os.path.isfile(os.path.join(root, "meta.sqlite3")):
+                return _MissingCollection(collection_name)
+            collection = FlatCollection(
+                root,
+                name=collection_name,
+                space=self.index_config(collection_name)["space"],
+                dtype=self.flat_dtype
+            )
+            self._collections[collection_name] = collection
+            return collection
+        try:
+            collection = self.client.get_collection(name=collection_name)
+            # 注意：不能对已有集合传入新的hnsw元数据，ChromaDB会直接改写元数据而不重建索引
+            current_space = (collection.metadata or {}).get("hnsw:space", "l2")
+            if current_space != self.index_config(collection_name)["space"]:
+                print(f"提示：集合 {collection_name} 使用 {current_space} 空间，与配置不一致，"
+                      f"可运行 python main.py migrate_index --collection {collection_name} 迁移")
+        except ValueError:
+            if self.read_only:
+                return _MissingCollection(collection_name)
+            collection = self.client.get_or_create_collection(
+                name=collection_name,
+                metadata=to_hnsw_metadata(self.index_config(collection_name))
+            )
+        self._collections[collection_name] = collection
+        return collection
 
-    # 向集合添加数据（ids/embeddings为列表）
-    def add_data(self, collection_name: str, ids: list, embeddings: list, metadatas: list = None, documents: list = None):
+    # 按当前索引配置重建集合（分批复制向量、元数据与文档到新集合，再替换原集合）
+    def migrate_collection(self, collection_name: str, batch_size: int = 1000) -> str:
+        if self.backend(collection_name) == "numpy":
+            return self._migrate_to_flat(collection_name, batch_size)
+        target_metadata = to_hnsw_metadata(self.index_config(collection_name))
+        temp_name = f"{collection_name}_migrating"
+        try:
+            source = self.client.get_collection(name=collection_name)
+        except ValueError:
+            # 上次迁移在删除原集合后中断：完成改名即可
+            try:
+                self.client.get_collection(name=temp_name).modify(name=collection_name)
+                return f"成功：已恢复上次中断的迁移（{collection_name}）"
+            except ValueError:
+                return f"错误：集合 {collection_name} 不存在"
+        if source.metadata == target_metadata:
+            return f"集合 {collection_name} 已是目标索引配置，无需迁移"
+
+        with self._write_lock:
+            try:
+                self.client.delete_collection(name=temp_name)  # 清理上次中断的未完成副本（原集合仍完整）
+            except ValueError:
+                pass
+            target = self.client.create_collection(name=temp_name, metadata=target_metadata)
+            total = source.count()
+            for offset in range(0, total, batch_size):
+                batch = source.get(include=["embeddings", "metadatas", "documents"], limit=batch_size, offset=offset)
+                target.add(
+                    ids=batch["ids"],
+                    embeddings=batch["embeddings"],
+                    metadatas=batch["metadatas"],
+                    documents=batch["documents"]
+                )
+            self.client.delete_collection(name=collection_name)
+            target.modify(name=collection_name)
+            self._collections.pop(collection_name, None)
+            self._bump_version(collection_name)
+        return f"成功：集合 {collection_name} 已迁移到 {target_metadata}（{total}条向量）"
+
+    # 向集合添加数据（ids/embeddings为列表），返回是否成功
+    def add_data(self, collection_name: str, ids: list, embeddings: list, metadatas: list = None,
+                 documents: list = None) -> bool:
         try:
             collection = self.get_collection(collection_name)
-            collection.add(
-                ids=ids,
-                embeddings=embeddings,
-                metadatas=metadatas,
-                documents=documents
-            )
+            with self._write_lock, metrics.timed("vector_db_seconds", op="add", collection=collection_name):
+                collection.add(
+                    ids=ids,
+                    embeddings=embeddings,
+                    metadatas=metadatas,
+                    documents=documents
+                )
+                self._bump_version(collection_name)
+            metrics.inc("vector_db_items_total", len(ids), op="add", collection=collection_name)
+            return True
         except Exception as e:
+            metrics.inc("errors_total", stage="vector_db_add")
             print(f"向量数据库添加数据失败：{e}")
+            return False
+
+    # 插入或覆盖数据（ID已存在时更新向量与元数据），返回是否成功
+    def upsert_data(self, collection_name: str, ids: list, embeddings: list, metadatas: list = None,
+                    documents: list = None) -> bool:
+        try:
+            collection = self.get_collection(collection_name)
+            with self._write_lock, metrics.timed("vector_db_seconds", op="upsert", collection=collection_name):
+                collection.upsert(
+                    ids=ids,
+                    embeddings=embeddings,
+                    metadatas=metadatas,
+                    documents=documents
+                )
+                self._bump_version(collection_name)
+            metrics.inc("vector_db_items_total", len(ids), op="upsert", collection=collection_name)
+            return True
+        except Exception as e:
+            metrics.inc("errors_total", stage="vector_db_upsert")
+            print(f"向量数据库更新数据失败：{e}")
+            return False
+
+    # 按ID或元数据条件删除数据，返回是否成功
+    def delete_data(self, collection_name: str, ids: list = None, where: dict = None) -> bool:
+        if not ids and not where:
+            return True
+        try:
+            collection = self.get_collection(collection_name)
+            with self._write_lock, metrics.timed("vector_db_seconds", op="delete", collection=collection_name):
+                collection.delete(ids=ids or None, where=where)
+                self._bump_version(collection_name)
+            return True
+        except Exception as e:
+            metrics.inc("errors_total", stage="vector_db_delete")
+            print(f"向量数据库删除数据失败：{e}")
+            return False
 
-    # 相似向量查询（返回top N结果）
-    def query(self, collection_name: str, query_embeddings: list, n_results: int = 5):
+    # 按ID更新元数据（不改动向量），返回是否成功
+    def update_metadata(self, collection_name: str, ids: list, metadatas: list) -> bool:
+        if not ids:
+            return True
+        try:
+            collection = self.get_collection(collection_name)
+            with self._write_lock, metrics.timed("vector_db_seconds", op="update", collection=collection_name):
+                collection.update(ids=ids, metadatas=metadatas)
+                self._bump_version(collection_name)
+            metrics.inc("vector_db_items_total", len(ids), op="update", collection=collection_name)
+            return True
+        except Exception as e:
+            metrics.inc("errors_total", stage="vector_db_update")
+            print(f"向量数据库更新元数据失败：{e}")
+            return False
+
+    # 获取集合中的ID与元数据 {"ids": [...], "metadatas": [...]}（where为可选的元数据过滤条件）
+    def get_metadatas(self, collection_name: str, where: dict = None) -> dict:
         collection = self.get_collection(collection_name)
-        return collection.query(
-            query_embeddings=query_embeddings,
-            n_results=n_results
-        )
\ No newline at end of file
+        return collection.get(where=where, include=["metadatas"])
+
+    # 获取集合中的ID（where为可选的元数据过滤条件）
+    def get_ids(self, collection_name: str, where: dict = None) -> list:
+        collection = self.get_collection(collection_name)
+        return collection.get(where=where, include=[])["ids"]
+
+    # 将ChromaDB集合复制到numpy后端（原ChromaDB集合保留，确认无误后可手动删除）
+    def _migrate_to_flat(self, collection_name: str, batch_size: int) -> str:
+        target = self.get_collection(collection_name)
+        if target.count() > 0:
+            return f"集合 {collection_name} 已存在numpy后端数据，无需迁移"
+        try:
+            source = self.client.get_collection(name=collection_name)
+        except ValueError:
+            return f"集合 {collection_name} 在ChromaDB中不存在，无需迁移"
+        with self._write_lock:
+            total = source.count()
+            for offset in range(0, total, batch_size):
+                batch = source.get(include=["embeddings", "metadatas", "documents"], limit=batch_size, offset=offset)
+                target.add(
+                    ids=batch["ids"],
+                    embeddings=batch["embeddings"],
+                    metadatas=batch["metadatas"],
+                    documents=batch["documents"]
+                )
+            target.compact()
+            self._bump_version(collection_name)
+        return f"成功：集合 {collection_name} 已复制到numpy后端（{total}条向量，原ChromaDB集合保留）"
+
+    # 导出集合快照（float16向量矩阵 + ID/文档/列式元数据，见 src/snapshot.py），用于新节点冷启动与副本同步
+    def export_collection(self, collection_name: str, snapshot_dir: str, batch_size: int = 5000,
+                          overwrite: bool = False) -> str:
+        collection = self.get_collection(collection_name)
+        # 导出期间暂停本进程的写入，保证快照与某一时刻的集合一致
+        with self._write_lock:
+            total = collection.count()
+            batches = (collection.get(include=["embeddings", "metadatas", "documents"], limit=batch_size, offset=offset)
+                       for offset in range(0, total, batch_size))
+            try:
+                manifest = write_snapshot(snapshot_dir, collection_name, total, batches, info={
+                    "index_config": self.index_config(collection_name),
+                    "source_backend": self.backend(collection_name)
+                }, overwrite=overwrite)
+            except Exception as e:
+                metrics.inc("errors_total", stage="snapshot_export")
+                return f"错误：集合 {collection_name} 导出失败：{e}"
+        size_mb = sum(item["bytes"] for item in manifest["files"].values()) / (1024 * 1024)
+        return f"成功：集合 {collection_name} 已导出到 {snapshot_dir}（{total}条向量，{manifest['dim']}维，{size_mb:.1f}MB）"
+
+    # 从快照导入集合（大批量写入临时集合，完成后替换原集合；导入期间原集合仍可查询）
+    def import_collection(self, snapshot_dir: str, collection_name: str = None, batch_size: int = 20000,
+                          replace: bool = False, verify: bool = True) -> str:
+        try:
+            reader = SnapshotReader(snapshot_dir)
+        except (ValueError, OSError) as e:
+            return f"错误：{e}"
+        if verify:
+            broken = reader.verify()
+            if broken:
+                return f"错误：快照文件损坏或不完整：{', '.join(broken)}"
+        collection_name = collection_name or reader.collection_name
+        space = self.index_config(collection_name)["space"]
+        snapshot_space = reader.manifest.get("index_config", {}).get("space", space)
+        if snapshot_space != space:
+            return f"错误：快照为 {snapshot_space} 空间，与集合 {collection_name} 的配置（{space}）不一致"
+        existing = self.count(collection_name)
+        if existing > 0 and not replace:
+            return f"错误：集合 {collection_name} 已有{existing}条数据，确认覆盖请使用 --replace"
+
+        start = time.perf_counter()
+        try:
+            with self._write_lock, metrics.timed("vector_db_seconds", op="import", collection=collection_name):
+                if self.backend(collection_name) == "numpy":
+                    self._import_flat(reader, collection_name, batch_size)
+                else:
+                    self._import_chroma(reader, collection_name, batch_size)
+                self._bump_version(collection_name)
+        except Exception as e:
+            metrics.inc("errors_total", stage="snapshot_import")
+            return f"错误：集合 {collection_name} 导入失败：{e}"
+        metrics.inc("vector_db_items_total", reader.count, op="import", collection=collection_name)
+        return (f"成功：已从快照导入集合 {collection_name}（{reader.count}条向量，"
+                f"耗时{time.perf_counter() - start:.1f}s）")
+
+    # 导入到ChromaDB：写入临时集合后删除原集合并改名（与 migrate_collection 相同的替换方式）
+    def _import_chroma(self, reader: SnapshotReader, collection_name: str, batch_size: int):
+        temp_name = f"{collection_name}_importing"
+        try:
+            self.client.delete_collection(name=temp_name)
+        except ValueError:
+            pass
+        target = self.client.create_collection(name=temp_name,
+                                               metadata=to_hnsw_metadata(self.index_config(collection_name)))
+        batch_size = min(batch_size, getattr(self.client, "max_batch_size", batch_size))
+        for batch in reader.iter_batches(batch_size):
+            target.add(
+                ids=batch["ids"],
+                embeddings=batch["embeddings"].tolist(),
+                metadatas=batch["metadatas"] if any(batch["metadatas"]) else None,
+                documents=batch["documents"]
+            )
+        self._collections.pop(collection_name, None)
+        try:
+            self.client.delete_collection(name=collection_name)
+        except ValueError:
+            pass
+        target.modify(name=collection_name)
+
+    # 导入到numpy后端：在临时目录中按大批量写入向量段并合并，完成后替换原目录
+    def _import_flat(self, reader: SnapshotReader, collection_name: str, batch_size: int):
+        root = os.path.join(self.flat_index_path, collection_name)
+        temp_root = f"{root}_importing"
+        shutil.rmtree(temp_root, ignore_errors=True)
+        # 导入过程中不自动合并（每批一个段），全部写入后只合并一次
+        target = FlatCollection(temp_root, name=collection_name, space=self.index_config(collection_name)["space"],
+                                dtype=self.flat_dtype, max_segments=reader.count // batch_size + 1)
+        for batch in reader.iter_batches(batch_size):
+            target.add(ids=batch["ids"], embeddings=batch["embeddings"], metadatas=batch["metadatas"],
+                       documents=batch["documents"])
+        if reader.count > batch_size:
+            target.compact()
+        target.close()
+        collection = self._collections.pop(collection_name, None)
+        if collection is not None:
+            collection.close()
+        shutil.rmtree(root, ignore_errors=True)
+        os.replace(temp_root, root)
+
+    # 集合中的向量数量
+    def count(self, collection_name: str) -> int:
+        return self.get_collection(collection_name).count()
+
+    # 相似向量查询（返回top N结果；where为可选的元数据过滤条件，如 {"paper_id": {"$in": [...]}}）
+    def query(self, collection_name: str, query_embeddings: list, n_results: int = 5, where: dict = None):
+        collection = self.get_collection(collection_name)
+        with metrics.timed("vector_db_seconds", op="query", collection=collection_name):
+            results = collection.query(
+                query_embeddings=query_embeddings,
+                n_results=n_results,
+                where=where
+            )
+        metrics.inc("vector_db_items_total", len(query_embeddings), op="query", collection=collection_name)
+        return results
+
+    # 重新打开ChromaDB客户端（读取其他进程写入的数据）；所有集合版本号递增，使查询结果缓存失效
+    # 旧客户端延后到下次重新打开时再停止，避免中断正在进行的查询；numpy后端的集合按磁盘上的代次自动重新加载
+    def reopen(self):
+        with self._write_lock:
+            self.client.clear_system_cache()
+            client = chromadb.PersistentClient(
+                path=self.db_path,
+                settings=Settings(allow_reset=True, anonymized_telemetry=False)
+            )
+            if self._retired_client is not None:
+                self._retired_client._system.stop()
+            self._retired_client, self.client = self.client, client
+            for collection_name in set(self._versions) | set(self._collections):
+                self._versions[collection_name] = self._versions.get(collection_name, 0) + 1
+            self._collections = {name: collection for name, collection in self._collections.items()
+                                 if isinstance(collection, FlatCollection)}
+
+    # 关闭数据库（停止ChromaDB后台组件，确保索引落盘）
+    def close(self):
+        try:
+            with self._write_lock:
+                for collection in self._collections.values():
+                    if isinstance(collection, FlatCollection):
+                        collection.close()
+                self._collections.clear()
+                if self._retired_client is not None:
+                    self._retired_client._system.stop()
+                self.client._system.stop()
+                self.client.clear_system_cache()
+        except Exception as e:
+            print(f"向量数据库关闭失败：{e}")
\ No newline at end of file
@@ -0,0 +1,25 @@
+import os
+import sys
+import pytest
+
+# 直接运行 pytest 时也能导入 src 与 benchmarks
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.fake_embedder import FakeEmbeddingModels  # noqa: E402
+from benchmarks.synthetic import make_corpus  # noqa: E402
+from src.services import ServiceContainer  # noqa: E402
+
+
+# 服务容器：伪嵌入器（不需要模型权重），每个测试在独立的临时目录中运行（数据位于 ./data）
+@pytest.fixture
+def services(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    container = ServiceContainer(embedding_model=FakeEmbeddingModels())
+    yield container
+    container.close()
+
+
+# 合成的论文PDF（位于论文目录之外，内容互不相同）
+@pytest.fixture
+def papers(tmp_path):
+    return [path for path, _ in make_corpus(str(tmp_path / "incoming"), 3, max_pages=2)]
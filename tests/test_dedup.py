@@ -0,0 +1,73 @@
+import os
+import shutil
+import threading
+
+TOPICS = ["CV", "NLP"]
+
+
+def library_files(paper_root: str) -> list:
+    return sorted(os.path.join(root, name) for root, _, names in os.walk(paper_root) for name in names
+                  if name.endswith(".pdf"))
+
+
+# 内容相同的文件（不同文件名）只入库一次，重复提交时为已有论文添加标签
+def test_duplicate_content_is_stored_once(services, papers, tmp_path):
+    dm = services.document_manager
+    assert dm.add_paper(papers[0], TOPICS).startswith("成功：论文已分类")
+    chunk_count = dm.vector_db.count(dm.collection_name)
+
+    copy_path = str(tmp_path / "renamed_copy.pdf")
+    shutil.copy(papers[0], copy_path)
+    result = dm.add_paper(copy_path, TOPICS, tag="survey")
+    assert result.startswith("成功：论文已存在")
+    assert "survey" in result
+
+    assert len(dm.registry.entries()) == 1
+    assert dm.registry.entries()[0]["tags"] == ["survey"]
+    assert dm.vector_db.count(dm.collection_name) == chunk_count
+    assert len(library_files(dm.paper_root)) == 1
+
+
+# 同一文件并发入库：库锁内重新检查登记，只保留一份
+def test_concurrent_duplicate_adds(services, papers):
+    dm = services.document_manager
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(dm.add_paper(papers[0], TOPICS))) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len([result for result in results if result.startswith("成功：论文已分类")]) == 1
+    assert len(dm.registry.entries()) == 1
+    assert len(library_files(dm.paper_root)) == 1
+
+
+# 向量库写入失败：不登记、不留下片段/关键词索引/库文件，原文件保留；恢复后可正常入库
+def test_failed_vector_write_is_not_registered(services, papers, monkeypatch):
+    dm = services.document_manager
+    monkeypatch.setattr(dm.vector_db, "upsert_data", lambda *args, **kwargs: False)
+    result = dm.add_paper(papers[0], TOPICS)
+    assert result.startswith("错误") and "写入向量数据库失败" in result
+
+    assert dm.registry.entries() == []
+    assert dm.vector_db.count(dm.collection_name) == 0
+    assert dm.search_paper("model", 5, mode="keyword") == []
+    assert library_files(dm.paper_root) == []
+    assert os.path.isfile(papers[0])
+
+    monkeypatch.delattr(dm.vector_db, "upsert_data")  # 恢复类方法（不能用undo()：会一并撤销切换的工作目录）
+    assert dm.add_paper(papers[0], TOPICS).startswith("成功：论文已分类")
+    assert len(dm.registry.entries()) == 1
+
+
+# 暂存文件（move=True）写入失败时放回原位，论文目录中不留下文件
+def test_failed_move_restores_staged_file(services, papers, tmp_path, monkeypatch):
+    dm = services.document_manager
+    staged = str(tmp_path / "staged.pdf")
+    shutil.copy(papers[1], staged)
+    monkeypatch.setattr(dm.vector_db, "add_data", lambda *args, **kwargs: False)
+    assert dm.add_paper(staged, TOPICS, move=True).startswith("错误")
+    assert os.path.isfile(staged)
+    assert library_files(dm.paper_root) == []
+    assert dm.registry.entries() == []
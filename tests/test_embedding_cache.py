@@ -0,0 +1,39 @@
+import itertools
+import numpy as np
+from src import embedding_cache
+from src.embedding_cache import EmbeddingCache
+
+
+# 超过容量时按最近使用时间淘汰到上限的90%，最近读取过的项保留
+def test_eviction_keeps_recently_used(tmp_path, monkeypatch):
+    clock = itertools.count(1000)
+    monkeypatch.setattr(embedding_cache.time, "time", lambda: next(clock))
+    vector = np.ones(64, dtype=np.float32)  # float16存储，每项128字节
+    cache = EmbeddingCache(str(tmp_path / "cache.sqlite3"), max_bytes=128 * 10)
+    for i in range(10):
+        cache.put_many("model", "rev", [(f"d{i}", vector)])
+    assert set(cache.get_many("model", "rev", ["d0"])) == {"d0"}  # 刷新d0的最近使用时间
+
+    cache.put_many("model", "rev", [("d10", vector)])
+    stats = cache.stats()
+    assert stats["bytes"] <= 128 * 10 * 0.9
+    assert stats["evictions"] == 2
+    assert set(cache.get_many("model", "rev", [f"d{i}" for i in range(11)])) == \
+        {"d0", "d10"} | {f"d{i}" for i in range(3, 10)}
+    cache.close()
+
+
+# 只读模式：可读取写入进程的数据，不写入、不刷新；数据库尚不存在时按空缓存处理
+def test_read_only(tmp_path):
+    db_path = str(tmp_path / "cache.sqlite3")
+    reader = EmbeddingCache(db_path, read_only=True)
+    assert reader.get_many("model", "rev", ["d0"]) == {}
+
+    writer = EmbeddingCache(db_path)
+    writer.put_many("model", "rev", [("d0", np.arange(4, dtype=np.float32))])
+    assert np.allclose(reader.get_many("model", "rev", ["d0"])["d0"], np.arange(4))
+    reader.put_many("model", "rev", [("d1", np.zeros(4, dtype=np.float32))])
+    assert writer.get_many("model", "rev", ["d1"]) == {}
+    assert reader.stats()["entries"] == 1
+    reader.close()
+    writer.close()
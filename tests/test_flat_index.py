@@ -0,0 +1,49 @@
+import numpy as np
+from src.flat_index import FlatCollection
+
+
+def unit_vectors(count: int, dim: int = 8, seed: int = 0) -> np.ndarray:
+    vectors = np.random.default_rng(seed).normal(size=(count, dim)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+# 精确检索：每个向量的最近邻是其自身
+def test_add_and_query(tmp_path):
+    collection = FlatCollection(str(tmp_path / "flat"))
+    vectors = unit_vectors(20)
+    ids = [f"id{i}" for i in range(20)]
+    collection.add(ids, vectors.tolist(), metadatas=[{"n": i} for i in range(20)], documents=ids)
+    assert collection.count() == 20
+
+    results = collection.query(vectors[:5].tolist(), n_results=3)
+    assert [row[0] for row in results["ids"]] == ids[:5]
+    assert all(abs(row[0]) < 1e-5 for row in results["distances"])
+    assert collection.query(vectors[:1].tolist(), n_results=3, where={"n": 7})["ids"] == [["id7"]]
+    collection.close()
+
+
+# 删除后不再返回；合并段后数据不变，重新打开后仍一致
+def test_delete_and_compact(tmp_path):
+    root = str(tmp_path / "flat")
+    collection = FlatCollection(root)
+    vectors = unit_vectors(30)
+    ids = [f"id{i}" for i in range(30)]
+    for start in range(0, 30, 10):  # 三次写入，生成三个段
+        collection.add(ids[start:start + 10], vectors[start:start + 10].tolist(),
+                       metadatas=[{"n": i} for i in range(start, start + 10)])
+    collection.delete(ids=["id3", "id15"])
+    collection.delete(where={"n": 27})
+    remaining = [i for i in ids if i not in ("id3", "id15", "id27")]
+    assert collection.count() == 27
+    assert "id3" not in collection.query(vectors[3:4].tolist(), n_results=30)["ids"][0]
+
+    before = collection.query(vectors.tolist(), n_results=5)
+    collection.compact()
+    assert collection.query(vectors.tolist(), n_results=5)["ids"] == before["ids"]
+    assert collection.get()["ids"] == remaining
+    collection.close()
+
+    reopened = FlatCollection(root)
+    assert reopened.get()["ids"] == remaining
+    assert reopened.query(vectors.tolist(), n_results=5)["ids"] == before["ids"]
+    reopened.close()
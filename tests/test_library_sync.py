@@ -0,0 +1,64 @@
+import os
+import shutil
+
+TOPICS = ["CV", "NLP"]
+
+
+def chunk_metadatas(dm, path: str) -> list:
+    return dm.vector_db.get_metadatas(dm.collection_name, where={"path": path})["metadatas"]
+
+
+# 入库后首次同步：已登记的文件记入清单，不重复索引
+def test_sync_after_add_is_unchanged(services, papers):
+    dm = services.document_manager
+    for path in papers:
+        dm.add_paper(path, TOPICS)
+    stats = services.library_sync.sync()
+    assert stats["unchanged"] == len(papers)
+    assert stats["added"] == stats["moved"] == stats["removed"] == 0
+
+
+# 在分类目录间移动论文：只改写元数据（路径与分类），不重新嵌入
+def test_sync_move_rewrites_metadata(services, papers):
+    dm = services.document_manager
+    dm.add_paper(papers[0], TOPICS)
+    services.library_sync.sync()
+    old_path = dm.registry.entries()[0]["path"]
+    chunk_count = dm.vector_db.count(dm.collection_name)
+
+    new_path = os.path.join(dm.paper_root, "Robotics", "moved.pdf")
+    os.makedirs(os.path.dirname(new_path))
+    shutil.move(old_path, new_path)
+    stats = services.library_sync.sync()
+
+    assert stats["moved"] == 1 and stats["added"] == 0 and stats["removed"] == 0
+    assert dm.vector_db.count(dm.collection_name) == chunk_count
+    assert chunk_metadatas(dm, old_path) == []
+    metadatas = chunk_metadatas(dm, new_path)
+    assert len(metadatas) == chunk_count
+    assert {meta["topic"] for meta in metadatas} == {"Robotics"}
+    assert dm.registry.entries()[0]["path"] == new_path
+
+
+# 删除论文文件：同步时删除其片段与登记；放入新文件：按所在目录分类并索引
+def test_sync_delete_and_add(services, papers):
+    dm = services.document_manager
+    dm.add_paper(papers[0], TOPICS)
+    dm.add_paper(papers[1], TOPICS)
+    services.library_sync.sync()
+    removed_path = dm.registry.entries()[0]["path"]
+
+    os.remove(removed_path)
+    new_path = os.path.join(dm.paper_root, "NLP", "dropped_in.pdf")
+    os.makedirs(os.path.dirname(new_path), exist_ok=True)
+    shutil.copy(papers[2], new_path)
+    stats = services.library_sync.sync()
+
+    assert stats["removed"] == 1 and stats["added"] == 1
+    assert chunk_metadatas(dm, removed_path) == []
+    assert removed_path not in {entry["path"] for entry in dm.registry.entries()}
+    assert {meta["topic"] for meta in chunk_metadatas(dm, new_path)} == {"NLP"}
+
+    # 再次同步没有变化
+    stats = services.library_sync.sync()
+    assert stats["unchanged"] == 2 and stats["added"] == stats["removed"] == 0
@@ -0,0 +1,50 @@
+import numpy as np
+from src.vector_db import VectorDB
+
+TOPICS = ["CV", "NLP"]
+
+
+# 导出 → 导入（ChromaDB与numpy后端）：ID、元数据、文档与检索结果一致
+def test_snapshot_round_trip(services, papers, tmp_path):
+    dm = services.document_manager
+    for path in papers:
+        dm.add_paper(path, TOPICS)
+    source = services.vector_db
+    original = source.get_collection(dm.collection_name).get(include=["metadatas", "documents", "embeddings"])
+    queries = np.asarray(original["embeddings"][:3]).tolist()
+    expected = source.query(dm.collection_name, queries, n_results=3)
+    snapshot_dir = str(tmp_path / "snapshot" / dm.collection_name)
+    assert source.export_collection(dm.collection_name, snapshot_dir).startswith("成功")
+
+    replicas = [
+        VectorDB(str(tmp_path / "replica_chroma")),
+        VectorDB(str(tmp_path / "replica_numpy"), backends={dm.collection_name: "numpy"},
+                 flat_index_path=str(tmp_path / "replica_flat"), flat_dtype="float16")
+    ]
+    for replica in replicas:
+        assert replica.import_collection(snapshot_dir).startswith("成功")
+        got = replica.get_collection(dm.collection_name).get(ids=original["ids"], include=["metadatas", "documents"])
+        by_id = dict(zip(got["ids"], zip(got["metadatas"], got["documents"])))
+        assert by_id == dict(zip(original["ids"], zip(original["metadatas"], original["documents"])))
+        assert replica.query(dm.collection_name, queries, n_results=3)["ids"] == expected["ids"]
+        # 已有数据时需确认覆盖
+        assert replica.import_collection(snapshot_dir).startswith("错误")
+        assert replica.import_collection(snapshot_dir, replace=True).startswith("成功")
+        assert replica.count(dm.collection_name) == len(original["ids"])
+        replica.close()
+
+
+# 快照文件损坏时拒绝导入
+def test_snapshot_checksum_mismatch(services, tmp_path):
+    source = services.vector_db
+    source.add_data("misc_collection", ids=["a", "b"], embeddings=[[1.0, 0.0], [0.0, 1.0]],
+                    metadatas=[{"x": 1}, {"x": 2}], documents=["d1", "d2"])
+    snapshot_dir = str(tmp_path / "snapshot")
+    assert source.export_collection("misc_collection", snapshot_dir).startswith("成功")
+    with open(str(tmp_path / "snapshot" / "ids.bin"), "ab") as f:
+        f.write(b"x")
+
+    replica = VectorDB(str(tmp_path / "replica"))
+    assert replica.import_collection(snapshot_dir).startswith("错误")
+    assert replica.count("misc_collection") == 0
+    replica.close()